@@ -0,0 +1 @@
+"""Performance benchmarks for smathpy; see :mod:`benchmarks.suite`."""
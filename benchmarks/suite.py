@@ -0,0 +1,454 @@
+"""Timing benchmarks for expression building, serialization and saving.
+
+Each case is timed as the best of a few runs, in several rounds:
+
+* ``example/<name>/build``, ``/serialize``, ``/save`` — the worksheet of
+  each example generator in ``examples/``: running its ``main()`` (with
+  ``Worksheet.save`` intercepted), ``to_xml_string()`` and ``save()``;
+* ``synthetic/<n>/build``, ``/serialize``, ``/save`` — a worksheet of *n*
+  regions (text, assignments, function definitions, results), for *n*
+  from 10² to 10⁵;
+* ``expr/chain/<n>`` — one expression of *n* terms composed with ``+``;
+* ``layout/flow/<n>`` — reflowing *n* narrow regions, a few of them wide,
+  into a :class:`~smathpy.layout.FlowLayout` grid (its column search is
+  O(n·k) for *k* regions fitting in a row).
+
+With ``memory=True`` (``--memory``), each worksheet is also built and
+saved once under :func:`smathpy.memory.measure`, and its memory report
+(peaks, bytes per ``<e>`` element, region types, top allocators) is
+stored under ``"memory"``. Memory is reported, not compared.
+
+Each case is followed by a pure-Python calibration loop, and its time is
+divided by that calibration. The rounds (five by default) are spread over
+the whole run, and a case reports the median of its ratios, scaled back
+to seconds by the median calibration. A machine that slows down for a
+while, because of other work or CPU throttling, then moves neither the
+calibration nor the result, and a baseline recorded on another machine
+stays usable.
+
+Results are written as JSON and compared with a stored baseline; a case
+is a regression when it is slower than the baseline by more than the
+threshold (50 % by default: on shared machines medians still vary by up
+to a third between runs). Cases under a millisecond are not compared, nor
+saves under ten milliseconds, whose time is mostly file-system latency::
+
+    python -m benchmarks --output results.json          # compare with baseline.json
+    python -m benchmarks --sizes 100 1000 --threshold 0.25 --rounds 9
+    python -m benchmarks --save-baseline                # record a new baseline
+
+The exit status is 1 when any case regressed. The same suite runs under
+pytest with ``pytest -m benchmark``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from smathpy import MathRegion, TextRegion, Worksheet, assign, var
+from smathpy.expression import call, func_assign
+from smathpy.layout import FlowLayout
+from smathpy.memory import measure as measure_memory
+
+ROOT = Path(__file__).resolve().parent.parent
+EXAMPLES_DIR = ROOT / "examples"
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+EXAMPLES = (
+    "generate_beam",
+    "generate_gcd",
+    "generate_simpson",
+    "viga_ha_aci318",
+    "columna_interaccion",
+)
+SIZES = (100, 1_000, 10_000, 100_000)
+CHAIN_SIZES = (100, 1_000)  # composition is quadratic; larger chains take seconds
+FLOW_SIZES = (1_000, 10_000)
+
+DEFAULT_REPEATS = 5
+DEFAULT_ROUNDS = 5
+DEFAULT_THRESHOLD = 0.5  # 50 % slower than the baseline
+# Cases faster than this are too noisy to compare
+MIN_SECONDS = 1e-3
+# Faster saves vary with the file system more than with the code
+SAVE_MIN_SECONDS = 1e-2
+# Repeat fast cases until their runs add up to this, slow ones until the budget
+MIN_TIME = 0.2
+TIME_BUDGET = 2.0
+
+FORMAT_VERSION = 1
+
+
+@dataclass
+class Regression:
+    """A case slower than its baseline by more than the threshold."""
+
+    name: str
+    baseline: float  # seconds, scaled to this run's calibration
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+
+# ---------------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------------
+
+def measure(fn: Callable[[], Any], repeats: int = DEFAULT_REPEATS,
+            min_time: float = MIN_TIME, budget: float = TIME_BUDGET) -> float:
+    """Best time of calls of *fn*, with the garbage collector off (as :mod:`timeit`).
+
+    *fn* runs at least *repeats* times, and more while the runs add up to
+    less than *min_time*; it stops repeating once they exceed *budget*.
+    """
+    best = float("inf")
+    spent = 0.0
+    count = 0
+    enabled = gc.isenabled()
+    gc.collect()
+    try:
+        while count < max(repeats, 1) or spent < min_time:
+            gc.disable()
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            if enabled:
+                gc.enable()
+            best = min(best, elapsed)
+            spent += elapsed
+            count += 1
+            if spent >= budget:
+                break
+    finally:
+        if enabled:
+            gc.enable()
+    return best
+
+
+def _calibration_work() -> None:
+    # Dict, list and string work, the kind serialization does
+    rows = [{"id": str(i), "value": i * 0.5} for i in range(20_000)]
+    rows.sort(key=lambda r: r["id"])
+    "".join(r["id"] for r in rows)
+
+
+def calibrate(repeats: int = DEFAULT_REPEATS) -> float:
+    """Time of a fixed pure-Python workload, the unit runs are normalized by."""
+    return measure(_calibration_work, repeats)
+
+
+# ---------------------------------------------------------------------------
+# Cases
+# ---------------------------------------------------------------------------
+
+def load_example(name: str) -> ModuleType:
+    """Import ``examples/<name>.py`` without running its ``main()``."""
+    path = EXAMPLES_DIR / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(f"_benchmark_{name}", path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"cannot load example {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def _intercepted_saves() -> Iterator[list[Worksheet]]:
+    """Collect the worksheets passed to ``Worksheet.save`` instead of writing them."""
+    saved: list[Worksheet] = []
+    original = Worksheet.save
+
+    def save(self: Worksheet, path: str, cache: Any = None) -> None:
+        saved.append(self)
+
+    Worksheet.save = save  # type: ignore[method-assign]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield saved
+    finally:
+        Worksheet.save = original  # type: ignore[method-assign]
+
+
+def build_example(module: ModuleType) -> Worksheet:
+    """Run an example's ``main()`` and return the worksheet it saves."""
+    with _intercepted_saves() as saved:
+        module.main()
+    if not saved:
+        raise RuntimeError(f"{module.__name__}.main() saved no worksheet")
+    return saved[-1]
+
+
+def synthetic_worksheet(n: int) -> Worksheet:
+    """A worksheet of *n* top-level regions, in blocks of ten.
+
+    Each block has a section heading, seven assignments of growing
+    expressions, a function definition and a displayed result.
+    """
+    ws = Worksheet(title=f"Synthetic worksheet ({n} regions)")
+    for i in range(n):
+        k = i % 10
+        if k == 0:
+            ws.add(TextRegion.section(f"Block {i // 10}"))
+        elif k == 1:
+            ws.add(MathRegion.assignment(f"x{i}", i, unit_name="m"))
+        elif k == 8:
+            ws.add(MathRegion(expr=func_assign(f"f{i}", ["t"], var("t") ** 2 / var(f"x{i - 1}"))))
+        elif k == 9:
+            ws.add(MathRegion.evaluation(f"x{i - 2}", contract_unit="m"))
+        else:
+            prev = var(f"x{i - 1}")
+            ws.add(MathRegion(expr=assign(
+                f"x{i}", prev * k + call("sqrt", prev * prev + k) / (i + 1),
+            )))
+    return ws
+
+
+def expression_chain(n: int) -> Any:
+    """``x0 + 1·x1 + 2·x2 + …`` composed one term at a time."""
+    expr = var("x0")
+    for i in range(1, n):
+        expr = expr + var(f"x{i}") * i
+    return expr
+
+
+def flow_worksheet(n: int, width: int = 2000) -> Worksheet:
+    """A worksheet of *n* short texts flowing in columns *width* pixels wide.
+
+    About one text in fifty, at random but the same in every run, is ten
+    times wider. Many columns fit in the first row, but most column counts
+    put a wide text in too many columns, so the search tries them all.
+    """
+    rng = random.Random(n)
+    ws = Worksheet(layout=FlowLayout(width, column_gap=0, max_item_width=width))
+    for _ in range(n):
+        ws.add(TextRegion(text="w" * (40 if rng.random() < 0.02 else rng.randint(1, 3))))
+    return ws
+
+
+def _time_worksheet(results: dict[str, dict[str, Any]], prefix: str,
+                    build: Callable[[], Worksheet], repeats: int, directory: str) -> None:
+    ws = build()
+    xml = ws.to_xml_string()
+    path = os.path.join(directory, "benchmark.sm")
+    info = {"regions": len(ws.regions), "bytes": len(xml.encode("utf-8"))}
+    for phase, fn in (
+        ("build", build),
+        ("serialize", ws.to_xml_string),
+        ("save", lambda: ws.save(path)),
+    ):
+        results[f"{prefix}/{phase}"] = {**_time_case(fn, repeats), **info}
+
+
+def _trace_worksheet(build: Callable[[], Worksheet], directory: str) -> dict[str, Any]:
+    path = os.path.join(directory, "memory.sm")
+    return measure_memory(build, lambda ws: ws.save(path)).as_dict()
+
+
+def _time_case(fn: Callable[[], Any], repeats: int) -> dict[str, float]:
+    """Time *fn*, and the calibration loop right after it."""
+    return {"seconds": measure(fn, repeats), "calibration": calibrate(repeats)}
+
+
+def _time_round(cases: list[tuple[str, Callable[[], Worksheet]]], chain_sizes: Iterable[int],
+                flows: list[Worksheet], repeats: int, directory: str,
+                progress: Callable[[str], Any] | None) -> dict[str, dict[str, Any]]:
+    """Time every case once, each with its calibration."""
+    results: dict[str, dict[str, Any]] = {}
+    for prefix, build in cases:
+        if progress:
+            progress(prefix)
+        _time_worksheet(results, prefix, build, repeats, directory)
+    for n in chain_sizes:
+        if progress:
+            progress(f"expr/chain/{n}")
+        results[f"expr/chain/{n}"] = {
+            **_time_case(lambda n=n: expression_chain(n), repeats), "terms": n,
+        }
+    for ws in flows:
+        name = f"layout/flow/{len(ws.regions)}"
+        if progress:
+            progress(name)
+        results[name] = {**_time_case(ws.reflow, repeats), "regions": len(ws.regions)}
+    return results
+
+
+def run(examples: Iterable[str] = EXAMPLES, sizes: Iterable[int] = SIZES,
+        chain_sizes: Iterable[int] = CHAIN_SIZES, repeats: int = DEFAULT_REPEATS,
+        progress: Callable[[str], Any] | None = None,
+        memory: bool = False, rounds: int = DEFAULT_ROUNDS,
+        flow_sizes: Iterable[int] = FLOW_SIZES) -> dict[str, Any]:
+    """Time every case and return the results document (JSON-serializable)."""
+    cases: list[tuple[str, Callable[[], Worksheet]]] = []
+    for name in examples:
+        module = load_example(name)
+        cases.append((f"example/{name}", lambda m=module: build_example(m)))
+    for n in sizes:
+        cases.append((f"synthetic/{n}", lambda n=n: synthetic_worksheet(n)))
+    chain_sizes = list(chain_sizes)
+    flows = [flow_worksheet(n) for n in flow_sizes]
+    measured: list[dict[str, dict[str, Any]]] = []
+    traces: dict[str, dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(max(rounds, 1)):
+            if progress and rounds > 1:
+                progress(f"round {i + 1} of {rounds}")
+            measured.append(_time_round(cases, chain_sizes, flows, repeats, directory, progress))
+        if memory:
+            for prefix, build in cases:
+                traces[prefix] = _trace_worksheet(build, directory)
+    calibrations = [r["calibration"] for rnd in measured for r in rnd.values()]
+    calibration = statistics.median(calibrations or [calibrate(repeats)])
+    results = {}
+    for name, result in measured[0].items():
+        ratios = [rnd[name]["seconds"] / rnd[name]["calibration"] for rnd in measured]
+        results[name] = {
+            **{k: v for k, v in result.items() if k != "calibration"},
+            "seconds": statistics.median(ratios) * calibration,
+            "rounds": [rnd[name]["seconds"] for rnd in measured],
+        }
+    document = {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "calibration": calibration,
+        "results": results,
+    }
+    if memory:
+        document["memory"] = traces
+    return document
+
+
+# ---------------------------------------------------------------------------
+# Baselines
+# ---------------------------------------------------------------------------
+
+def load(path: str | os.PathLike[str]) -> dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump(document: dict[str, Any], path: str | os.PathLike[str]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD,
+            min_seconds: float = MIN_SECONDS,
+            save_min_seconds: float = SAVE_MIN_SECONDS) -> list[Regression]:
+    """Cases of *current* slower than in *baseline* by more than *threshold*.
+
+    Baseline times are scaled by the ratio of the two calibrations. Cases
+    missing from either side, or faster than *min_seconds* in both
+    (*save_min_seconds* for ``/save`` cases), are not compared.
+    """
+    scale = current["calibration"] / baseline["calibration"]
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        expected = base["seconds"] * scale
+        actual = result["seconds"]
+        floor = save_min_seconds if name.endswith("/save") else min_seconds
+        if max(expected, actual) < floor:
+            continue
+        if actual > expected * (1.0 + threshold):
+            regressions.append(Regression(name, expected, actual))
+    return regressions
+
+
+def format_results(current: dict[str, Any], baseline: dict[str, Any] | None = None) -> str:
+    """A plain-text table of the cases, with the change against *baseline*."""
+    scale = current["calibration"] / baseline["calibration"] if baseline else 1.0
+    lines = [f"{'case':<40} {'ms':>10} {'baseline':>10} {'change':>8}"]
+    for name, result in current["results"].items():
+        ms = result["seconds"] * 1000
+        base = baseline["results"].get(name) if baseline else None
+        if base is None:
+            lines.append(f"{name:<40} {ms:>10.2f}")
+            continue
+        expected = base["seconds"] * scale * 1000
+        change = 100 * (ms / expected - 1) if expected else 0.0
+        lines.append(f"{name:<40} {ms:>10.2f} {expected:>10.2f} {change:>+7.1f}%")
+    return "\n".join(lines)
+
+
+def format_memory(current: dict[str, Any]) -> str:
+    """A plain-text table of peak memory and bytes per element of each case."""
+    lines = [f"{'case':<32} {'build KiB':>10} {'B/element':>10} {'save KiB':>10} {'B/element':>10}"]
+    for name, trace in current.get("memory", {}).items():
+        cells = []
+        for phase in ("construction", "serialization"):
+            per = trace[phase]["bytes_per_element"]
+            cells.append(f"{trace[phase]['peak'] / 1024:>10.1f} "
+                         f"{'' if per is None else f'{per:.1f}':>10}")
+        lines.append(f"{name:<32} {' '.join(cells)}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the suite, print a table and compare with the baseline."""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(SIZES),
+                        help="synthetic worksheet sizes (regions)")
+    parser.add_argument("--examples", nargs="*", default=list(EXAMPLES))
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="rounds over all cases; each case reports the median")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown as a fraction (default %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--memory", action="store_true",
+                        help="also trace the memory of each worksheet (slow)")
+    args = parser.parse_args(argv)
+
+    def progress(name: str) -> None:
+        print(f"  {name}", file=sys.stderr)
+
+    current = run(args.examples, args.sizes, repeats=args.repeats, progress=progress,
+                  memory=args.memory, rounds=args.rounds)
+    if args.output:
+        dump(current, args.output)
+    if args.memory:
+        print(format_memory(current))
+        print()
+    if args.save_baseline:
+        dump(current, args.baseline)
+        print(format_results(current))
+        return 0
+    baseline = load(args.baseline) if os.path.exists(args.baseline) else None
+    print(format_results(current, baseline))
+    if baseline is None:
+        return 0
+    regressions = compare(current, baseline, args.threshold)
+    for r in regressions:
+        print(f"REGRESSION {r.name}: {r.current * 1000:.2f} ms, "
+              f"{100 * (r.ratio - 1):.0f}% slower than the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -219,7 +219,7 @@ ws.add(TextRegion.section("5. Assignments & Definitions"))
 # assign (name := value)
 ws.add(MathRegion.expression(assign("L", num(10))))
 
-# define (name ≡ value)  — for symbolic equivalences
+# define (name ≡ value)  — a boolean equation; it does not assign name
 ws.add(MathRegion.expression(define("σ.max", var("F") / var("A"))))
 
 # func_assign — define a user function  f(x) := body
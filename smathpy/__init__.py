@@ -2,9 +2,11 @@
 
 __version__ = "0.1.0"
 
+from .cache import OutputCache, PictureCache
 from .document import Worksheet
 from .regions import (
     AreaRegion,
+    FragmentRegion,
     MathRegion,
     PictureRegion,
     PlotRegion,
@@ -30,9 +32,10 @@ from .expression import (
 
 __all__ = [
     # Core
-    "Worksheet",
+    "Worksheet", "OutputCache", "PictureCache",
     # Regions
     "Region", "TextRegion", "MathRegion", "PlotRegion", "PictureRegion", "AreaRegion",
+    "FragmentRegion",
     # Settings
     "Settings", "Metadata", "PageModel", "Assembly",
     # Expression
@@ -0,0 +1,302 @@
+"""Content hashing and on-disk output cache for worksheets.
+
+A worksheet model is hashed by walking its settings and regions, so two
+worksheets that would serialize to the same ``.sm`` file share a digest.
+The digest drives two features:
+
+* deterministic document ids (``Settings.deterministic_id``), so unchanged
+  inputs produce byte-identical files;
+* :class:`OutputCache`, which lets ``Worksheet.save`` skip writing, or
+  hard-link a previously written file, when the output would be identical.
+
+:class:`PictureCache` applies the same idea to embedded images: payloads
+are keyed by a hash of the image bytes, so a logo used in a thousand
+worksheets is read and base64-encoded once.
+
+Usage::
+
+    cache = OutputCache(".smcache")
+    ws = Worksheet(settings=Settings(deterministic_id=True))
+    ...
+    ws.save("out/beam.sm", cache=cache)
+
+    pictures = PictureCache(directory=".smcache/pictures")
+    ws.add(PictureRegion.from_file("logo.png", cache=pictures))
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from . import __version__
+from .constants import APP_VERSION
+from .expression.builder import Expr
+from .expression.elements import Element
+from .regions.picture_region import PictureRegion
+
+if TYPE_CHECKING:
+    from .document import Worksheet
+    from .regions.base import Region
+
+# Namespace for doc ids derived from content digests (uuid5)
+DOC_ID_NAMESPACE = uuid.UUID("6f1c3a52-8d0e-4b7a-9c2e-5d4f3b1a0e97")
+
+# Fields that are assigned during serialization and never affect the output;
+# other fields opt out with ``field(metadata={"hash": False})``
+_SKIPPED_FIELDS = {"id", "terminator_id", "terminator_top"}
+
+
+def _feed(h: Any, value: Any) -> None:
+    """Feed a model value into a running hash."""
+    if isinstance(value, Element):
+        h.update(
+            f"E{value.type}\x1f{value.value}\x1f{value.args}\x1f"
+            f"{value.style}\x1f{value.preserve}\x1e".encode()
+        )
+    elif isinstance(value, Expr):
+        h.update(b"X[")
+        for elem in value._elements:
+            _feed(h, elem)
+        h.update(b"]")
+    elif is_dataclass(value) and not isinstance(value, type):
+        h.update(f"D{type(value).__name__}(".encode())
+        if isinstance(value, PictureRegion):
+            # The image content, not whether it is held encoded or read
+            # from a file while saving, affects the output
+            h.update(f"P{value.sha256()}\x1e".encode())
+        for f in fields(value):
+            if f.name in _SKIPPED_FIELDS or not f.metadata.get("hash", True):
+                continue
+            _feed(h, getattr(value, f.name))
+        h.update(b")")
+    elif isinstance(value, (list, tuple)):
+        h.update(b"L[")
+        for item in value:
+            _feed(h, item)
+        h.update(b"]")
+    elif isinstance(value, dict):
+        h.update(b"M{")
+        for k, v in value.items():
+            _feed(h, k)
+            _feed(h, v)
+        h.update(b"}")
+    else:
+        h.update(f"{type(value).__name__}:{value!r}\x1e".encode())
+
+
+def model_digest(worksheet: Worksheet) -> str:
+    """Return a hex SHA-256 digest of everything that affects the output.
+
+    The document id is part of the digest unless
+    ``Settings.deterministic_id`` is set, in which case the id is itself
+    derived from the digest.
+    """
+    h = hashlib.sha256()
+    h.update(f"smathpy {__version__} / {APP_VERSION}\x1e".encode())
+
+    s = worksheet.settings
+    h.update(b"S(")
+    for f in fields(s):
+        if f.name == "doc_id" and s.deterministic_id:
+            continue
+        _feed(h, getattr(s, f.name))
+    h.update(b")")
+
+    for region in worksheet.regions:
+        _feed(h, region)
+    return h.hexdigest()
+
+
+def regions_digest(regions: Iterable[Region]) -> str:
+    """Return a hex SHA-256 digest of regions alone (no settings or ids)."""
+    h = hashlib.sha256()
+    h.update(f"smathpy {__version__} / {APP_VERSION}\x1e".encode())
+    for region in regions:
+        _feed(h, region)
+    return h.hexdigest()
+
+
+def digest_doc_id(digest: str) -> str:
+    """Derive a stable document id (uuid5 string) from a model digest."""
+    return str(uuid.uuid5(DOC_ID_NAMESPACE, digest))
+
+
+class OutputCache:
+    """On-disk store of serialized worksheets keyed by model digest.
+
+    Entries live under ``directory/<aa>/<digest>.sm``. When a target file is
+    already a hard link to the matching entry the write is skipped entirely;
+    otherwise the target is hard-linked to the entry (falling back to a copy
+    across file systems). Only cache misses pay for serialization.
+
+    Cache hits require a stable document id: enable
+    ``Settings.deterministic_id`` or pin ``Settings.doc_id``.
+    """
+
+    def __init__(self, directory: str | os.PathLike[str], link: bool = True) -> None:
+        self.directory = Path(directory)
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def entry_path(self, digest: str) -> Path:
+        """Return the cache path for a digest."""
+        return self.directory / digest[:2] / f"{digest}.sm"
+
+    def __contains__(self, digest: str) -> bool:
+        return self.entry_path(digest).is_file()
+
+    def save(self, worksheet: Worksheet, path: str | os.PathLike[str]) -> str:
+        """Write *worksheet* to *path* through the cache.
+
+        Returns ``"skipped"`` when *path* already holds the cached output,
+        ``"hit"`` when it was linked or copied from the cache, and ``"miss"``
+        when the worksheet had to be serialized.
+        """
+        digest = worksheet.digest()
+        entry = self.entry_path(digest)
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        if entry.is_file():
+            if target.exists() and os.path.samefile(entry, target):
+                self.skipped += 1
+                return "skipped"
+            self._materialize(entry, target)
+            self.hits += 1
+            return "hit"
+
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        worksheet._write(tmp, digest)
+        os.replace(tmp, entry)
+        self._materialize(entry, target)
+        self.misses += 1
+        return "miss"
+
+    def _materialize(self, entry: Path, target: Path) -> None:
+        """Atomically replace *target* with a link to (or copy of) *entry*."""
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        if tmp.exists():
+            tmp.unlink()
+        if self.link:
+            try:
+                os.link(entry, tmp)
+            except OSError:
+                shutil.copyfile(entry, tmp)
+        else:
+            shutil.copyfile(entry, tmp)
+        os.replace(tmp, target)
+
+
+class PictureCache:
+    """Base64 image payloads keyed by the SHA-256 of the image bytes.
+
+    Encoded payloads are kept in memory in least-recently-used order, up
+    to *max_bytes* of base64 text, and optionally on disk under
+    ``directory/<aa>/<digest>.b64`` so other processes (batch workers) and
+    later runs share them. Files are hashed once per (path, size,
+    modification time). Identical images share one payload string.
+    The cache may be shared between threads.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20,
+                 directory: str | os.PathLike[str] | None = None) -> None:
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory is not None else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._payloads: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._files: dict[tuple[str, int, int], str] = {}  # (path, size, mtime) -> digest
+        self._file_keys: dict[str, list[tuple[str, int, int]]] = {}  # digest -> its keys
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    @property
+    def size(self) -> int:
+        """Characters of base64 held in memory."""
+        return self._size
+
+    def entry_path(self, digest: str) -> Path | None:
+        """Return the on-disk path for a digest (None without a directory)."""
+        if self.directory is None:
+            return None
+        return self.directory / digest[:2] / f"{digest}.b64"
+
+    def encode(self, data: bytes) -> str:
+        """The base64 encoding of *data*, from the cache when possible."""
+        digest = hashlib.sha256(data).hexdigest()
+        return self._payload(digest, lambda: data)
+
+    def encode_file(self, path: str | os.PathLike[str]) -> str:
+        """The base64 encoding of a file, read only if its content is not cached."""
+        p = Path(path)
+        st = p.stat()
+        key = (str(p.resolve()), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._files.get(key)
+        if digest is None:
+            data = p.read_bytes()
+            return self._payload(hashlib.sha256(data).hexdigest(), lambda: data, key)
+        return self._payload(digest, p.read_bytes, key)
+
+    def _payload(self, digest: str, read: Callable[[], bytes],
+                 file_key: tuple[str, int, int] | None = None) -> str:
+        with self._lock:
+            payload = self._payloads.get(digest)
+            if payload is not None:
+                self._payloads.move_to_end(digest)
+                self.hits += 1
+                self._remember(file_key, digest)
+                return payload
+        entry = self.entry_path(digest)
+        from_disk = entry is not None and entry.is_file()
+        if from_disk:
+            payload = entry.read_text(encoding="ascii")
+        else:
+            payload = base64.b64encode(read()).decode("ascii")
+            if entry is not None:
+                entry.parent.mkdir(parents=True, exist_ok=True)
+                tmp = entry.with_name(f"{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(payload, encoding="ascii")
+                os.replace(tmp, entry)
+        with self._lock:
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            existing = self._payloads.get(digest)
+            if existing is not None:  # stored by another thread meanwhile
+                self._remember(file_key, digest)
+                return existing
+            self._payloads[digest] = payload
+            self._size += len(payload)
+            self._remember(file_key, digest)
+            while self._size > self.max_bytes and len(self._payloads) > 1:
+                evicted_digest, evicted = self._payloads.popitem(last=False)
+                self._size -= len(evicted)
+                # Files of an evicted payload are hashed again next time
+                for key in self._file_keys.pop(evicted_digest, ()):
+                    del self._files[key]
+        return payload
+
+    def _remember(self, file_key: tuple[str, int, int] | None, digest: str) -> None:
+        """Record that *file_key* holds *digest* (called with the lock held)."""
+        if file_key is not None and file_key not in self._files:
+            self._files[file_key] = digest
+            self._file_keys.setdefault(digest, []).append(file_key)
@@ -58,6 +58,9 @@ FONT_DEFAULT = 10
 DEFAULT_LEFT = 9
 DEFAULT_TOP_START = 9
 LINE_HEIGHT = 27  # spacing between regions vertically
+REGION_GAP = 3  # gap left below each auto-placed region
+DEFAULT_REGION_HEIGHT = 24  # height of a single-line region
+AREA_MARKER_HEIGHT = 18  # height of an area start/terminator marker
 
 # Built-in functions that require preserve="true"
 BUILTIN_FUNCTIONS = {
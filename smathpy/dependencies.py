@@ -0,0 +1,414 @@
+"""Symbol index and variable dependency graph over a worksheet.
+
+Every region is scanned once for the names it *defines* (targets of ``:``,
+including ``f(x) := ...`` function definitions) and the names it
+*uses* (free variables and user-function calls, excluding function
+parameters, loop and summation variables and names the region defined
+earlier itself). Uses are bound to the nearest preceding definition, as
+SMath evaluates top to bottom, which yields a dependency graph between
+regions::
+
+    idx = ws.symbols
+    idx.definitions_of("A_s")          # regions that assign A_s
+    idx.users_of("f_y")                # regions that read f_y
+    idx.graph().topological_order()
+    idx.diagnostics()                  # use-before-definition, cycles
+"""
+
+from __future__ import annotations
+
+import heapq
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+from .constants import BUILTIN_FUNCTIONS
+from .expression.builder import Expr
+from .expression.tree import Node, to_tree
+from .regions.area_region import AreaRegion
+from .regions.base import Region
+from .regions.math_region import MathRegion
+from .regions.plot_region import PlotRegion
+
+# Predefined SMath constants that are never reported as undefined
+BUILTIN_CONSTANTS = {"π", "∞", "e"}
+
+_ASSIGN_OPERATORS = {":"}  # "≡" is boolean equality and binds nothing
+_BOUND_SECOND_ARG = {"sum", "product", "int", "diff"}
+
+
+@dataclass
+class RegionSymbols:
+    """Names defined and used by one region."""
+
+    defines: list[str] = field(default_factory=list)
+    uses: set[str] = field(default_factory=set)
+
+
+@dataclass
+class Diagnostic:
+    """A problem found in the dependency structure of a worksheet."""
+
+    kind: str  # "use-before-definition", "undefined", "cycle" or "evaluation"
+    name: str
+    region: Region
+    message: str
+
+
+class _Scope:
+    __slots__ = ("names", "parent", "function")
+
+    def __init__(self, names: Iterable[str] = (), parent: _Scope | None = None,
+                 function: bool = False) -> None:
+        self.names = set(names)
+        self.parent = parent
+        self.function = function
+
+    def binds(self, name: str) -> bool:
+        scope: _Scope | None = self
+        while scope is not None:
+            if name in scope.names:
+                return True
+            scope = scope.parent
+        return False
+
+    def in_function(self) -> bool:
+        scope: _Scope | None = self
+        while scope is not None:
+            if scope.function:
+                return True
+            scope = scope.parent
+        return False
+
+
+def expr_symbols(expr: Expr, result: RegionSymbols | None = None) -> RegionSymbols:
+    """Collect the names an expression defines and the free names it uses."""
+    result = result if result is not None else RegionSymbols()
+    try:
+        root = to_tree(expr)
+    except ValueError:
+        # Malformed RPN: be conservative and treat every name as a use
+        for e in expr._elements:
+            n = Node(e)
+            if n.is_name() and e.value not in BUILTIN_CONSTANTS:
+                result.uses.add(e.value)
+        return result
+
+    top = _Scope()
+    # Explicit stack (expressions can be deep): ("node", node, scope) items
+    # are visited left to right; ("define", name, scope) runs after the
+    # right-hand side of an assignment has been scanned.
+    todo: list[tuple[str, object, _Scope]] = [("node", root, top)]
+    while todo:
+        kind, item, scope = todo.pop()
+        if kind == "define":
+            name = str(item)
+            if scope.in_function():
+                scope.names.add(name)
+            else:
+                top.names.add(name)
+                if name not in result.defines:
+                    result.defines.append(name)
+            continue
+
+        assert isinstance(item, Node)
+        node = item
+        e = node.element
+        if e.type == "operand":
+            if node.is_name() and e.value not in BUILTIN_CONSTANTS and not scope.binds(e.value):
+                result.uses.add(e.value)
+            continue
+
+        children = node.children
+        if e.type == "operator" and e.value in _ASSIGN_OPERATORS and len(children) == 2:
+            lhs, rhs = children
+            if lhs.type == "operand":
+                todo.append(("define", lhs.value, scope))
+                todo.append(("node", rhs, scope))
+                continue
+            if lhs.type == "function" and lhs.value == "el" and lhs.children:
+                # Element assignment A[i] := v modifies an existing A
+                target = lhs.children[0]
+                if target.type == "operand":
+                    todo.append(("define", target.value, scope))
+                todo.extend(("node", c, scope) for c in reversed(lhs.children))
+                todo.append(("node", rhs, scope))
+                continue
+            if lhs.type == "function":
+                params = [c.value for c in lhs.children if c.type == "operand"]
+                todo.append(("define", lhs.value, scope))
+                body_scope = _Scope(params + [lhs.value], scope, function=True)
+                todo.append(("node", rhs, body_scope))
+                continue
+
+        if e.type == "function":
+            if e.value == "for" and len(children) == 3 and children[0].type == "operand":
+                loop_scope = _Scope([children[0].value], scope)
+                todo.append(("node", children[2], loop_scope))
+                todo.append(("node", children[1], scope))
+                continue
+            if e.value in _BOUND_SECOND_ARG and len(children) >= 2 and children[1].type == "operand":
+                bound_scope = _Scope([children[1].value], scope)
+                todo.extend(("node", c, scope) for c in reversed(children[2:]))
+                todo.append(("node", children[0], bound_scope))
+                continue
+            if e.value not in BUILTIN_FUNCTIONS and not scope.binds(e.value):
+                result.uses.add(e.value)
+
+        todo.extend(("node", c, scope) for c in reversed(children))
+    return result
+
+
+def region_symbols(region: Region) -> RegionSymbols:
+    """Names defined and used by a single region (areas excluded)."""
+    result = RegionSymbols()
+    if isinstance(region, MathRegion) and region.expr is not None:
+        expr_symbols(region.expr, result)
+    elif isinstance(region, PlotRegion):
+        for inp in region.inputs:
+            expr_symbols(inp, result)
+    return result
+
+
+def _shows_result(region: Region) -> bool:
+    return isinstance(region, MathRegion) and (
+        region.result_action is not None or region.show_result
+    )
+
+
+def iter_regions(regions: Iterable[Region]) -> Iterator[Region]:
+    """Yield regions in document order, descending into areas."""
+    for region in regions:
+        yield region
+        if isinstance(region, AreaRegion):
+            yield from iter_regions(region.children)
+
+
+class DependencyGraph:
+    """Directed graph between regions: an edge ``a -> b`` means *b* reads a
+    name defined by *a*.
+
+    Nodes are numbered in document order. Edges bound to a *later*
+    definition (uses before definition) are kept, so they can close cycles.
+    """
+
+    def __init__(self, regions: list[Region], edges: list[set[int]]) -> None:
+        self.regions = regions
+        self.edges = edges
+        self._position = {id(r): i for i, r in enumerate(regions)}
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def index(self, region: Region) -> int:
+        """Node number of *region*."""
+        try:
+            return self._position[id(region)]
+        except KeyError:
+            raise ValueError("region is not in the graph") from None
+
+    def predecessors(self) -> list[set[int]]:
+        """Reverse adjacency: for each node, the nodes it depends on."""
+        preds: list[set[int]] = [set() for _ in self.regions]
+        for a, targets in enumerate(self.edges):
+            for b in targets:
+                preds[b].add(a)
+        return preds
+
+    def dependencies(self, region: Region, transitive: bool = False) -> list[Region]:
+        """Regions that *region* depends on, in document order."""
+        n = self.index(region)
+        needed = self.requires([n], transitive) - {n}
+        return [self.regions[i] for i in sorted(needed)]
+
+    def dependents(self, region: Region) -> list[Region]:
+        """Regions that read a name defined by *region*, in document order."""
+        return [self.regions[i] for i in sorted(self.edges[self.index(region)])]
+
+    def requires(self, nodes: Iterable[int], transitive: bool = True) -> set[int]:
+        """Nodes needed to evaluate *nodes* (including themselves)."""
+        preds = self.predecessors()
+        needed = set(nodes)
+        todo = list(needed)
+        while todo:
+            n = todo.pop()
+            for p in preds[n]:
+                if p not in needed:
+                    if transitive:
+                        todo.append(p)
+                    needed.add(p)
+        return needed
+
+    def topological_order(self) -> list[Region]:
+        """Regions ordered so each comes after everything it depends on.
+
+        Ties keep document order. Raises ``ValueError`` if the graph has a
+        cycle (see :meth:`cycles`).
+        """
+        indegree = [0] * len(self.regions)
+        for targets in self.edges:
+            for b in targets:
+                indegree[b] += 1
+        ready = [i for i, d in enumerate(indegree) if d == 0]
+        heapq.heapify(ready)
+        order: list[int] = []
+        while ready:
+            n = heapq.heappop(ready)
+            order.append(n)
+            for b in self.edges[n]:
+                indegree[b] -= 1
+                if indegree[b] == 0:
+                    heapq.heappush(ready, b)
+        if len(order) != len(self.regions):
+            raise ValueError("dependency graph has a cycle")
+        return [self.regions[i] for i in order]
+
+    def cycles(self) -> list[list[Region]]:
+        """Strongly connected components with more than one region."""
+        # Iterative Tarjan
+        index_of: dict[int, int] = {}
+        low: dict[int, int] = {}
+        on_stack: set[int] = set()
+        stack: list[int] = []
+        result: list[list[Region]] = []
+        counter = 0
+        for start in range(len(self.regions)):
+            if start in index_of:
+                continue
+            work = [(start, iter(sorted(self.edges[start])))]
+            index_of[start] = low[start] = counter
+            counter += 1
+            stack.append(start)
+            on_stack.add(start)
+            while work:
+                v, it = work[-1]
+                advanced = False
+                for w in it:
+                    if w not in index_of:
+                        index_of[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack.add(w)
+                        work.append((w, iter(sorted(self.edges[w]))))
+                        advanced = True
+                        break
+                    if w in on_stack:
+                        low[v] = min(low[v], index_of[w])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[v])
+                if low[v] == index_of[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    if len(component) > 1:
+                        result.append([self.regions[i] for i in sorted(component)])
+        return result
+
+
+class SymbolIndex:
+    """Index of defined and used names, built in one pass over the regions.
+
+    :meth:`add` extends the index incrementally (``Worksheet.add`` calls it),
+    so keeping the index current costs O(size of the new region).
+    """
+
+    def __init__(self, regions: Iterable[Region] = ()) -> None:
+        self.regions: list[Region] = []
+        self.symbols: list[RegionSymbols] = []
+        self.top_level = 0  # number of top-level regions added
+        self._defs: dict[str, list[int]] = {}
+        self._uses: dict[str, list[int]] = {}
+        self._edges: list[set[int]] = []
+        self._forward: list[tuple[str, int, int]] = []  # (name, user, later definer)
+        self._pending: dict[str, list[int]] = {}  # uses with no definition yet
+        for region in regions:
+            self.add(region)
+
+    def add(self, region: Region) -> None:
+        """Index a region appended at the end of the document."""
+        self.top_level += 1
+        for r in iter_regions([region]):
+            self._add_one(r)
+
+    def _add_one(self, region: Region) -> None:
+        n = len(self.regions)
+        syms = region_symbols(region)
+        self.regions.append(region)
+        self.symbols.append(syms)
+        self._edges.append(set())
+
+        for name in sorted(syms.uses):
+            self._uses.setdefault(name, []).append(n)
+            defs = self._defs.get(name)
+            if defs:
+                self._edges[defs[-1]].add(n)
+            else:
+                self._pending.setdefault(name, []).append(n)
+
+        for name in syms.defines:
+            self._defs.setdefault(name, []).append(n)
+            for user in self._pending.pop(name, []):
+                if user != n:
+                    self._forward.append((name, user, n))
+                    self._edges[n].add(user)
+
+    # -- queries -------------------------------------------------------------
+
+    def names(self) -> list[str]:
+        """All defined names, sorted."""
+        return sorted(self._defs)
+
+    def definitions_of(self, name: str) -> list[Region]:
+        """Regions that define *name*, in document order."""
+        return [self.regions[i] for i in self._defs.get(name, [])]
+
+    def definition_of(self, name: str) -> Region | None:
+        """The last region defining *name*, or ``None``."""
+        defs = self._defs.get(name)
+        return self.regions[defs[-1]] if defs else None
+
+    def users_of(self, name: str) -> list[Region]:
+        """Regions that read *name*, in document order."""
+        return [self.regions[i] for i in self._uses.get(name, [])]
+
+    def evaluations_of(self, name: str) -> list[Region]:
+        """Regions that display the value of *name* without defining anything."""
+        return [
+            self.regions[i] for i in self._uses.get(name, [])
+            if not self.symbols[i].defines and _shows_result(self.regions[i])
+        ]
+
+    def undefined(self) -> set[str]:
+        """Names that are used but never defined."""
+        return set(self._pending)
+
+    def graph(self) -> DependencyGraph:
+        """The dependency graph between indexed regions."""
+        return DependencyGraph(list(self.regions), [set(e) for e in self._edges])
+
+    def diagnostics(self) -> list[Diagnostic]:
+        """Uses before definition, undefined names and dependency cycles."""
+        result = [
+            Diagnostic(
+                "use-before-definition", name, self.regions[user],
+                f"'{name}' is used before it is defined",
+            )
+            for name, user, _ in self._forward
+        ]
+        for name, users in sorted(self._pending.items()):
+            for user in users:
+                result.append(Diagnostic(
+                    "undefined", name, self.regions[user], f"'{name}' is never defined",
+                ))
+        for component in self.graph().cycles():
+            result.append(Diagnostic(
+                "cycle", "", component[0],
+                f"{len(component)} regions depend on each other",
+            ))
+        return result
@@ -2,24 +2,53 @@
 
 from __future__ import annotations
 
+import copy
+import dataclasses
+import os
+import threading
+import time
+import uuid
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any
 
+from .cache import OutputCache, digest_doc_id, model_digest, regions_digest
 from .constants import (
     APP_PROGID,
     APP_VERSION,
+    AREA_MARKER_HEIGHT,
     SMATH_NAMESPACE,
     DEFAULT_LEFT,
+    DEFAULT_REGION_HEIGHT,
     DEFAULT_TOP_START,
+    FONT_DEFAULT,
     LINE_HEIGHT,
+    REGION_GAP,
 )
+from . import imaging, memory, profiling, snapshot
+from .dependencies import Diagnostic, SymbolIndex, iter_regions, region_symbols
+from .evaluator import EvaluationError, Evaluator, convert, result_elements
+from .imaging import DEFAULT_QUALITY, OptimizeReport
+from .profiling import Profiler, SerializationProfile, phase
+from .expression.builder import unit
+from .layout import OffsetTree, StackLayout, make_layout, region_size, terminator_top
 from .regions.area_region import AreaRegion
 from .regions.base import Region
+from .regions.fragment_region import FragmentRegion
 from .regions.math_region import MathRegion
-from .regions.picture_region import PictureRegion
+from .regions.picture_region import PictureRegion, PictureSource
 from .regions.plot_region import PlotRegion
 from .regions.text_region import TextRegion
-from .settings import Settings
+from .settings import Assembly, Settings
+
+# Pre-serialized module fragments: (digest, collapsed) -> entry
+FRAGMENT_CACHE_SIZE = 32
+_FragmentEntry = tuple[list[ET.Element], int, int, int, int]  # elements, origin, ids, w, h
+_FRAGMENTS: OrderedDict[tuple[str, bool | None], _FragmentEntry] = OrderedDict()
+_FRAGMENTS_LOCK = threading.Lock()  # worksheets may be composed in several threads
 
 
 class Worksheet:
@@ -31,6 +60,14 @@ class Worksheet:
         ws.add(TextRegion.title("Beam Calculation"))
         ws.add(MathRegion.assignment("L", 3, unit_name="m"))
         ws.save("beam.sm")
+
+    *layout* selects how regions without an explicit ``top`` are placed:
+    ``"stack"`` (default) stacks them assuming a fixed 24 px height unless
+    ``height`` is given; ``"auto"`` estimates each region's size from its
+    content and re-flows the document at save time; ``"page"`` does the same
+    and also keeps regions from straddling printed pages of
+    ``settings.page_model``; ``"flow"`` packs short regions side by side in
+    columns across the page width (see :mod:`smathpy.layout`).
     """
 
     def __init__(
@@ -39,13 +76,23 @@ class Worksheet:
         author: str = "",
         lang: str = "eng",
         settings: Settings | None = None,
+        layout: str | StackLayout = "stack",
     ):
         self.settings = settings or Settings()
         if title or author:
             self.settings.set_metadata(lang=lang, title=title, author=author)
         self.regions: list[Region] = []
+        self.layout = make_layout(layout, self.settings)
         self._next_top = DEFAULT_TOP_START
+        self._pending_spacing = 0
+        self._offsets: OffsetTree | None = None
+        self._symbols: SymbolIndex | None = None
         self._auto_layout = True
+        self._owned: set[int] | None = None  # unshared regions after fork()
+        self._owns_settings = True
+        self._streams: list[PictureSource] | None = None  # lazy pictures while writing
+        self._profiler: Profiler | None = None
+        self._profile: SerializationProfile | None = None  # serialization in progress
 
     # -- Region management ---------------------------------------------------
 
@@ -55,49 +102,578 @@ class Worksheet:
         If the region has no explicit top position set (still at default 9),
         auto-layout places it below the previous region.
         """
+        if self.layout is not None:
+            if region.left == 0 and not isinstance(region, AreaRegion):
+                region.left = DEFAULT_LEFT
+            self.layout.place(region, self._pending_spacing)
+            self._pending_spacing = 0
+            self._append(region)
+            return region
+
         if self._auto_layout and region.top == 9 and len(self.regions) > 0:
             region.top = self._next_top
         if region.left == 0 and not isinstance(region, AreaRegion):
             region.left = DEFAULT_LEFT
 
         # Estimate height for auto-layout
-        h = region.height if region.height else 24
+        if isinstance(region, AreaRegion):
+            h = self._stack_area(region) + AREA_MARKER_HEIGHT - region.top
+        else:
+            h = region.height if region.height else 24
         self._next_top = region.top + h + 3  # 3px gap
 
-        self.regions.append(region)
+        self._append(region)
+        return region
+
+    def insert(self, index_or_anchor: int | Region, region: Region) -> Region:
+        """Insert a region in the middle of the worksheet.
+
+        *index_or_anchor* is either a position (``list.insert`` semantics) or
+        a region already in the worksheet, after which *region* is inserted.
+        A region without an explicit ``top`` takes the place of the region it
+        is inserted before, and every following region moves down by its
+        height. The shift is applied lazily in O(log n); ``top`` values are
+        settled by :meth:`reflow` (called before serialization) or read
+        exactly through :meth:`top_of`.
+        """
+        if isinstance(index_or_anchor, Region):
+            index = self._index_of(index_or_anchor) + 1
+        else:
+            index = index_or_anchor
+            if index < 0:
+                index = max(len(self.regions) + index, 0)
+        if index >= len(self.regions):
+            return self.add(region)
+
+        self._unshare_from(index)
+        tree = self._offset_tree()
+        if region.left == 0 and not isinstance(region, AreaRegion):
+            region.left = DEFAULT_LEFT
+        shift = 0
+        if region.top == DEFAULT_TOP_START:
+            region.top = tree.get(index).top
+            shift = self._extent(region)
+            self._next_top += shift
+            if self.layout is not None:
+                self.layout.track(region)
+                self.layout.shift(shift)
+        tree.insert(index, region, shift)
+        self.regions.insert(index, region)
+        if self._owned is not None:
+            self._owned.add(id(region))
+        self._symbols = None
+        tracker = memory.get_tracker()
+        if tracker is not None:
+            tracker.added(region)
+        return region
+
+    def remove(self, index_or_region: int | Region) -> Region:
+        """Remove a region and move the following regions up into its place.
+
+        Accepts a position or the region itself. As with :meth:`insert`, the
+        following regions are shifted lazily in O(log n).
+        """
+        if isinstance(index_or_region, Region):
+            index = self._index_of(index_or_region)
+        else:
+            index = index_or_region
+            if index < 0:
+                index += len(self.regions)
+        if not 0 <= index < len(self.regions):
+            raise IndexError("region index out of range")
+
+        self._unshare_from(index + 1)
+        tree = self._offset_tree()
+        top = tree.get(index).top
+        if index + 1 < len(self.regions):
+            shift = max(tree.get(index + 1).top - top, 0)
+        else:
+            shift = self._extent(self.regions[index])
+        region = tree.remove(index, -shift)
+        self.regions.pop(index)
+        self._symbols = None
+        self._next_top -= shift
+        if self.layout is not None:
+            self.layout.forget(region)
+            self.layout.shift(-shift)
         return region
 
+    def top_of(self, index_or_region: int | Region) -> int:
+        """Return the up-to-date ``top`` of a region in O(log n)."""
+        if isinstance(index_or_region, Region):
+            index = self._index_of(index_or_region)
+        else:
+            index = index_or_region
+        if self._offsets is None:
+            return self.regions[index].top
+        return self._offset_tree().get(index).top
+
+    @property
+    def symbols(self) -> SymbolIndex:
+        """Index of defined and used names with the region dependency graph.
+
+        Built in one pass on first access and then kept current by
+        :meth:`add`; :meth:`insert`, :meth:`remove` and direct edits of
+        ``regions`` trigger a rebuild on next access.
+        """
+        if self._symbols is None or self._symbols.top_level != len(self.regions):
+            self._symbols = SymbolIndex(self.regions)
+        return self._symbols
+
+    def slice(self, outputs: Iterable[str | Region]) -> Worksheet:
+        """Return a worksheet with only what is needed for *outputs*.
+
+        *outputs* are regions of this worksheet or variable names. A name
+        selects the regions that display its value (evaluations), or its
+        last definition if it is never evaluated. The slice keeps those
+        regions, every region they transitively depend on, and the title and
+        section headings enclosing what is kept; areas keep only their
+        needed children. Regions are shallow copies re-laid out from the top.
+
+        Raises ``ValueError`` for a name that is neither evaluated nor
+        defined, or a region that is not in this worksheet.
+        """
+        index = self.symbols
+        graph = index.graph()
+        nodes: list[int] = []
+        for output in outputs:
+            if isinstance(output, Region):
+                nodes.append(graph.index(output))
+                continue
+            shown = index.evaluations_of(output)
+            if not shown:
+                last = index.definition_of(output)
+                if last is None:
+                    raise ValueError(f"'{output}' is neither evaluated nor defined")
+                shown = [last]
+            nodes.extend(graph.index(r) for r in shown)
+
+        keep = {id(graph.regions[i]) for i in graph.requires(nodes)}
+        layout: str | StackLayout = "stack" if self.layout is None else self.layout.clone()
+        ws = Worksheet(settings=copy.deepcopy(self.settings), layout=layout)
+        ws.settings.doc_id = str(uuid.uuid4())
+        for region in _slice_regions(self.regions, keep):
+            ws.add(region)
+        return ws
+
+    # -- Evaluation -----------------------------------------------------------
+
+    def precompute(self, strict: bool = False) -> list[Diagnostic]:
+        """Evaluate the worksheet offline and store the numeric results.
+
+        Math regions are evaluated in document order. Each region showing a
+        numeric result (``show_result`` or ``result_action="numeric"``) gets
+        ``result_elements`` rounded to its ``decimal_places`` (the document
+        ``precision`` by default) and expressed in its contract unit, so SMath
+        Studio displays the values before the first recalculation.
+
+        Regions that cannot be evaluated offline (symbolic operations,
+        unsupported functions, names left undefined) keep their result and
+        are returned as ``"evaluation"`` diagnostics; with *strict* the first
+        one raises :class:`~smathpy.evaluator.EvaluationError` instead.
+        """
+        evaluator = Evaluator()
+        problems: list[Diagnostic] = []
+        for region in list(iter_regions(self.regions)):
+            if not isinstance(region, MathRegion) or region.expr is None:
+                continue
+            try:
+                value = evaluator.run(region)
+                action = region.result_action or ("numeric" if region.show_result else None)
+                if value is None or action != "numeric":
+                    continue
+                contract = region.contract_expr
+                if contract is None and region.contract_unit:
+                    contract = unit(region.contract_unit)
+                if contract is not None:
+                    value = convert(value, evaluator.evaluate(contract))
+                places = region.decimal_places
+                elements = result_elements(
+                    value,
+                    decimal_places=self.settings.precision if places is None else places,
+                    significant_digits=region.significant_digits_mode,
+                    trailing_zeros=region.trailing_zeros,
+                    exponential_threshold=self.settings.exponential_threshold,
+                )
+            except EvaluationError as exc:
+                if strict:
+                    raise
+                defines = region_symbols(region).defines
+                problems.append(Diagnostic(
+                    "evaluation", defines[0] if defines else "", region, str(exc),
+                ))
+                continue
+            target = region if self._owned is None else self.edit(region)
+            target.result_elements = elements
+        return problems
+
+    # -- Pictures -------------------------------------------------------------
+
+    def optimize_pictures(self, quality: int = DEFAULT_QUALITY, dpi: int | None = None,
+                          workers: int | None = None) -> OptimizeReport:
+        """Shrink embedded PNG and JPEG pictures (requires Pillow).
+
+        Images are downsampled to their displayed size at *dpi* (the
+        worksheet ``dpi`` by default), re-encoded at *quality* and stripped
+        of metadata, in parallel threads; see :mod:`smathpy.imaging`. Only
+        pictures that get smaller are replaced.
+        """
+        pictures = [r for r in iter_regions(self.regions) if isinstance(r, PictureRegion)]
+        scale = (dpi or self.settings.dpi) / self.settings.dpi
+        report = imaging.optimize_pictures(pictures, quality, scale, workers)
+        for result in report.changed:
+            target = result.region if self._owned is None else self.edit(result.region)
+            target.data_base64 = result.data_base64
+            target.source = None
+        return report
+
+    # -- Composition ----------------------------------------------------------
+
+    def include(self, other: Worksheet, collapsed: bool | None = None,
+                fragment: bool = False) -> list[Region]:
+        """Append the regions of another worksheet (a reusable module).
+
+        The regions are copied, so a module can be included many times.
+        Positions are remapped in one pass: with a layout engine the regions
+        are re-placed below the current content keeping their vertical
+        spacing; otherwise the whole block is shifted down. With *collapsed*
+        set to ``True`` or ``False`` the regions are wrapped in an
+        :class:`AreaRegion` in that state. Assemblies required by *other*
+        are added to this worksheet's settings.
+
+        With *fragment*, the module is added as a single
+        :class:`FragmentRegion` holding its pre-serialized XML (see
+        :meth:`fragment`), so including the same module content again skips
+        serializing it.
+
+        Returns the regions added to this worksheet.
+        """
+        self._merge_assemblies(other.settings.assemblies)
+        if fragment:
+            frag = other.fragment(collapsed)
+            return [self.add(frag)] if frag.elements else []
+
+        other.reflow()
+        spacings = other._spacings()
+        copies = [_copy_tree(r) for r in other.regions]
+        if not copies:
+            return []
+
+        if self.layout is not None:
+            for region in copies:
+                _move_tree(region, None)
+            if collapsed is not None:
+                return [self.add(AreaRegion(collapsed=collapsed, children=copies))]
+            for region, spacing in zip(copies, spacings):
+                self._pending_spacing += spacing
+                self.add(region)
+            return copies
+
+        start = self._next_top if self.regions else DEFAULT_TOP_START
+        origin = copies[0].top
+        if collapsed is not None:
+            area = AreaRegion(collapsed=collapsed, top=start, children=copies)
+            for region in copies:
+                _move_tree(region, start + AREA_MARKER_HEIGHT - origin)
+            self._next_top = self._stack_area(area) + AREA_MARKER_HEIGHT + REGION_GAP
+            self._append(area)
+            return [area]
+        for region in copies:
+            _move_tree(region, start - origin)
+            self._next_top = max(self._next_top, region.top + self._extent(region))
+            self._append(region)
+        return copies
+
+    def fragment(self, collapsed: bool | None = None) -> FragmentRegion:
+        """Return this worksheet's regions pre-serialized as a fragment.
+
+        Serialized XML is cached per digest of the regions (and
+        *collapsed*), so modules rebuilt with the same content reuse it;
+        every call returns a new :class:`FragmentRegion` sharing the cached
+        elements.
+        """
+        self.reflow()
+        digest = regions_digest(self.regions)
+        key = (digest, collapsed)
+        with _FRAGMENTS_LOCK:
+            entry = _FRAGMENTS.get(key)
+            if entry is not None:
+                _FRAGMENTS.move_to_end(key)
+        if entry is None:
+            # Serialized outside the lock; a thread that finished first wins
+            built = self._serialize_fragment(collapsed)
+            with _FRAGMENTS_LOCK:
+                entry = _FRAGMENTS.setdefault(key, built)
+                _FRAGMENTS.move_to_end(key)
+                if len(_FRAGMENTS) > FRAGMENT_CACHE_SIZE:
+                    _FRAGMENTS.popitem(last=False)
+        elements, origin, id_count, width, height = entry
+        return FragmentRegion(
+            elements=elements, origin=origin, id_count=id_count, digest=digest,
+            width=width, height=height,
+        )
+
+    def _serialize_fragment(self, collapsed: bool | None) -> _FragmentEntry:
+        regions = [_copy_tree(r) for r in self.regions]
+        if not regions:
+            return ([], 0, 0, 0, 0)
+        if collapsed is not None:
+            top = regions[0].top
+            for region in regions:
+                _move_tree(region, AREA_MARKER_HEIGHT)
+            regions = [AreaRegion(collapsed=collapsed, top=top, children=regions)]
+
+        tmp = Worksheet(settings=self.settings)
+        tmp.regions = regions
+        tmp._assign_ids()
+        root = ET.Element("fragment")
+        for region in regions:
+            tmp._build_region(root, region)
+
+        sizes = [region_size(r) for r in regions]
+        origin = regions[0].top
+        left = min(r.left for r in regions)
+        width = max(r.left + w for r, (w, _) in zip(regions, sizes)) - left
+        height = max(r.top + h for r, (_, h) in zip(regions, sizes)) - origin
+        id_count = sum(1 for _ in root.iter(f"{{{SMATH_NAMESPACE}}}region"))
+        return (list(root), origin, id_count, width, height)
+
+    def _spacings(self) -> list[int]:
+        """Vertical space left before each top-level region, in document order."""
+        result = []
+        bottom = DEFAULT_TOP_START
+        for region in self.regions:
+            spacing = self.layout.spacing_of(region) if self.layout is not None else None
+            if spacing is None:
+                spacing = max(region.top - bottom, 0)
+            result.append(spacing)
+            bottom = region.top + self._extent(region)
+        return result
+
+    def _merge_assemblies(self, assemblies: list[Assembly]) -> None:
+        """Add the assemblies this worksheet does not require yet."""
+        names = {a.name for a in self.settings.assemblies}
+        missing = [a for a in assemblies if a.name not in names]
+        if missing:
+            self.edit_settings().assemblies.extend(copy.copy(a) for a in missing)
+
+    # -- Variants -------------------------------------------------------------
+
+    def fork(self) -> Worksheet:
+        """Return a variant of this worksheet sharing its regions.
+
+        Regions, expressions and settings are shared structurally, so a fork
+        costs O(number of regions) pointers. Both worksheets then treat the
+        shared regions as read-only: get a private copy with :meth:`edit`
+        (and :meth:`edit_settings`) before changing anything. Regions added
+        or inserted afterwards belong to the worksheet they were added to.
+        The fork gets its own document id.
+
+        Serialization still writes scratch values (``id``, and ``top`` of
+        auto-placed regions) into shared regions, so do not serialize forks
+        of one worksheet concurrently from several threads.
+        """
+        if self._offsets is not None:
+            self._offsets.flush()
+            self._offsets = None
+        ws = copy.copy(self)
+        ws.regions = list(self.regions)
+        ws.settings = dataclasses.replace(self.settings, doc_id=str(uuid.uuid4()))
+        ws.layout = None if self.layout is None else self.layout.fork()
+        ws._symbols = None
+        ws._owned = set()
+        ws._owns_settings = False
+        self._owned = set()
+        self._owns_settings = False
+        return ws
+
+    def edit(self, target: int | Region) -> Region:
+        """Return a region of this worksheet that is safe to modify.
+
+        *target* is a top-level index or a region (possibly inside an area).
+        A region shared with a fork is replaced by a copy first, together
+        with the areas enclosing it; otherwise the region itself is returned.
+        Always edit the returned object.
+        """
+        if isinstance(target, int):
+            path = [target if target >= 0 else target + len(self.regions)]
+        else:
+            path = self._path_of(target)
+        container = self.regions
+        region = container[path[0]]
+        for i in path:
+            region = self._own(container, i)
+            if isinstance(region, AreaRegion):
+                container = region.children
+        return region
+
+    def edit_settings(self) -> Settings:
+        """Return settings that are safe to modify (copied if shared by a fork)."""
+        if not self._owns_settings:
+            self.settings = copy.deepcopy(self.settings)
+            self._owns_settings = True
+        return self.settings
+
+    def _own(self, container: list[Region], index: int) -> Region:
+        """Replace a shared region in *container* by a private copy."""
+        region = container[index]
+        if self._owned is None or id(region) in self._owned:
+            return region
+        if self._offsets is not None:
+            self._offsets.flush()
+            self._offsets = None
+        dup = _copy_region(region)
+        container[index] = dup
+        self._owned.add(id(dup))
+        self._symbols = None
+        if self.layout is not None:
+            self.layout.replace(region, dup)
+        return dup
+
+    def _unshare_from(self, index: int) -> None:
+        """Copy the shared top-level regions from *index* on (they are about to move)."""
+        if self._owned is None:
+            return
+        for i in range(index, len(self.regions)):
+            self._own(self.regions, i)
+
+    def _path_of(self, region: Region) -> list[int]:
+        """Indices leading to *region* through nested areas (identity match)."""
+        todo: list[tuple[list[Region], list[int]]] = [(self.regions, [])]
+        while todo:
+            regions, prefix = todo.pop()
+            for i, r in enumerate(regions):
+                if r is region:
+                    return prefix + [i]
+                if isinstance(r, AreaRegion):
+                    todo.append((r.children, prefix + [i]))
+        raise ValueError("region is not in this worksheet")
+
+    def _append(self, region: Region) -> None:
+        self.regions.append(region)
+        if self._owned is not None:
+            self._owned.add(id(region))
+        if self._symbols is not None:
+            self._symbols.add(region)
+        if self._offsets is not None:
+            if len(self._offsets) == len(self.regions) - 1:
+                self._offsets.append(region)
+            else:
+                self._offsets.flush()
+                self._offsets = None
+        tracker = memory.get_tracker()
+        if tracker is not None:
+            tracker.added(region)
+
+    def _offset_tree(self) -> OffsetTree:
+        """Return the offset tree, rebuilding it if ``regions`` was edited directly."""
+        if self._offsets is None or len(self._offsets) != len(self.regions):
+            if self._offsets is not None:
+                self._offsets.flush()
+            self._offsets = OffsetTree(self.regions)
+        return self._offsets
+
+    def _index_of(self, region: Region) -> int:
+        """Position of *region* by identity (regions compare equal by value)."""
+        for i, r in enumerate(self.regions):
+            if r is region:
+                return i
+        raise ValueError("region is not in this worksheet")
+
+    def _extent(self, region: Region) -> int:
+        """Vertical space a region occupies in the flow, including the gap."""
+        if self.layout is not None:
+            return region_size(region)[1] + self.layout.gap
+        if isinstance(region, AreaRegion):
+            return self._stack_area(region) + AREA_MARKER_HEIGHT - region.top + REGION_GAP
+        return (region.height or DEFAULT_REGION_HEIGHT) + REGION_GAP
+
     def add_spacing(self, pixels: int = LINE_HEIGHT) -> None:
         """Add vertical spacing before the next region."""
         self._next_top += pixels
+        self._pending_spacing += pixels
+
+    def reflow(self) -> None:
+        """Settle region positions in one linear pass.
+
+        Applies shifts pending from :meth:`insert`/:meth:`remove` and, with a
+        content-based layout, recomputes every auto-placed region. Called
+        automatically before serialization.
+        """
+        if self._offsets is not None:
+            self._offsets.flush()
+        if self.layout is not None:
+            self.layout.reflow(self.regions)
 
     # -- Serialization -------------------------------------------------------
 
+    def digest(self) -> str:
+        """Return the content digest of the worksheet model.
+
+        Two worksheets with the same digest serialize to the same file.
+        """
+        self.reflow()
+        return model_digest(self)
+
+    def document_id(self, digest: str | None = None) -> str:
+        """Return the document id written to ``<identity>``.
+
+        With ``Settings.deterministic_id`` the id is derived from the model
+        digest; otherwise ``Settings.doc_id`` is used as is.
+        """
+        if not self.settings.deterministic_id:
+            return self.settings.doc_id
+        return digest_doc_id(digest or self.digest())
+
     def to_xml(self) -> ET.ElementTree:
         """Serialize to an ElementTree."""
+        with self._profiled("to_xml"):
+            return self._to_xml()
+
+    def _to_xml(self, digest: str | None = None) -> ET.ElementTree:
+        profile = self._profile
+        with phase(profile, "reflow"):
+            self.reflow()
+
         # Register namespace to avoid ns0: prefixes
         ET.register_namespace("", SMATH_NAMESPACE)
 
         root = ET.Element(f"{{{SMATH_NAMESPACE}}}regions")
 
         # Settings
-        self._build_settings(root)
+        with phase(profile, "digest"):
+            doc_id = self.document_id(digest)
+        with phase(profile, "settings"):
+            self._build_settings(root, doc_id)
 
         # Regions
-        self._assign_ids()
-        for region in self.regions:
-            self._build_region(root, region)
+        with phase(profile, "assign_ids"):
+            self._assign_ids()
+        tracker = memory.get_tracker()
+        if profile is None and tracker is None:
+            for region in self.regions:
+                self._build_region(root, region)
+        else:
+            self._build_regions_profiled(root, profile, tracker)
 
         return ET.ElementTree(root)
 
     def to_xml_string(self) -> str:
         """Serialize to a complete XML string with indentation."""
-        tree = self.to_xml()
+        with self._profiled("to_xml_string") as profile:
+            content = self._serialize()
+            if profile is not None:
+                profile.bytes = len(content.encode("utf-8"))
+            return content
+
+    def _serialize(self, digest: str | None = None) -> str:
+        tree = self._to_xml(digest)
         root = tree.getroot()
         assert root is not None
 
         # Pretty-print with indentation
-        ET.indent(root, space="  ")
+        with phase(self._profile, "indent"):
+            ET.indent(root, space="  ")
 
         # Build the XML string manually to include processing instructions
         lines = [
@@ -105,34 +681,216 @@ class Worksheet:
             f'<?application progid="{APP_PROGID}" version="{APP_VERSION}"?>',
         ]
 
-        xml_str = ET.tostring(root, encoding="unicode", xml_declaration=False)
+        with phase(self._profile, "tostring"):
+            xml_str = ET.tostring(root, encoding="unicode", xml_declaration=False)
         lines.append(xml_str)
 
         return "\n".join(lines)
 
-    def save(self, path: str) -> None:
-        """Save the worksheet to a .sm file."""
-        content = self.to_xml_string()
+    # -- Profiling ------------------------------------------------------------
+
+    @contextmanager
+    def profile(
+        self, callback: Callable[[SerializationProfile], Any] | None = None,
+    ) -> Iterator[Profiler]:
+        """Profile the serializations of this worksheet run inside the block.
+
+        Every :meth:`to_xml`, :meth:`to_xml_string` and :meth:`save` records a
+        :class:`~smathpy.profiling.SerializationProfile` (phase timings,
+        region-type timings and counts, ``<e>`` elements, bytes) in the
+        returned profiler's ``runs``, and is passed to *callback*.
+        """
+        profiler = Profiler(callback)
+        previous, self._profiler = self._profiler, profiler
+        try:
+            yield profiler
+        finally:
+            self._profiler = previous
+
+    @contextmanager
+    def _profiled(self, operation: str) -> Iterator[SerializationProfile | None]:
+        """Run one serialization, profiled if a profiler or hook is active.
+
+        Nested calls (``save`` → ``_serialize`` → ``_to_xml``) share the
+        profile of the outermost one.
+        """
+        hook = profiling.get_hook()
+        if self._profile is not None or (self._profiler is None and hook is None):
+            yield self._profile
+            return
+        profile = self._profile = SerializationProfile(operation)
+        start = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            self._profile = None
+        profile.seconds = time.perf_counter() - start
+        if self._profiler is not None:
+            self._profiler.record(profile)
+        if hook is not None:
+            hook(profile)
+
+    def _build_regions_profiled(self, root: ET.Element, profile: SerializationProfile | None,
+                                tracker: memory.Tracker | None) -> None:
+        """Build the regions, timing each for *profile* and tracing its memory for *tracker*."""
+        with phase(profile, "regions"):
+            clock = time.perf_counter
+            for region in self.regions:
+                start = clock()
+                if tracker is not None:
+                    tracker.building(root)
+                self._build_region(root, region)
+                if tracker is not None:
+                    tracker.built(region, root)
+                if profile is not None:
+                    profile.add_region(type(region).__name__, clock() - start)
+        if profile is None:
+            return
+        for region in iter_regions(self.regions):
+            profile.count_region(type(region).__name__)
+        profile.elements = sum(1 for _ in root.iter(f"{{{SMATH_NAMESPACE}}}e"))
+
+    # -- Binary snapshots ------------------------------------------------------
+
+    def dump_binary(self, path: str | os.PathLike[str] | None = None) -> bytes:
+        """Encode the worksheet model as a compact binary snapshot.
+
+        The snapshot keeps settings, regions and layout state; restore it
+        with :meth:`load_binary`. Written to *path* when given.
+        """
+        if self._offsets is not None:
+            self._offsets.flush()
+            self._offsets = None
+        spacings = [
+            self.layout.spacing_of(r) if self.layout is not None else None
+            for r in iter_regions(self.regions)
+        ]
+        data = snapshot.encode(
+            self.settings, self.layout, self._next_top, self._pending_spacing,
+            self._auto_layout, self.regions, spacings,
+        )
+        if path is not None:
+            Path(path).write_bytes(data)
+        return data
+
+    @classmethod
+    def load_binary(cls, source: str | os.PathLike[str] | bytes) -> Worksheet:
+        """Rebuild a worksheet from :meth:`dump_binary` output.
+
+        *source* is the snapshot bytes or a file path (memory-mapped).
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            snap = snapshot.decode(source)
+        else:
+            snap = snapshot.read(source)
+        ws = cls(settings=snap.settings, layout=snap.layout or "stack")
+        ws.regions = snap.regions
+        ws._next_top = snap.next_top
+        ws._pending_spacing = snap.pending_spacing
+        ws._auto_layout = snap.auto_layout
+        if ws.layout is not None:
+            for region, spacing in zip(iter_regions(ws.regions), snap.spacings):
+                if spacing is not None:
+                    ws.layout.track(region, spacing)
+        return ws
+
+    def save(self, path: str, cache: OutputCache | None = None) -> None:
+        """Save the worksheet to a .sm file.
+
+        With a *cache*, unchanged worksheets are not re-serialized: the file
+        is left alone or hard-linked from the cache (see :class:`OutputCache`).
+        """
+        if cache is not None:
+            cache.save(self, path)
+            return
         p = Path(path)
         p.parent.mkdir(parents=True, exist_ok=True)
-        p.write_text(content, encoding="utf-8")
+        self._write(p)
+
+    def _write(self, path: Path, digest: str | None = None) -> None:
+        """Write the serialized worksheet to *path*.
+
+        Lazy pictures are serialized as NUL-delimited placeholders (NUL
+        cannot occur in XML text) and their base64 data is streamed into
+        the file in chunks, so no encoded image is held in memory whole.
+        """
+        with self._profiled("save") as profile:
+            self._streams = []
+            try:
+                content = self._serialize(digest)
+                streams = self._streams
+            finally:
+                self._streams = None
+            parts = content.split("\0")
+            with phase(profile, "write"), open(path, "w", encoding="utf-8") as f:
+                f.write(parts[0])
+                for index, text in zip(parts[1::2], parts[2::2]):
+                    for chunk in streams[int(index)].chunks():
+                        f.write(chunk)
+                    f.write(text)
+            if profile is not None:
+                profile.bytes = os.path.getsize(path)
 
     # -- Internal XML builders -----------------------------------------------
 
     def _assign_ids(self) -> None:
-        """Assign sequential IDs to all regions."""
-        counter = 0
-        for region in self.regions:
+        """Assign sequential IDs to all regions.
+
+        A single recursive pass in document order, descending into nested
+        areas. Each area's terminator gets the id after its last descendant
+        and is placed below the area's content.
+        """
+        self._number(self.regions, 0)
+
+    def _number(self, regions: list[Region], counter: int) -> int:
+        for region in regions:
             region.id = counter
-            counter += 1
-            if isinstance(region, AreaRegion):
-                for child in region.children:
-                    child.id = counter
-                    counter += 1
-                # Terminator ID
-                counter += 1  # reserved for terminator
+            if isinstance(region, FragmentRegion):
+                counter += region.id_count
+            elif isinstance(region, AreaRegion):
+                counter = self._number(region.children, counter + 1)
+                region.terminator_id = counter
+                region.terminator_top = self._terminator_top(region)
+                counter += 1
+            else:
+                counter += 1
+        return counter
 
-    def _build_settings(self, root: ET.Element) -> None:
+    def _terminator_top(self, area: AreaRegion) -> int:
+        """Top of an area's end marker: below its start marker and all children.
+
+        Nested areas must have their own terminator settled first.
+        """
+        gap = self.layout.gap if self.layout is not None else REGION_GAP
+        bottoms = []
+        for child in area.children:
+            if isinstance(child, AreaRegion) and child.terminator_top is not None:
+                bottoms.append(child.terminator_top + AREA_MARKER_HEIGHT)
+            else:
+                bottoms.append(child.top + self._extent(child) - gap)
+        return terminator_top(area, bottoms, gap)
+
+    def _stack_area(self, area: AreaRegion) -> int:
+        """Stack an area's default-positioned children (legacy layout).
+
+        Recurses into nested areas and returns the top of the terminator.
+        """
+        next_top = area.top + AREA_MARKER_HEIGHT
+        bottoms = []
+        for child in area.children:
+            if child.top == DEFAULT_TOP_START:
+                child.top = next_top
+            if isinstance(child, AreaRegion):
+                bottom = self._stack_area(child) + AREA_MARKER_HEIGHT
+            else:
+                if child.left == 0:
+                    child.left = DEFAULT_LEFT
+                bottom = child.top + (child.height or DEFAULT_REGION_HEIGHT)
+            bottoms.append(bottom)
+            next_top = max(next_top, bottom + REGION_GAP)
+        return terminator_top(area, bottoms)
+
+    def _build_settings(self, root: ET.Element, doc_id: str) -> None:
         """Build the <settings> element."""
         s = self.settings
         ns = SMATH_NAMESPACE
@@ -143,7 +901,7 @@ class Worksheet:
         # Identity
         identity_el = ET.SubElement(settings_el, f"{{{ns}}}identity")
         id_el = ET.SubElement(identity_el, f"{{{ns}}}id")
-        id_el.text = s.doc_id
+        id_el.text = doc_id
         rev_el = ET.SubElement(identity_el, f"{{{ns}}}revision")
         rev_el.text = str(s.revision)
 
@@ -238,6 +996,8 @@ class Worksheet:
 
         if isinstance(region, AreaRegion):
             self._build_area_region(parent, region)
+        elif isinstance(region, FragmentRegion):
+            parent.extend(region.iter_elements())
         elif isinstance(region, TextRegion):
             self._build_text_region(parent, region)
         elif isinstance(region, MathRegion):
@@ -346,7 +1106,11 @@ class Worksheet:
             "format": region.format,
             "encoding": "base64",
         })
-        raw_el.text = region.data_base64
+        if region.source is not None and self._streams is not None:
+            raw_el.text = f"\0{len(self._streams)}\0"
+            self._streams.append(region.source)
+        else:
+            raw_el.text = region.encoded()
 
     def _build_area_region(self, parent: ET.Element, region: AreaRegion) -> None:
         ns = SMATH_NAMESPACE
@@ -369,15 +1133,85 @@ class Worksheet:
         for child in region.children:
             self._build_region(region_el, child)
 
-        # Terminator
-        assert region.id is not None
-        term_id = region.id + len(region.children) + 1
+        # Terminator (id and top settled by _assign_ids)
+        assert region.terminator_id is not None and region.terminator_top is not None
         term_attribs = {
-            "id": str(term_id),
-            "top": str(region.top + 100),
+            "id": str(region.terminator_id),
+            "top": str(region.terminator_top),
             "color": region.color,
             "bgColor": region.bg_color,
         }
         term_el = ET.SubElement(region_el, f"{{{ns}}}region", term_attribs)
         term_area = ET.SubElement(term_el, f"{{{ns}}}area")
         term_area.set("terminator", "true")
+
+
+def _heading_rank(region: Region) -> int | None:
+    """0 for titles, 1 for section dividers, ``None`` for other regions."""
+    if not isinstance(region, TextRegion):
+        return None
+    if region.font_size > FONT_DEFAULT:
+        return 0
+    if region.border:
+        return 1
+    return None
+
+
+def _slice_regions(regions: list[Region], keep: set[int]) -> list[Region]:
+    """Copies of the regions in *keep* (by id) with their enclosing headings.
+
+    A heading encloses everything up to the next heading of the same or a
+    higher rank, and is kept only if it encloses a kept region.
+    """
+    result: list[Region] = []
+    headings: list[tuple[int, Region]] = []  # open headings not emitted yet
+    for region in regions:
+        rank = _heading_rank(region)
+        if rank is not None and id(region) not in keep:
+            while headings and headings[-1][0] >= rank:
+                headings.pop()
+            headings.append((rank, region))
+            continue
+
+        if isinstance(region, AreaRegion):
+            children = _slice_regions(region.children, keep)
+            if not children:
+                continue
+            kept: Region = dataclasses.replace(region, top=DEFAULT_TOP_START, children=children)
+        elif id(region) in keep:
+            kept = dataclasses.replace(region, top=DEFAULT_TOP_START)
+        else:
+            continue
+        result.extend(dataclasses.replace(h, top=DEFAULT_TOP_START) for _, h in headings)
+        headings.clear()
+        result.append(kept)
+    return result
+
+
+def _copy_region(region: Region) -> Region:
+    """Shallow copy of a region with its own lists and dicts.
+
+    Expressions are immutable once built and stay shared.
+    """
+    dup = copy.copy(region)
+    for f in dataclasses.fields(dup):
+        value = getattr(dup, f.name)
+        if isinstance(value, (list, dict)):
+            setattr(dup, f.name, value.copy())
+    return dup
+
+
+def _copy_tree(region: Region) -> Region:
+    """Copy a region, including the children of areas."""
+    dup = _copy_region(region)
+    if isinstance(dup, AreaRegion):
+        dup.children = [_copy_tree(c) for c in dup.children]
+    return dup
+
+
+def _move_tree(region: Region, delta: int | None) -> None:
+    """Shift a region (and area children) down by *delta*, or reset to auto-placement."""
+    region.top = DEFAULT_TOP_START if delta is None else region.top + delta
+    if isinstance(region, AreaRegion):
+        for child in region.children:
+            _move_tree(child, delta)
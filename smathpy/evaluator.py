@@ -0,0 +1,1057 @@
+"""Offline numeric evaluation of math regions.
+
+:class:`Evaluator` interprets the RPN of math regions in document order, the
+way SMath Studio does on recalculation, so results can be written into the
+file and show up before SMath recalculates::
+
+    ev = Evaluator()
+    for region in regions:
+        value = ev.run(region)        # assignments update ev.variables
+    result_elements(value, decimal_places=4)
+
+Values are floats, :class:`Quantity` (a float with SI dimensions),
+:class:`Matrix` and strings. Anything that needs the symbolic engine
+(derivatives, integrals, unknown functions or names) raises
+:class:`EvaluationError`.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Sequence
+from dataclasses import dataclass, field
+from typing import Any, Union
+
+from . import numeric
+from .expression.builder import Expr
+from .expression.elements import Element, function, operand, operator, string_operand, unit_operand
+from .expression.tree import _NUMBER_RE, Node, to_tree
+from .regions.math_region import MathRegion
+from .units.si import BASE_UNITS, DERIVED_UNITS, DIMENSIONLESS, UNITS, Dims
+
+
+class EvaluationError(ValueError):
+    """An expression cannot be evaluated numerically."""
+
+
+@dataclass(frozen=True, slots=True)
+class Quantity:
+    """A number with SI dimensions; ``value`` is in base units."""
+
+    value: float
+    dims: Dims
+
+
+@dataclass(slots=True)
+class Matrix:
+    """A matrix of values stored row by row (SMath indices start at 1)."""
+
+    rows: int
+    cols: int
+    cells: list[Any]
+
+    def get(self, i: int, j: int) -> Value:
+        return self.cells[(i - 1) * self.cols + j - 1]
+
+    @classmethod
+    def vector(cls, cells: Sequence[Value]) -> Matrix:
+        return cls(len(cells), 1, list(cells))
+
+
+Value = Union[float, Quantity, Matrix, str]
+
+CONSTANTS: dict[str, float] = {"π": math.pi, "e": math.e}
+
+
+@dataclass(slots=True)
+class UserFunction:
+    """A function defined in the worksheet with ``f(x, y) := body``.
+
+    ``reads`` holds the names in the body other than the parameters; the
+    memo (argument key -> result) is cleared when one of them is rebound.
+    """
+
+    name: str
+    params: list[str]
+    body: Node
+    reads: frozenset[str] = frozenset()
+    memo: OrderedDict[Hashable, Value] = field(default_factory=OrderedDict, repr=False)
+
+    @classmethod
+    def define(cls, name: str, params: list[str], body: Node) -> UserFunction:
+        names: set[str] = set()
+        todo = [body]
+        while todo:
+            node = todo.pop()
+            if node.is_name() or node.type == "function":
+                names.add(node.value)
+            todo.extend(node.children)
+        return cls(name, params, body, frozenset(names.difference(params)))
+
+
+def _key(value: Value) -> Hashable:
+    """Hashable memo key of an argument value."""
+    if type(value) is Matrix:
+        return (value.rows, value.cols, tuple(_key(c) for c in value.cells))
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Scalars and units
+# ---------------------------------------------------------------------------
+
+def _quantity(value: float, dims: Dims) -> float | Quantity:
+    return value if dims == DIMENSIONLESS else Quantity(value, dims)
+
+
+def _dims(x: Value) -> Dims:
+    if type(x) is Quantity:
+        return x.dims
+    if type(x) is float:
+        return DIMENSIONLESS
+    raise EvaluationError(f"expected a number, got {_describe(x)}")
+
+
+def _magnitude(x: Value) -> float:
+    if type(x) is Quantity:
+        return x.value
+    if type(x) is float:
+        return x
+    raise EvaluationError(f"expected a number, got {_describe(x)}")
+
+
+def _number(x: Value) -> float:
+    """A dimensionless scalar."""
+    if type(x) is float:
+        return x
+    if type(x) is Quantity:
+        raise EvaluationError("expected a number without units")
+    raise EvaluationError(f"expected a number, got {_describe(x)}")
+
+
+def _index(x: Value) -> int:
+    v = _number(x)
+    if v != int(v) or v < 1:
+        raise EvaluationError(f"invalid index {v:g}")
+    return int(v)
+
+
+def _truth(x: Value) -> bool:
+    return _number(x) != 0.0
+
+
+def _describe(x: Value) -> str:
+    if type(x) is Matrix:
+        return f"a {x.rows}x{x.cols} matrix"
+    if type(x) is str:
+        return "a string"
+    return "a number"
+
+
+def _scaled_dims(dims: Dims, p: float) -> Dims:
+    scaled = [d * p for d in dims]
+    if any(s != int(s) for s in scaled):
+        raise EvaluationError("units cannot be raised to a fractional power")
+    return tuple(int(s) for s in scaled)  # type: ignore[return-value]
+
+
+# ---------------------------------------------------------------------------
+# Arithmetic
+# ---------------------------------------------------------------------------
+
+def _add(a: Value, b: Value, sign: float = 1.0) -> Value:
+    if type(a) is Matrix or type(b) is Matrix:
+        if type(a) is not Matrix or type(b) is not Matrix or (a.rows, a.cols) != (b.rows, b.cols):
+            raise EvaluationError("matrix dimensions do not match")
+        return Matrix(a.rows, a.cols, [_add(x, y, sign) for x, y in zip(a.cells, b.cells)])
+    dims = _dims(a)
+    if _dims(b) != dims:
+        raise EvaluationError("units do not match")
+    return _quantity(_magnitude(a) + sign * _magnitude(b), dims)
+
+
+def _sub(a: Value, b: Value) -> Value:
+    return _add(a, b, -1.0)
+
+
+def _neg(a: Value) -> Value:
+    if type(a) is Matrix:
+        return Matrix(a.rows, a.cols, [_neg(x) for x in a.cells])
+    return _quantity(-_magnitude(a), _dims(a))
+
+
+def _mul(a: Value, b: Value) -> Value:
+    if type(a) is Matrix:
+        if type(b) is Matrix:
+            return _matmul(a, b)
+        return Matrix(a.rows, a.cols, [_mul(x, b) for x in a.cells])
+    if type(b) is Matrix:
+        return Matrix(b.rows, b.cols, [_mul(a, x) for x in b.cells])
+    da, db = _dims(a), _dims(b)
+    return _quantity(_magnitude(a) * _magnitude(b), tuple(x + y for x, y in zip(da, db)))
+
+
+def _div(a: Value, b: Value) -> Value:
+    if type(b) is Matrix:
+        return _mul(a, _power(b, -1.0))
+    if type(a) is Matrix:
+        return Matrix(a.rows, a.cols, [_div(x, b) for x in a.cells])
+    mb = _magnitude(b)
+    if mb == 0.0:
+        raise EvaluationError("division by zero")
+    da, db = _dims(a), _dims(b)
+    return _quantity(_magnitude(a) / mb, tuple(x - y for x, y in zip(da, db)))
+
+
+def _power(a: Value, b: Value) -> Value:
+    p = _number(b)
+    if type(a) is Matrix:
+        if a.rows != a.cols or p != int(p):
+            raise EvaluationError("only square matrices can be raised to integer powers")
+        base = _inverse(a) if p < 0 else a
+        result = _identity(a.rows)
+        for _ in range(abs(int(p))):
+            result = _matmul(result, base)
+        return result
+    try:
+        value = _magnitude(a) ** p
+    except ZeroDivisionError:
+        raise EvaluationError("division by zero") from None
+    if type(value) is complex:
+        raise EvaluationError("complex results are not supported")
+    return _quantity(value, _scaled_dims(_dims(a), p))
+
+
+def _factorial(a: Value) -> Value:
+    n = _number(a)
+    if n != int(n) or n < 0:
+        raise EvaluationError("factorial needs a non-negative integer")
+    return float(math.factorial(int(n)))
+
+
+def _compare(test: Callable[[float, float], bool]) -> Callable[[Value, Value], float]:
+    def compare(a: Value, b: Value) -> float:
+        if _dims(a) != _dims(b):
+            raise EvaluationError("units do not match")
+        return 1.0 if test(_magnitude(a), _magnitude(b)) else 0.0
+    return compare
+
+
+def _equal(a: Value, b: Value) -> float:
+    if type(a) is str or type(b) is str:
+        return 1.0 if a == b else 0.0
+    return _compare(lambda x, y: x == y)(a, b)
+
+
+def _not_equal(a: Value, b: Value) -> float:
+    return 1.0 - _equal(a, b)
+
+
+_BINARY: dict[str, Callable[[Value, Value], Value]] = {
+    "+": _add,
+    "-": _sub,
+    "*": _mul,
+    "/": _div,
+    "^": _power,
+    ">": _compare(lambda x, y: x > y),
+    "<": _compare(lambda x, y: x < y),
+    "≥": _compare(lambda x, y: x >= y),
+    "≤": _compare(lambda x, y: x <= y),
+    "=": _equal,
+    "≡": _equal,  # boolean equality, as SMath evaluates it
+    "≠": _not_equal,
+    "&": lambda a, b: 1.0 if _truth(a) and _truth(b) else 0.0,
+    "|": lambda a, b: 1.0 if _truth(a) or _truth(b) else 0.0,
+}
+
+_UNARY: dict[str, Callable[[Value], Value]] = {
+    "-": _neg,
+    "!": _factorial,
+    "¬": lambda a: 0.0 if _truth(a) else 1.0,
+}
+
+
+# ---------------------------------------------------------------------------
+# Matrices
+# ---------------------------------------------------------------------------
+
+def _matrix(x: Value) -> Matrix:
+    if type(x) is not Matrix:
+        raise EvaluationError(f"expected a matrix, got {_describe(x)}")
+    return x
+
+
+def _identity(n: int) -> Matrix:
+    return Matrix(n, n, [1.0 if i == j else 0.0 for i in range(n) for j in range(n)])
+
+
+def _matmul(a: Matrix, b: Matrix) -> Value:
+    if a.cols != b.rows:
+        raise EvaluationError("matrix dimensions do not match")
+    cells: list[Value] = []
+    for i in range(a.rows):
+        row = a.cells[i * a.cols:(i + 1) * a.cols]
+        for j in range(b.cols):
+            total: Value = _mul(row[0], b.cells[j])
+            for k in range(1, a.cols):
+                total = _add(total, _mul(row[k], b.cells[k * b.cols + j]))
+            cells.append(total)
+    if a.rows == 1 and b.cols == 1:
+        return cells[0]  # row vector times column vector
+    return Matrix(a.rows, b.cols, cells)
+
+
+def _elimination(m: Matrix) -> tuple[list[list[float]], list[list[float]], float]:
+    """Gauss-Jordan elimination with partial pivoting: (reduced, inverse, det)."""
+    n = m.rows
+    a = [[_number(m.cells[i * n + j]) for j in range(n)] for i in range(n)]
+    inv = [[1.0 if i == j else 0.0 for j in range(n)] for i in range(n)]
+    det = 1.0
+    for c in range(n):
+        p = max(range(c, n), key=lambda r: abs(a[r][c]))
+        if a[p][c] == 0.0:
+            return a, inv, 0.0
+        if p != c:
+            a[p], a[c] = a[c], a[p]
+            inv[p], inv[c] = inv[c], inv[p]
+            det = -det
+        pivot = a[c][c]
+        det *= pivot
+        a[c] = [x / pivot for x in a[c]]
+        inv[c] = [x / pivot for x in inv[c]]
+        for r in range(n):
+            f = a[r][c]
+            if r != c and f != 0.0:
+                a[r] = [x - f * y for x, y in zip(a[r], a[c])]
+                inv[r] = [x - f * y for x, y in zip(inv[r], inv[c])]
+    return a, inv, det
+
+
+def _inverse(m: Matrix) -> Matrix:
+    if m.rows != m.cols:
+        raise EvaluationError("only square matrices can be inverted")
+    _, inv, det = _elimination(m)
+    if det == 0.0:
+        raise EvaluationError("matrix is singular")
+    return Matrix(m.rows, m.cols, [x for row in inv for x in row])
+
+
+def _el(m: Value, i: Value, j: Value | None = None) -> Value:
+    m = _matrix(m)
+    if j is None:
+        k = _index(i)
+        if k > m.rows * m.cols or (m.rows > 1 and m.cols > 1):
+            raise EvaluationError("index out of range")
+        return m.cells[k - 1]
+    r, c = _index(i), _index(j)
+    if r > m.rows or c > m.cols:
+        raise EvaluationError("index out of range")
+    return m.get(r, c)
+
+
+def _with_element(m: Value | None, indices: list[int], value: Value) -> Matrix:
+    """Copy of *m* with one element set, growing it (zero-filled) as needed."""
+    if type(m) is not Matrix:
+        m = Matrix(0, 0, [])
+    if len(indices) == 1:
+        if m.cols > 1 and m.rows > 1:
+            raise EvaluationError("a matrix needs two indices")
+        if m.rows == 1 and m.cols > 1:
+            r, c = 1, indices[0]
+        else:
+            r, c = indices[0], 1
+    else:
+        r, c = indices
+    rows, cols = max(m.rows, r), max(m.cols, c)
+    if (rows, cols) == (m.rows, m.cols):
+        cells = list(m.cells)
+    else:
+        cells = [
+            m.cells[i * m.cols + j] if i < m.rows and j < m.cols else 0.0
+            for i in range(rows) for j in range(cols)
+        ]
+    cells[(r - 1) * cols + c - 1] = value
+    return Matrix(rows, cols, cells)
+
+
+def _mat(*args: Value) -> Matrix:
+    rows, cols = _index(args[-2]), _index(args[-1])
+    if rows * cols != len(args) - 2:
+        raise EvaluationError("matrix size does not match its elements")
+    return Matrix(rows, cols, list(args[:-2]))
+
+
+def _range(start: Value, end: Value, second: Value | None = None) -> Matrix:
+    """``range(a, b)`` or ``range(a, b, second)``; the third value is the next element."""
+    a, b = _magnitude(start), _magnitude(end)
+    dims = _dims(start)
+    if _dims(end) != dims:
+        raise EvaluationError("units do not match")
+    if second is None:
+        step = 1.0 if b >= a else -1.0
+    else:
+        step = _magnitude(second) - a
+    if step == 0.0 or (b - a) * step < 0:
+        raise EvaluationError("invalid range")
+    count = int(math.floor((b - a) / step + 1e-9)) + 1
+    return Matrix.vector([_quantity(a + k * step, dims) for k in range(count)])
+
+
+def _row(m: Value, i: Value) -> Matrix:
+    m = _matrix(m)
+    r = _index(i)
+    if r > m.rows:
+        raise EvaluationError("index out of range")
+    return Matrix(1, m.cols, m.cells[(r - 1) * m.cols:r * m.cols])
+
+
+def _col(m: Value, j: Value) -> Matrix:
+    m = _matrix(m)
+    c = _index(j)
+    if c > m.cols:
+        raise EvaluationError("index out of range")
+    return Matrix.vector(m.cells[c - 1::m.cols])
+
+
+def _transpose(m: Value) -> Matrix:
+    m = _matrix(m)
+    return Matrix(m.cols, m.rows, [m.cells[i * m.cols + j] for j in range(m.cols) for i in range(m.rows)])
+
+
+def _det(m: Value) -> float:
+    m = _matrix(m)
+    if m.rows != m.cols:
+        raise EvaluationError("determinant of a non-square matrix")
+    return _elimination(m)[2]
+
+
+def _tr(m: Value) -> Value:
+    m = _matrix(m)
+    total: Value = m.cells[0]
+    for i in range(2, min(m.rows, m.cols) + 1):
+        total = _add(total, m.get(i, i))
+    return total
+
+
+def _augment(*ms: Value) -> Matrix:
+    mats = [_matrix(m) for m in ms]
+    if len({m.rows for m in mats}) != 1:
+        raise EvaluationError("matrices must have the same number of rows")
+    rows = mats[0].rows
+    cells = [c for i in range(rows) for m in mats for c in m.cells[i * m.cols:(i + 1) * m.cols]]
+    return Matrix(rows, sum(m.cols for m in mats), cells)
+
+
+def _stack(*ms: Value) -> Matrix:
+    mats = [_matrix(m) for m in ms]
+    if len({m.cols for m in mats}) != 1:
+        raise EvaluationError("matrices must have the same number of columns")
+    return Matrix(sum(m.rows for m in mats), mats[0].cols, [c for m in mats for c in m.cells])
+
+
+def _extremum(pick: Callable[..., float]) -> Callable[..., Value]:
+    def extremum(*args: Value) -> Value:
+        items = [c for a in args for c in (a.cells if type(a) is Matrix else [a])]
+        dims = _dims(items[0])
+        if any(_dims(x) != dims for x in items):
+            raise EvaluationError("units do not match")
+        return _quantity(pick(_magnitude(x) for x in items), dims)
+    return extremum
+
+
+def _scalar(fn: Callable[[float], float]) -> Callable[[Value], float]:
+    def apply(x: Value) -> float:
+        try:
+            return float(fn(_number(x)))
+        except (ValueError, OverflowError) as exc:
+            raise EvaluationError(str(exc)) from None
+    return apply
+
+
+def _abs(x: Value) -> Value:
+    if type(x) is Matrix:
+        if x.rows > 1 and x.cols > 1:
+            return _det(x)
+        total: Value = _mul(x.cells[0], x.cells[0])
+        for c in x.cells[1:]:
+            total = _add(total, _mul(c, c))
+        return _power(total, 0.5)  # vector norm
+    return _quantity(abs(_magnitude(x)), _dims(x))
+
+
+def _round(x: Value, places: Value | None = None) -> Value:
+    n = 0 if places is None else int(_number(places))
+    return _quantity(float(round(_magnitude(x), n)), _dims(x))
+
+
+def _mod(a: Value, b: Value) -> Value:
+    if _dims(a) != _dims(b):
+        raise EvaluationError("units do not match")
+    mb = _magnitude(b)
+    if mb == 0.0:
+        raise EvaluationError("division by zero")
+    return _quantity(math.fmod(_magnitude(a), mb), _dims(a))
+
+
+def _log(x: Value, base: Value | None = None) -> float:
+    v = _number(x)
+    if v <= 0.0:
+        raise EvaluationError("logarithm of a non-positive number")
+    return math.log10(v) if base is None else math.log(v, _number(base))
+
+
+def _length(x: Value) -> float:
+    if type(x) is Matrix:
+        return float(x.rows * x.cols)
+    if type(x) is str:
+        return float(len(x))
+    return 1.0
+
+
+def _num2str(x: Value) -> str:
+    v = _number(x)
+    return str(int(v)) if v == int(v) else repr(v)
+
+
+def _string(x: Value) -> str:
+    if type(x) is not str:
+        raise EvaluationError(f"expected a string, got {_describe(x)}")
+    return x
+
+
+# ---------------------------------------------------------------------------
+# NumPy-backed built-ins (see smathpy.numeric)
+# ---------------------------------------------------------------------------
+
+def _numpy() -> Any:
+    try:
+        return numeric._numpy()
+    except ImportError as exc:
+        raise EvaluationError(str(exc)) from None
+
+
+def _array(x: Value) -> tuple[Any, Dims]:
+    """Magnitudes of a matrix (or scalar) as an array, with their common units."""
+    np = _numpy()
+    cells = x.cells if type(x) is Matrix else [x]
+    dims = _dims(cells[0])
+    if any(_dims(c) != dims for c in cells):
+        raise EvaluationError("units do not match")
+    values = np.array([_magnitude(c) for c in cells])
+    if type(x) is Matrix and x.cols > 1 and x.rows > 1:
+        values = values.reshape(x.rows, x.cols)
+    return values, dims
+
+
+def _from_array(a: Any, dims: Dims) -> Value:
+    np = _numpy()
+    if np.iscomplexobj(a):
+        raise EvaluationError("complex results are not supported")
+    if np.ndim(a) == 0:
+        return _quantity(float(a), dims)
+    a = np.atleast_2d(a.T).T  # vectors become columns
+    return Matrix(a.shape[0], a.shape[1], [_quantity(float(v), dims) for v in a.ravel()])
+
+
+def _interpolator(fn: Callable[[Any, Any, Any], Any]) -> Callable[[Value, Value, Value], Value]:
+    def interpolate(vx: Value, vy: Value, x: Value) -> Value:
+        xs, x_dims = _array(vx)
+        ys, y_dims = _array(vy)
+        at, at_dims = _array(x)
+        if at_dims != x_dims:
+            raise EvaluationError("units do not match")
+        try:
+            result = fn(xs, ys, at if type(x) is Matrix else at[0])
+        except ValueError as exc:
+            raise EvaluationError(str(exc)) from None
+        return _from_array(result, y_dims)
+    return interpolate
+
+
+def _polyroots(v: Value) -> Value:
+    coeffs, dims = _array(v)
+    if dims != DIMENSIONLESS:
+        raise EvaluationError("expected a number without units")
+    try:
+        return _from_array(numeric.polyroots(coeffs), DIMENSIONLESS)
+    except ValueError as exc:
+        raise EvaluationError(str(exc)) from None
+
+
+def _csort(m: Value, j: Value) -> Matrix:
+    m = _matrix(m)
+    c = _index(j)
+    if c > m.cols:
+        raise EvaluationError("index out of range")
+    keys, _ = _array(_col(m, j))
+    rows = _numpy().argsort(keys, kind="stable")
+    return Matrix(m.rows, m.cols, [x for r in rows for x in m.cells[r * m.cols:(r + 1) * m.cols]])
+
+
+# Built-in functions evaluated on already evaluated arguments. Control
+# structures (if, for, while, line, sum, product) are part of Evaluator.
+BUILTINS: dict[str, Callable[..., Value]] = {
+    "abs": _abs,
+    "sign": lambda x: float((_magnitude(x) > 0) - (_magnitude(x) < 0)),
+    "sqrt": lambda x: _power(x, 0.5),
+    "exp": _scalar(math.exp),
+    "ln": _scalar(math.log),
+    "log": _log,
+    "sin": _scalar(math.sin),
+    "cos": _scalar(math.cos),
+    "tan": _scalar(math.tan),
+    "asin": _scalar(math.asin),
+    "acos": _scalar(math.acos),
+    "atan": _scalar(math.atan),
+    "ceil": lambda x: _quantity(float(math.ceil(_magnitude(x))), _dims(x)),
+    "floor": lambda x: _quantity(float(math.floor(_magnitude(x))), _dims(x)),
+    "round": _round,
+    "mod": _mod,
+    "max": _extremum(max),
+    "min": _extremum(min),
+    "re": lambda x: x,
+    "im": lambda x: _quantity(0.0, _dims(x)),
+    "eval": lambda x: x,
+    "mat": _mat,
+    "el": _el,
+    "range": _range,
+    "rows": lambda m: float(_matrix(m).rows),
+    "cols": lambda m: float(_matrix(m).cols),
+    "length": _length,
+    "row": _row,
+    "col": _col,
+    "transpose": _transpose,
+    "det": _det,
+    "tr": _tr,
+    "identity": lambda n: _identity(_index(n)),
+    "augment": _augment,
+    "stack": _stack,
+    "reverse": lambda m: Matrix(_matrix(m).rows, m.cols, m.cells[::-1]),
+    "concat": lambda *s: "".join(_string(x) for x in s),
+    "num2str": _num2str,
+    "linterp": _interpolator(numeric.linterp),
+    "cinterp": _interpolator(numeric.cinterp),
+    "polyroots": _polyroots,
+    "csort": _csort,
+}
+
+
+# ---------------------------------------------------------------------------
+# Evaluator
+# ---------------------------------------------------------------------------
+
+class Evaluator:
+    """Evaluate expressions against the variables and functions defined so far.
+
+    Assignments at the top level update :attr:`variables`; inside a user
+    function they bind local names. ``max_iterations`` bounds the total
+    number of loop iterations of a single :meth:`evaluate` call.
+
+    User functions only see their arguments and top-level names, so their
+    results are memoized by argument (up to ``memo_size`` per function,
+    least recently used first out). Rebinding a top-level name or
+    redefining a function clears the memos of the functions that read it,
+    directly or through other functions. Nested calls deeper than
+    ``max_depth`` raise :class:`EvaluationError`.
+    """
+
+    max_iterations = 1_000_000
+    max_depth = 100
+    memo_size = 4096
+
+    def __init__(self) -> None:
+        self.variables: dict[str, Value] = {}
+        self.functions: dict[tuple[str, int], UserFunction] = {}
+        self._locals: dict[str, Value] | None = None
+        self._iterations = 0
+        self._depth = 0
+        self._readers: dict[str, set[tuple[str, int]]] = {}  # name -> functions reading it
+
+    def run(self, region: MathRegion) -> Value | None:
+        """Evaluate a math region; ``None`` for regions without a value."""
+        if region.expr is None:
+            return None
+        return self.evaluate(region.expr)
+
+    def evaluate(self, expr: Expr) -> Value | None:
+        """Evaluate an expression (``None`` for function definitions)."""
+        try:
+            root = to_tree(expr)
+        except ValueError as exc:
+            raise EvaluationError(str(exc)) from None
+        self._iterations = 0
+        try:
+            return self._eval(root)
+        except RecursionError:
+            raise EvaluationError("expression is nested too deeply") from None
+
+    # -- names -----------------------------------------------------------------
+
+    def _lookup(self, name: str) -> Value:
+        if self._locals is not None and name in self._locals:
+            return self._locals[name]
+        if name in self.variables:
+            return self.variables[name]
+        if name in CONSTANTS:
+            return CONSTANTS[name]
+        raise EvaluationError(f"'{name}' is not defined")
+
+    def _scope(self) -> dict[str, Value]:
+        return self._locals if self._locals is not None else self.variables
+
+    def _bind(self, name: str, value: Value | None) -> None:
+        """Bind (or with ``None`` unbind) a name in the current scope."""
+        scope = self._scope()
+        if value is None:
+            scope.pop(name, None)
+        else:
+            scope[name] = value
+        if scope is self.variables:
+            self._invalidate(name)
+
+    def _invalidate(self, name: str) -> None:
+        """Clear the memos of functions that depend on a rebound top-level name."""
+        todo = [name]
+        seen = set(todo)
+        while todo:
+            for key in self._readers.get(todo.pop(), ()):
+                fn = self.functions.get(key)
+                if fn is not None:
+                    fn.memo.clear()
+                    if fn.name not in seen:
+                        seen.add(fn.name)
+                        todo.append(fn.name)
+
+    def _tick(self) -> None:
+        self._iterations += 1
+        if self._iterations > self.max_iterations:
+            raise EvaluationError(f"more than {self.max_iterations} loop iterations")
+
+    # -- evaluation ------------------------------------------------------------
+
+    def _eval(self, node: Node) -> Value:
+        e = node.element
+        t = e.type
+        if t == "operand":
+            if e.style == "unit":
+                try:
+                    factor, dims = UNITS[e.value]
+                except KeyError:
+                    raise EvaluationError(f"unknown unit '{e.value}'") from None
+                return _quantity(factor, dims)
+            if e.style == "string":
+                return e.value
+            v = e.value
+            if _NUMBER_RE.match(v) or (v[:1] == "-" and _NUMBER_RE.match(v[1:])):
+                return float(v)  # num() writes negative literals as "-7"
+            return self._lookup(v)
+        if t == "bracket":
+            return self._eval(node.children[0])
+        if t == "operator":
+            return self._operator(node)
+        if t == "function":
+            return self._function(node)
+        raise EvaluationError(f"unsupported element '{e.value}'")
+
+    def _operator(self, node: Node) -> Value:
+        op = node.element.value
+        children = node.children
+        if op == ":" and len(children) == 2:
+            return self._assign(children[0], children[1])  # type: ignore[return-value]
+        if len(children) == 1 and op in _UNARY:
+            return _UNARY[op](self._eval(children[0]))
+        if len(children) == 2 and op in _BINARY:
+            return _BINARY[op](self._eval(children[0]), self._eval(children[1]))
+        raise EvaluationError(f"operator '{op}' is not supported")
+
+    def _assign(self, lhs: Node, rhs: Node) -> Value | None:
+        if lhs.is_name():
+            value = self._eval(rhs)
+            self._bind(lhs.value, value)
+            return value
+        if lhs.type == "function" and lhs.value == "el" and len(lhs.children) in (2, 3):
+            target = lhs.children[0]
+            if not target.is_name():
+                raise EvaluationError("element assignment needs a variable")
+            indices = [_index(self._eval(c)) for c in lhs.children[1:]]
+            value = self._eval(rhs)
+            try:
+                current: Value | None = self._lookup(target.value)
+            except EvaluationError:
+                current = None
+            self._bind(target.value, _with_element(current, indices, value))
+            return value
+        if lhs.type == "function" and all(c.is_name() for c in lhs.children):
+            fn = UserFunction.define(lhs.value, [c.value for c in lhs.children], rhs)
+            key = (fn.name, len(fn.params))
+            self.functions[key] = fn
+            for name in fn.reads:
+                self._readers.setdefault(name, set()).add(key)
+            self._invalidate(fn.name)
+            return None
+        raise EvaluationError("unsupported assignment target")
+
+    def _function(self, node: Node) -> Value:
+        name = node.element.value
+        children = node.children
+        user = self.functions.get((name, len(children)))
+        if user is not None:
+            return self._call(user, [self._eval(c) for c in children])
+        control = self._CONTROL.get(name)
+        if control is not None:
+            return control(self, children)
+        builtin = BUILTINS.get(name)
+        if builtin is None:
+            raise EvaluationError(f"function '{name}' is not supported")
+        args = [self._eval(c) for c in children]
+        try:
+            return builtin(*args)
+        except TypeError:
+            raise EvaluationError(f"wrong number of arguments for '{name}'") from None
+
+    def _call(self, fn: UserFunction, args: list[Value]) -> Value:
+        key = tuple(_key(a) for a in args)
+        memo = fn.memo
+        value = memo.get(key)
+        if value is not None:
+            memo.move_to_end(key)
+            return value
+        if self._depth >= self.max_depth:
+            raise EvaluationError(f"'{fn.name}' recurses deeper than {self.max_depth} calls")
+        saved, self._locals = self._locals, dict(zip(fn.params, args))
+        self._depth += 1
+        try:
+            value = self._eval(fn.body)
+        finally:
+            self._locals = saved
+            self._depth -= 1
+        memo[key] = value
+        if len(memo) > self.memo_size:
+            memo.popitem(last=False)
+        return value
+
+    # -- control structures ----------------------------------------------------
+
+    def _if(self, children: list[Node]) -> Value:
+        if len(children) != 3:
+            raise EvaluationError("if needs three arguments")
+        cond, yes, no = children
+        return self._eval(yes if _truth(self._eval(cond)) else no)
+
+    def _while(self, children: list[Node]) -> Value:
+        cond, body = children
+        value: Value = 0.0
+        while _truth(self._eval(cond)):
+            self._tick()
+            value = self._eval(body)
+        return value
+
+    def _for(self, children: list[Node]) -> Value:
+        value: Value = 0.0
+        if len(children) == 3:
+            var, items, body = children
+            if not var.is_name():
+                raise EvaluationError("for needs a loop variable")
+            seq = self._eval(items)
+            for item in (seq.cells if type(seq) is Matrix else [seq]):
+                self._tick()
+                self._bind(var.value, item)
+                value = self._eval(body)
+            return value
+        init, cond, step, body = children
+        self._eval(init)
+        while _truth(self._eval(cond)):
+            self._tick()
+            value = self._eval(body)
+            self._eval(step)
+        return value
+
+    def _line(self, children: list[Node]) -> Value:
+        value: Value = 0.0
+        for statement in children[:-2]:
+            result = self._eval(statement)
+            if result is not None:  # function definitions have no value
+                value = result
+        return value
+
+    def _accumulate(self, children: list[Node], combine: Callable[[Value, Value], Value],
+                    empty: float) -> Value:
+        body, var, start, end = children
+        if not var.is_name():
+            raise EvaluationError("sum and product need a bound variable")
+        first, last = _index_range(self._eval(start), self._eval(end))
+        saved = self._scope().get(var.value)
+        total: Value | None = None
+        try:
+            for k in range(first, last + 1):
+                self._tick()
+                self._bind(var.value, float(k))
+                term = self._eval(body)
+                total = term if total is None else combine(total, term)
+        finally:
+            self._bind(var.value, saved)
+        return empty if total is None else total
+
+    def _sum(self, children: list[Node]) -> Value:
+        return self._accumulate(children, _add, 0.0)
+
+    def _product(self, children: list[Node]) -> Value:
+        return self._accumulate(children, _mul, 1.0)
+
+    def _solve(self, children: list[Node]) -> Value:
+        """``solve(f, x, a, b)``: roots of ``f = 0`` (or of an equation) in ``[a, b]``."""
+        if len(children) != 4 or not children[1].is_name():
+            raise EvaluationError("solve needs an expression, a variable and an interval")
+        body, var, lo, hi = children
+        if body.type == "operator" and body.value in ("=", "≡") and len(body.children) == 2:
+            body = Node(operator("-", 2), body.children)
+        a, b = self._eval(lo), self._eval(hi)
+        dims = _dims(a)
+        if _dims(b) != dims:
+            raise EvaluationError("units do not match")
+        np = _numpy()
+        saved = self._scope().get(var.value)
+
+        def f(x: float) -> float:
+            self._tick()
+            self._bind(var.value, _quantity(float(x), dims))
+            return _magnitude(self._eval(body))
+
+        try:
+            roots = numeric.solve(np.vectorize(f, otypes=[float]), _magnitude(a), _magnitude(b))
+        finally:
+            self._bind(var.value, saved)
+        if roots.size == 0:
+            raise EvaluationError("no roots found in the interval")
+        return _from_array(roots[0] if roots.size == 1 else roots, dims)
+
+    _CONTROL: dict[str, Callable[[Evaluator, list[Node]], Value]] = {
+        "if": _if,
+        "while": _while,
+        "for": _for,
+        "line": _line,
+        "sum": _sum,
+        "product": _product,
+        "solve": _solve,
+    }
+
+
+def _index_range(start: Value, end: Value) -> tuple[int, int]:
+    a, b = _number(start), _number(end)
+    if a != int(a) or b != int(b):
+        raise EvaluationError("summation bounds must be integers")
+    return int(a), int(b)
+
+
+# ---------------------------------------------------------------------------
+# Result formatting
+# ---------------------------------------------------------------------------
+
+def convert(value: Value, unit: Value) -> Value:
+    """Express *value* as a multiple of *unit* (a contract unit)."""
+    if type(value) is Matrix:
+        return Matrix(value.rows, value.cols, [convert(x, unit) for x in value.cells])
+    result = _div(value, unit)
+    if type(result) is Quantity:
+        raise EvaluationError("result units do not match the contract unit")
+    return result
+
+
+def result_elements(
+    value: Value,
+    decimal_places: int = 4,
+    significant_digits: bool = False,
+    trailing_zeros: bool = False,
+    exponential_threshold: int = 5,
+) -> list[Element]:
+    """RPN elements of a numeric result as SMath stores it in ``<result>``.
+
+    Numbers are rounded to *decimal_places* (significant digits with
+    *significant_digits*) and written as ``m·10^k`` when the exponent
+    reaches *exponential_threshold*. Negative values end in a unary minus;
+    dimensioned values are multiplied by their SI units.
+    """
+    fmt = (decimal_places, significant_digits, trailing_zeros, exponential_threshold)
+    if type(value) is Matrix:
+        elements: list[Element] = []
+        for cell in value.cells:
+            elements.extend(_scalar_elements(cell, fmt))
+        elements.append(operand(value.rows))
+        elements.append(operand(value.cols))
+        elements.append(function("mat", len(value.cells) + 2))
+        return elements
+    return _scalar_elements(value, fmt)
+
+
+def _scalar_elements(value: Value, fmt: tuple[int, bool, bool, int]) -> list[Element]:
+    if type(value) is str:
+        return [string_operand(value)]
+    if type(value) is Matrix:
+        raise EvaluationError("nested matrices are not supported")
+    elements, negative = _number_elements(_magnitude(value), *fmt)
+    dims = _dims(value)
+    if dims != DIMENSIONLESS:
+        elements.extend(_unit_elements(dims))
+        elements.append(operator("*", 2))
+    if negative:
+        elements.append(operator("-", 1))
+    return elements
+
+
+def _number_elements(
+    x: float, places: int, significant: bool, trailing_zeros: bool, threshold: int,
+) -> tuple[list[Element], bool]:
+    if not math.isfinite(x):
+        raise EvaluationError("result is not finite")
+    if x == 0.0:
+        return [operand("0")], False
+    negative = x < 0
+    x = abs(x)
+    exponent = math.floor(math.log10(x))
+    if abs(exponent) >= threshold:
+        mantissa = x / 10.0 ** exponent
+        decimals = max(places - 1, 0) if significant else places
+        if round(mantissa, decimals) >= 10.0:
+            mantissa /= 10.0
+            exponent += 1
+        text = _fixed(mantissa, decimals, trailing_zeros)
+        elements = [operand(text), operand(10), operand(abs(exponent))]
+        if exponent < 0:
+            elements.append(operator("-", 1))
+        elements += [operator("^", 2), operator("*", 2)]
+        return elements, negative
+    decimals = max(places - 1 - exponent, 0) if significant else places
+    text = _fixed(x, decimals, trailing_zeros)
+    return [operand(text)], negative and text.strip("0.") != ""
+
+
+def _fixed(x: float, decimals: int, trailing_zeros: bool) -> str:
+    text = f"{x:.{decimals}f}"
+    if "." in text and not trailing_zeros:
+        text = text.rstrip("0").rstrip(".")
+    return text
+
+
+def _unit_elements(dims: Dims) -> list[Element]:
+    derived = DERIVED_UNITS.get(dims)
+    if derived is not None:
+        return [unit_operand(derived)]
+    num = [(u, p) for u, p in zip(BASE_UNITS, dims) if p > 0]
+    den = [(u, -p) for u, p in zip(BASE_UNITS, dims) if p < 0]
+    elements = _product_elements(num) if num else [operand(1)]
+    if den:
+        elements += _product_elements(den)
+        elements.append(operator("/", 2))
+    return elements
+
+
+def _product_elements(factors: list[tuple[str, int]]) -> list[Element]:
+    elements: list[Element] = []
+    for k, (name, power) in enumerate(factors):
+        elements.append(unit_operand(name))
+        if power != 1:
+            elements += [operand(power), operator("^", 2)]
+        if k:
+            elements.append(operator("*", 2))
+    return elements
@@ -61,6 +61,7 @@ from .functions import (
     sqrt,
     tan,
 )
+from .tree import Node, to_tree
 from .matrix import (
     augment,
     cinterp,
@@ -95,6 +96,8 @@ __all__ = [
     # matrix
     "mat", "el", "rows", "cols", "row", "col", "transpose", "det", "tr",
     "identity", "augment", "stack", "csort", "polyroots", "cinterp",
+    # tree
+    "Node", "to_tree",
     # control
     "line", "range_", "for_range", "for_loop", "while_loop", "if_",
     "sum_", "product_",
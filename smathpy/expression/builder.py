@@ -168,7 +168,11 @@ def assign(name: str, value: ExprLike) -> Expr:
 
 
 def define(name: str, value: ExprLike) -> Expr:
-    """Build an equation definition: ``name ≡ value``."""
+    """Build a boolean equation: ``name ≡ value``.
+
+    SMath evaluates ``≡`` as equality (1 or 0), like ``=`` in a condition;
+    it does not define *name*. Use :func:`assign` for that.
+    """
     val_expr = coerce(value)
     return Expr([operand(name)] + val_expr._elements + [operator("≡", 2)])
 
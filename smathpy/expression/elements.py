@@ -5,7 +5,7 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(slots=True)
 class Element:
     """Base class for an RPN element (<e> tag in SMath XML)."""
 
@@ -0,0 +1,73 @@
+"""Expression trees — structured view of an RPN element list."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+from .builder import Expr
+from .elements import Element
+
+_NUMBER_RE = re.compile(r"^[0-9]+(\.[0-9]*)?([eE][+-]?[0-9]+)?$")
+
+
+@dataclass
+class Node:
+    """A node of an expression tree: an RPN element and its operands.
+
+    ``x 2 ^ 3 +`` becomes ``+(^(x, 2), 3)``.
+    """
+
+    element: Element
+    children: list[Node] = field(default_factory=list)
+
+    @property
+    def type(self) -> str:
+        return self.element.type
+
+    @property
+    def value(self) -> str:
+        return self.element.value
+
+    def is_number(self) -> bool:
+        """Whether the node is a numeric literal operand."""
+        return self.element.type == "operand" and bool(_NUMBER_RE.match(self.element.value))
+
+    def is_name(self) -> bool:
+        """Whether the node is a plain identifier (variable or constant)."""
+        e = self.element
+        return (
+            e.type == "operand"
+            and e.style is None
+            and e.value != "."
+            and not _NUMBER_RE.match(e.value)
+        )
+
+
+def arity(element: Element) -> int:
+    """Number of operands an element consumes from the RPN stack."""
+    if element.type == "operand":
+        return 0
+    if element.type == "bracket":
+        return 1
+    return element.args if element.args is not None else 0
+
+
+def to_tree(expr: Expr) -> Node:
+    """Build the expression tree of an RPN expression.
+
+    Raises ``ValueError`` if the element list does not reduce to exactly one
+    root (an operator without enough operands, or leftover operands).
+    """
+    stack: list[Node] = []
+    for e in expr._elements:
+        n = arity(e)
+        if n > len(stack):
+            raise ValueError(f"'{e.value}' needs {n} operands, found {len(stack)}")
+        children = stack[len(stack) - n:] if n else []
+        if n:
+            del stack[-n:]
+        stack.append(Node(e, children))
+    if len(stack) != 1:
+        raise ValueError(f"expression reduces to {len(stack)} values, expected 1")
+    return stack[0]
@@ -0,0 +1,282 @@
+"""Golden-result verification against worksheets computed by SMath Studio.
+
+SMath stores the value it computed for each displayed result in the
+``<result>`` element of the region. :func:`verify` reads a ``.sm`` file,
+evaluates every math region offline with :class:`~smathpy.evaluator.Evaluator`
+in SMath's order (top to bottom, left to right) and compares each computed
+value with the stored one, allowing for the rounding SMath applied::
+
+    reports = verify_all(Path("examples").glob("*.sm"), workers=4)
+    for r in reports:
+        print(r.path, len(r.ok), len(r.mismatches), f"{r.seconds:.3f}s")
+
+Regions the evaluator cannot handle (symbolic results, unsupported
+functions) are reported as skipped, not as failures, and so are regions
+using a name whose last definition could not be evaluated. Run it from
+the command line with ``python -m smathpy.golden examples/*.sm``; a
+directory stands for the ``.sm`` files in it, and without arguments
+``examples/*.sm`` is checked.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .constants import SMATH_NAMESPACE
+from .dependencies import expr_symbols
+from .evaluator import EvaluationError, Evaluator, Matrix, Quantity, Value, convert
+from .expression.builder import Expr
+from .expression.elements import Element
+
+_NS = f"{{{SMATH_NAMESPACE}}}"
+
+# Relative tolerance added to the rounding of the stored value
+DEFAULT_REL_TOL = 1e-9
+# Worksheets checked by the command line without arguments
+DEFAULT_GLOB = "examples/*.sm"
+
+
+@dataclass
+class GoldenRegion:
+    """A math region read from a ``.sm`` file."""
+
+    id: str
+    top: int
+    left: int
+    expr: Expr
+    contract: Expr | None = None
+    result: Expr | None = None
+    action: str | None = None
+    decimal_places: int | None = None
+    significant_digits: bool = False
+
+
+@dataclass
+class Check:
+    """The comparison of one stored result with the offline value."""
+
+    region: GoldenRegion
+    status: str  # "ok", "mismatch" or "skipped"
+    expected: Value | None = None
+    actual: Value | None = None
+    message: str = ""
+
+
+@dataclass
+class GoldenReport:
+    """All checks of one worksheet and the time they took."""
+
+    path: str
+    checks: list[Check] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def _with(self, status: str) -> list[Check]:
+        return [c for c in self.checks if c.status == status]
+
+    @property
+    def ok(self) -> list[Check]:
+        return self._with("ok")
+
+    @property
+    def mismatches(self) -> list[Check]:
+        return self._with("mismatch")
+
+    @property
+    def skipped(self) -> list[Check]:
+        return self._with("skipped")
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def _element(e: ET.Element) -> Element:
+    args = e.get("args")
+    return Element(
+        type=e.get("type", "operand"),
+        value=e.text or "",
+        args=int(args) if args is not None else None,
+        style=e.get("style"),
+        preserve=True if e.get("preserve") == "true" else None,
+    )
+
+
+def _expr(parent: ET.Element | None) -> Expr | None:
+    if parent is None:
+        return None
+    return Expr([_element(e) for e in parent.findall(f"{_NS}e")])
+
+
+def read_math_regions(path: str | os.PathLike[str]) -> tuple[list[GoldenRegion], int, int]:
+    """Math regions of a worksheet in evaluation order, with its precision and threshold."""
+    root = ET.parse(path).getroot()
+    precision = int(root.findtext(f"{_NS}settings/{_NS}calculation/{_NS}precision") or 4)
+    threshold = int(
+        root.findtext(f"{_NS}settings/{_NS}calculation/{_NS}exponentialThreshold") or 5
+    )
+    regions: list[GoldenRegion] = []
+    for region in root.iter(f"{_NS}region"):
+        math_el = region.find(f"{_NS}math")
+        if math_el is None:
+            continue
+        expr = _expr(math_el.find(f"{_NS}input"))
+        if not expr or not expr._elements:
+            continue
+        result_el = math_el.find(f"{_NS}result")
+        places = math_el.get("decimalPlaces")
+        regions.append(GoldenRegion(
+            id=region.get("id", ""),
+            top=int(region.get("top", 0)),
+            left=int(region.get("left", 0)),
+            expr=expr,
+            contract=_expr(math_el.find(f"{_NS}contract")),
+            result=_expr(result_el),
+            action=result_el.get("action") if result_el is not None else None,
+            decimal_places=int(places) if places is not None else None,
+            significant_digits=math_el.get("significantDigitsMode") == "true",
+        ))
+    regions.sort(key=lambda r: (r.top, r.left))
+    return regions, precision, threshold
+
+
+# ---------------------------------------------------------------------------
+# Comparison
+# ---------------------------------------------------------------------------
+
+def _rounding(expected: float, places: int, significant: bool, threshold: int) -> float:
+    """Largest difference SMath's rounding of a value to display can introduce."""
+    if expected == 0.0:
+        return 0.5 * 10.0 ** -places
+    exponent = math.floor(math.log10(abs(expected)))
+    if significant:
+        return 0.5 * 10.0 ** (exponent - places + 1)
+    if abs(exponent) >= threshold:
+        return 0.5 * 10.0 ** (exponent - places)
+    return 0.5 * 10.0 ** -places
+
+
+def _matches(actual: Value, expected: Value, places: int, significant: bool,
+             threshold: int, rel_tol: float) -> bool:
+    if type(expected) is Matrix:
+        return (
+            type(actual) is Matrix
+            and (actual.rows, actual.cols) == (expected.rows, expected.cols)
+            and all(_matches(a, e, places, significant, threshold, rel_tol)
+                    for a, e in zip(actual.cells, expected.cells))
+        )
+    if type(expected) is str or type(actual) is str:
+        return actual == expected
+    if type(actual) is Matrix:
+        return False
+    a_dims = actual.dims if type(actual) is Quantity else None
+    e_dims = expected.dims if type(expected) is Quantity else None
+    if a_dims != e_dims:
+        return False
+    a = actual.value if type(actual) is Quantity else actual
+    e = expected.value if type(expected) is Quantity else expected
+    # SMath rounds the displayed number: in SI units, or as a plain number in
+    # the contract unit (both values were converted to it). Either way that
+    # is *e*, so the rounding is the same as for dimensionless results.
+    tol = _rounding(e, places, significant, threshold) * 1.001 + rel_tol * abs(e)
+    return abs(a - e) <= tol
+
+
+def verify(path: str | os.PathLike[str], rel_tol: float = DEFAULT_REL_TOL) -> GoldenReport:
+    """Evaluate a worksheet offline and compare with the results SMath stored."""
+    start = time.perf_counter()
+    report = GoldenReport(str(path))
+    regions, precision, threshold = read_math_regions(path)
+    evaluator = Evaluator()
+    failed: set[str] = set()  # names whose offline value is unknown
+    for region in regions:
+        symbols = expr_symbols(region.expr)
+        value: Value | None = None
+        error = None
+        tainted = symbols.uses & failed
+        if tainted:
+            error = f"uses {', '.join(sorted(tainted))}, which could not be evaluated"
+        else:
+            try:
+                value = evaluator.evaluate(region.expr)
+            except EvaluationError as exc:
+                error = str(exc)
+        if error is not None:
+            failed.update(symbols.defines)
+        else:
+            failed.difference_update(symbols.defines)
+        if region.action != "numeric" or region.result is None:
+            continue
+        try:
+            expected = Evaluator().evaluate(region.result)
+        except EvaluationError as exc:
+            report.checks.append(Check(region, "skipped", message=f"stored result: {exc}"))
+            continue
+        if error is not None or value is None:
+            report.checks.append(Check(region, "skipped", expected, message=error or "no value"))
+            continue
+        try:
+            if region.contract is not None:
+                value = convert(value, evaluator.evaluate(region.contract))
+        except EvaluationError as exc:
+            report.checks.append(Check(region, "skipped", expected, message=str(exc)))
+            continue
+        places = precision if region.decimal_places is None else region.decimal_places
+        ok = _matches(value, expected, places, region.significant_digits, threshold, rel_tol)
+        report.checks.append(Check(region, "ok" if ok else "mismatch", expected, value))
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def verify_all(paths: Iterable[str | os.PathLike[str]], rel_tol: float = DEFAULT_REL_TOL,
+               workers: int | None = None) -> list[GoldenReport]:
+    """:func:`verify` many worksheets in parallel processes (in order of *paths*).
+
+    ``workers=1`` runs in the calling process.
+    """
+    paths = [str(p) for p in paths]
+    if workers == 1 or len(paths) <= 1:
+        return [verify(p, rel_tol) for p in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(verify, paths, [rel_tol] * len(paths)))
+
+
+def expand_paths(args: Iterable[str | os.PathLike[str]]) -> list[Path]:
+    """Worksheet paths for *args*: files as given, directories as their ``.sm`` files."""
+    paths: list[Path] = []
+    for arg in args:
+        path = Path(arg)
+        paths.extend(sorted(path.glob("*.sm")) if path.is_dir() else [path])
+    return paths
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Print a table of golden checks per worksheet.
+
+    The exit status is 1 on mismatches and 2 when no worksheet was found.
+    """
+    args = sys.argv[1:] if argv is None else argv
+    paths = expand_paths(args) if args else sorted(Path().glob(DEFAULT_GLOB))
+    if not paths:
+        print(f"no worksheets in {' '.join(args) or DEFAULT_GLOB}", file=sys.stderr)
+        return 2
+    reports = verify_all(paths)
+    print(f"{'worksheet':<32} {'ok':>4} {'fail':>5} {'skip':>5} {'time':>9}")
+    for r in reports:
+        name = os.path.basename(r.path)
+        print(f"{name:<32} {len(r.ok):>4} {len(r.mismatches):>5} {len(r.skipped):>5} "
+              f"{r.seconds * 1000:>7.1f}ms")
+        for c in r.mismatches:
+            print(f"    region {c.region.id}: expected {c.expected!r}, got {c.actual!r}")
+    return 1 if any(r.mismatches for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
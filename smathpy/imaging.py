@@ -0,0 +1,167 @@
+"""Size optimisation of embedded pictures.
+
+Embedded images usually dominate the size of a ``.sm`` file, and with it
+the time SMath Studio takes to open it. :func:`optimize_pictures` shrinks
+PNG and JPEG pictures in parallel threads:
+
+* images larger than their displayed ``width``/``height`` (at the worksheet
+  dpi, or a higher target dpi for print) are downsampled;
+* JPEGs are re-encoded at *quality*, PNGs with maximum compression;
+* metadata (EXIF, ICC profiles, XMP, comments, text chunks) is dropped,
+  after applying the EXIF orientation so photos keep their rotation;
+  transparency is kept.
+
+A picture whose re-encoding would not be smaller is left as it was::
+
+    report = ws.optimize_pictures(quality=80)
+    print(f"{report.saved / 1024:.0f} KiB saved in {len(report.changed)} pictures")
+
+Pillow is an optional dependency (``pip install smathpy[images]``).
+"""
+
+from __future__ import annotations
+
+import base64
+import io
+import math
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+from .regions.picture_region import PictureRegion
+
+# Formats re-encoded by the pipeline; other pictures are left alone
+OPTIMIZED_FORMATS = ("png", "jpeg")
+DEFAULT_QUALITY = 85
+# Image.info keys dropped by the pipeline, besides PNG text chunks
+METADATA_KEYS = ("icc_profile", "exif", "comment", "xmp", "XML:com.adobe.xmp")
+
+
+def _pillow() -> Any:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise ImportError(
+            "smathpy.imaging requires Pillow: pip install smathpy[images]"
+        ) from None
+    return Image, ImageOps
+
+
+@dataclass
+class PictureResult:
+    """What the pipeline did to one picture."""
+
+    region: PictureRegion
+    before: int  # encoded image bytes
+    after: int
+    data_base64: str | None = None  # new payload, None when unchanged
+    size: tuple[int, int] | None = None  # new pixel size, None when not resized
+    skipped: str = ""  # why the picture was left alone
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+
+@dataclass
+class OptimizeReport:
+    """Results for all pictures, in document order."""
+
+    results: list[PictureResult] = field(default_factory=list)
+
+    @property
+    def before(self) -> int:
+        return sum(r.before for r in self.results)
+
+    @property
+    def after(self) -> int:
+        return sum(r.after for r in self.results)
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+    @property
+    def changed(self) -> list[PictureResult]:
+        return [r for r in self.results if r.data_base64 is not None]
+
+
+def _target(region: PictureRegion, image_size: tuple[int, int],
+            scale: float) -> tuple[int, int] | None:
+    """Pixel box the image is displayed in, or None when it need not shrink."""
+    w, h = image_size
+    if region.width is None and region.height is None:
+        return None
+    box_w = math.ceil(region.width * scale) if region.width else w
+    box_h = math.ceil(region.height * scale) if region.height else h
+    if w <= box_w and h <= box_h:
+        return None
+    return box_w, box_h
+
+
+def optimize_picture(region: PictureRegion, quality: int = DEFAULT_QUALITY,
+                     scale: float = 1.0) -> PictureResult:
+    """Optimise one picture; *region* itself is not modified.
+
+    *scale* is the ratio of the target dpi to the worksheet dpi: 1 keeps
+    one image pixel per displayed pixel.
+    """
+    Image, ImageOps = _pillow()
+    payload = region.encoded()
+    raw = base64.b64decode(payload) if payload else b""
+    result = PictureResult(region, len(raw), len(raw))
+    if region.format not in OPTIMIZED_FORMATS:
+        result.skipped = f"{region.format} pictures are not optimised"
+        return result
+    try:
+        image = Image.open(io.BytesIO(raw))
+        image.load()
+    except (OSError, ValueError) as exc:
+        result.skipped = f"unreadable image: {exc}"
+        return result
+    text_keys = set(getattr(image, "text", None) or ())  # PNG tEXt/zTXt/iTXt chunks
+    image = ImageOps.exif_transpose(image)
+    # Pillow writes metadata back from info on save; keys that change the
+    # rendering (transparency, gamma) are kept
+    image.info = {
+        key: value for key, value in image.info.items()
+        if key not in METADATA_KEYS and key not in text_keys
+    }
+    box = _target(region, image.size, scale)
+    if box is not None:
+        image.thumbnail(box, Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    if region.format == "jpeg":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, "PNG", optimize=True)
+    data = out.getvalue()
+    if len(data) >= len(raw):
+        result.skipped = "already optimal"
+        return result
+    result.after = len(data)
+    result.data_base64 = base64.b64encode(data).decode("ascii")
+    result.size = image.size if box is not None else None
+    return result
+
+
+def optimize_pictures(regions: Iterable[PictureRegion], quality: int = DEFAULT_QUALITY,
+                      scale: float = 1.0, workers: int | None = None) -> OptimizeReport:
+    """:func:`optimize_picture` for many pictures in a thread pool.
+
+    Pillow releases the GIL while resampling and encoding, so pictures are
+    processed concurrently. ``workers=1`` runs in the calling thread. The
+    regions are not modified; apply :attr:`PictureResult.data_base64`.
+    """
+    regions = list(regions)
+    if workers == 1 or len(regions) <= 1:
+        results = [optimize_picture(r, quality, scale) for r in regions]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                lambda r: optimize_picture(r, quality, scale), regions,
+            ))
+    return OptimizeReport(results)
@@ -0,0 +1,837 @@
+"""Region size estimation and automatic layout.
+
+SMath stores an absolute ``top``/``left`` for every region, so a generator
+has to know roughly how tall each region renders. The estimators here derive
+a region's size from its content (text lines and font size, the shape of the
+RPN expression, matrix rows, ``line`` statements, plot and picture size)
+without rendering anything.
+
+Layout engines place regions in document order in a single pass::
+
+    ws = Worksheet(layout="auto")      # uses StackLayout
+    ws.add(MathRegion(expr=assign("K", mat([[1, 2], [3, 4]]))))
+    ws.add(MathRegion.assignment("x", 1))   # placed below the matrix
+"""
+
+from __future__ import annotations
+
+import copy
+import functools
+import random
+import struct
+import threading
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+from .constants import (
+    AREA_MARKER_HEIGHT,
+    DEFAULT_LEFT,
+    DEFAULT_REGION_HEIGHT,
+    DEFAULT_TOP_START,
+    FONT_DEFAULT,
+    REGION_GAP,
+)
+from .expression.builder import Expr
+from .regions.area_region import AreaRegion
+from .regions.base import Region
+from .regions.math_region import MathRegion
+from .regions.picture_region import PictureRegion
+from .regions.plot_region import PlotRegion
+from .regions.text_region import TextRegion
+from .settings import PageModel, Settings
+
+# Estimation metrics, in pixels at FONT_DEFAULT (96 dpi)
+MATH_CHAR_WIDTH = 7
+MATH_LINE_HEIGHT = 16
+TEXT_CHAR_RATIO = 0.6     # average glyph width / font size
+TEXT_LINE_RATIO = 5 / 3   # line height / font size
+REGION_PADDING = 8
+DEFAULT_REGION_WIDTH = 80
+DEFAULT_PLOT_SIZE = (300, 300)
+DEFAULT_PICTURE_SIZE = (100, 100)
+
+# A stack entry of the RPN box estimator: (width, height, literal operand)
+_Box = tuple[int, int, "str | None"]
+
+
+# ---------------------------------------------------------------------------
+# Expression boxes
+# ---------------------------------------------------------------------------
+
+def _hstack(boxes: Sequence[_Box], sep: int) -> _Box:
+    w = sum(b[0] for b in boxes) + sep * max(len(boxes) - 1, 0)
+    h = max((b[1] for b in boxes), default=MATH_LINE_HEIGHT)
+    return (w, h, None)
+
+
+def _vstack(boxes: Sequence[_Box], indent: int = 0) -> _Box:
+    w = max((b[0] for b in boxes), default=0) + indent
+    h = sum(b[1] for b in boxes)
+    return (w, h, None)
+
+
+def _int_literal(box: _Box, default: int) -> int:
+    try:
+        return int(box[2]) if box[2] is not None else default
+    except ValueError:
+        return default
+
+
+def _fraction(args: Sequence[_Box]) -> _Box:
+    num, den = args
+    return (max(num[0], den[0]) + 6, num[1] + den[1] + 3, None)
+
+
+def _power(args: Sequence[_Box]) -> _Box:
+    base, exp = args
+    return (base[0] + int(exp[0] * 0.8), base[1] + int(exp[1] * 0.6), None)
+
+
+def _assignment(args: Sequence[_Box]) -> _Box:
+    return _hstack(args, 22)
+
+
+_OPERATOR_BOXES: dict[str, Callable[[Sequence[_Box]], _Box]] = {
+    "/": _fraction,
+    "^": _power,
+    ":": _assignment,
+    "*": lambda args: _hstack(args, 8),
+}
+
+
+def _matrix(args: Sequence[_Box]) -> _Box:
+    n_rows = _int_literal(args[-2], 1)
+    n_cols = _int_literal(args[-1], 1)
+    cells = args[:-2]
+    if n_rows * n_cols != len(cells) or not cells:
+        return _hstack(cells, 10)
+    row_h = [max(c[1] for c in cells[r * n_cols:(r + 1) * n_cols]) for r in range(n_rows)]
+    col_w = [max(cells[r * n_cols + c][0] for r in range(n_rows)) for c in range(n_cols)]
+    return (sum(col_w) + 10 * (n_cols - 1) + 12, sum(row_h) + 4 * (n_rows - 1) + 8, None)
+
+
+def _line_block(args: Sequence[_Box]) -> _Box:
+    return _vstack(args[:-2], indent=10)
+
+
+def _if_block(args: Sequence[_Box]) -> _Box:
+    cond, true_branch, false_branch = args
+    w = max(cond[0] + 20, true_branch[0] + 10, false_branch[0] + 10)
+    return (w, cond[1] + true_branch[1] + MATH_LINE_HEIGHT + false_branch[1], None)
+
+
+def _loop_block(args: Sequence[_Box]) -> _Box:
+    header = _hstack(args[:-1], 14)
+    body = args[-1]
+    return (max(header[0] + 30, body[0] + 10), header[1] + body[1], None)
+
+
+def _big_operator(args: Sequence[_Box]) -> _Box:
+    body = args[0]
+    limits = _hstack(args[1:], 14)
+    return (max(body[0], limits[0]) + 24, body[1] + 2 * (limits[1] // 2) + 8, None)
+
+
+def _radical(args: Sequence[_Box]) -> _Box:
+    return (args[0][0] + 14, args[0][1] + 4, None)
+
+
+def _element(args: Sequence[_Box]) -> _Box:
+    base = args[0]
+    index = _hstack(args[1:], 4)
+    return (base[0] + int(index[0] * 0.7), base[1] + 4, None)
+
+
+_FUNCTION_BOXES: dict[str, Callable[[Sequence[_Box]], _Box]] = {
+    "mat": _matrix,
+    "sys": _matrix,
+    "line": _line_block,
+    "if": _if_block,
+    "while": _loop_block,
+    "for": _loop_block,
+    "sum": _big_operator,
+    "product": _big_operator,
+    "int": _big_operator,
+    "sqrt": _radical,
+    "el": _element,
+}
+
+
+def expr_box(expr: Expr) -> tuple[int, int]:
+    """Estimate the rendered (width, height) of an expression in pixels.
+
+    A single RPN pass keeps a stack of boxes; operators and functions combine
+    the boxes of their arguments (fractions stack vertically, powers raise
+    the exponent, ``mat`` lays out rows, ``line``/``if``/loops stack
+    statements).
+    """
+    stack: list[_Box] = []
+    for e in expr._elements:
+        if e.type == "operand":
+            stack.append((MATH_CHAR_WIDTH * len(e.value), MATH_LINE_HEIGHT, e.value))
+            continue
+        if e.type == "bracket":
+            w, h, _ = stack.pop() if stack else (0, MATH_LINE_HEIGHT, None)
+            stack.append((w + 10, h + 2, None))
+            continue
+
+        n = e.args if e.args is not None else 0
+        args = stack[len(stack) - n:] if n else []
+        del stack[len(stack) - len(args):]
+        args = [(0, MATH_LINE_HEIGHT, None)] * (n - len(args)) + args
+
+        if e.type == "operator":
+            if n == 1:
+                w, h, _ = args[0]
+                stack.append((w + 10, h, None))
+            else:
+                combine = _OPERATOR_BOXES.get(e.value)
+                stack.append(combine(args) if combine else _hstack(args, 14))
+        else:
+            combine = _FUNCTION_BOXES.get(e.value)
+            if combine is not None and n >= 1:
+                try:
+                    stack.append(combine(args))
+                    continue
+                except (ValueError, IndexError):
+                    pass
+            w, h, _ = _hstack(args, 6)
+            stack.append((w + MATH_CHAR_WIDTH * len(e.value) + 10, h + 2, None))
+
+    if not stack:
+        return (0, MATH_LINE_HEIGHT)
+    w, h, _ = _vstack(stack)
+    return (w, h)
+
+
+# ---------------------------------------------------------------------------
+# Region size estimators
+# ---------------------------------------------------------------------------
+
+@functools.singledispatch
+def estimate_size(region: Region) -> tuple[int, int]:
+    """Estimate the rendered (width, height) of a region from its content.
+
+    Dispatch is per region type; only the per-class lookup is cached, the
+    estimate itself is recomputed on each call (see :func:`region_size`
+    for the memo of a layout pass). Use ``estimate_size.register`` to add
+    estimators for new region types.
+    """
+    return (DEFAULT_REGION_WIDTH, DEFAULT_REGION_HEIGHT)
+
+
+@estimate_size.register(TextRegion)
+def _estimate_text(region: TextRegion) -> tuple[int, int]:
+    texts = region.get_texts().values()
+    lines = max((t.count("\n") + 1 for t in texts), default=1)
+    longest = max((len(ln) for t in texts for ln in t.split("\n")), default=0)
+    char_w = region.font_size * TEXT_CHAR_RATIO * (1.1 if region.bold else 1.0)
+    line_h = round(region.font_size * TEXT_LINE_RATIO)
+    return (int(longest * char_w) + REGION_PADDING, lines * line_h + REGION_PADDING)
+
+
+@estimate_size.register(MathRegion)
+def _estimate_math(region: MathRegion) -> tuple[int, int]:
+    w, h = expr_box(region.expr) if region.expr else (0, MATH_LINE_HEIGHT)
+    if region.show_result or region.result_action:
+        # " = value unit"
+        rw, rh = expr_box(Expr(region.result_elements)) if region.result_elements else (56, MATH_LINE_HEIGHT)
+        w += rw + 20
+        h = max(h, rh)
+        if region.contract_expr:
+            w += expr_box(region.contract_expr)[0] + 8
+        elif region.contract_unit:
+            w += MATH_CHAR_WIDTH * len(region.contract_unit) + 8
+    scale = region.font_size / FONT_DEFAULT
+    return (int(w * scale) + REGION_PADDING, int(h * scale) + REGION_PADDING)
+
+
+@estimate_size.register(PlotRegion)
+def _estimate_plot(region: PlotRegion) -> tuple[int, int]:
+    return DEFAULT_PLOT_SIZE
+
+
+def _png_size(head: bytes) -> tuple[int, int] | None:
+    """Read the pixel size from the IHDR chunk at the start of PNG data."""
+    if head[:8] != b"\x89PNG\r\n\x1a\n" or head[12:16] != b"IHDR":
+        return None
+    w, h = struct.unpack(">II", head[16:24])
+    return (int(w), int(h))
+
+
+@estimate_size.register(PictureRegion)
+def _estimate_picture(region: PictureRegion) -> tuple[int, int]:
+    if region.format == "png":
+        try:
+            size = _png_size(region.head(24))
+        except (OSError, ValueError):
+            size = None
+        if size:
+            return size
+    return DEFAULT_PICTURE_SIZE
+
+
+@estimate_size.register(AreaRegion)
+def _estimate_area(region: AreaRegion) -> tuple[int, int]:
+    w = 0
+    h = AREA_MARKER_HEIGHT
+    for child in region.children:
+        cw, ch = region_size(child)
+        w = max(w, child.left + cw)
+        h += ch + REGION_GAP
+    return (w, h + AREA_MARKER_HEIGHT)
+
+
+def terminator_top(area: AreaRegion, bottoms: Iterable[int], gap: int = REGION_GAP) -> int:
+    """Top of an area's end marker: below its start marker and *gap* below
+    each child's bottom (for nested areas, the bottom of their end marker).
+
+    Layouts and serialization both end areas here, so the region after an
+    area starts *gap* below its end marker.
+    """
+    return max([area.top + AREA_MARKER_HEIGHT, *(bottom + gap for bottom in bottoms)])
+
+
+# Sizes memoised by region id during one layout pass, per thread
+_pass = threading.local()
+
+
+@contextmanager
+def sizing_pass() -> Iterator[None]:
+    """Compute each region's size at most once inside the block.
+
+    Regions must not be edited meanwhile; layout engines only move them.
+    Nested passes share the outer memo.
+    """
+    if getattr(_pass, "sizes", None) is not None:
+        yield
+        return
+    _pass.sizes = {}
+    try:
+        yield
+    finally:
+        _pass.sizes = None
+
+
+def region_size(region: Region) -> tuple[int, int]:
+    """Return (width, height), preferring the region's explicit size.
+
+    Inside :func:`sizing_pass` the result is memoised per region.
+    """
+    sizes = getattr(_pass, "sizes", None)
+    if sizes is None:
+        return _region_size(region)
+    size = sizes.get(id(region))
+    if size is None:
+        size = sizes[id(region)] = _region_size(region)
+    return size
+
+
+def _region_size(region: Region) -> tuple[int, int]:
+    if region.width is not None and region.height is not None:
+        return (region.width, region.height)
+    w, h = estimate_size(region)
+    return (
+        region.width if region.width is not None else w,
+        region.height if region.height is not None else h,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Layout engines
+# ---------------------------------------------------------------------------
+
+class StackLayout:
+    """Single-column layout using estimated region heights.
+
+    Regions whose ``top`` was left at the default are *auto-placed* below the
+    previous region (plus any spacing requested before them); regions with an
+    explicit position keep it and the flow continues below them. Children of
+    an :class:`AreaRegion` are stacked inside the area.
+
+    The engine remembers which regions it auto-placed, so :meth:`reflow`
+    can recompute every position in one linear pass after content changed.
+    """
+
+    def __init__(self, top: int = DEFAULT_TOP_START, left: int = DEFAULT_LEFT,
+                 gap: int = REGION_GAP) -> None:
+        self.top = top
+        self.left = left
+        self.gap = gap
+        self._auto: dict[int, int] = {}  # id(region) -> spacing before it
+        self._next_top = top
+
+    def reset(self) -> None:
+        """Restart placement from the top of the document."""
+        self._next_top = self.top
+
+    def clone(self) -> StackLayout:
+        """Return an engine with the same configuration and no placed regions."""
+        engine = copy.copy(self)
+        engine._auto = {}
+        engine.reset()
+        return engine
+
+    def fork(self) -> StackLayout:
+        """Return an independent engine tracking the same regions."""
+        engine = copy.copy(self)
+        engine._auto = dict(self._auto)
+        return engine
+
+    def replace(self, old: Region, new: Region) -> None:
+        """Track *new* in place of *old* (e.g. a copy made for editing)."""
+        spacing = self._auto.pop(id(old), None)
+        if spacing is not None:
+            self._auto[id(new)] = spacing
+
+    def is_auto(self, region: Region) -> bool:
+        """Whether *region* is positioned by this engine."""
+        return id(region) in self._auto
+
+    def spacing_of(self, region: Region) -> int | None:
+        """Spacing requested before an auto-placed region, ``None`` if not tracked."""
+        return self._auto.get(id(region))
+
+    def forget(self, region: Region) -> None:
+        """Stop tracking a region (e.g. after it was removed)."""
+        self._auto.pop(id(region), None)
+
+    def track(self, region: Region, spacing: int = 0) -> None:
+        """Mark *region* as auto-placed without positioning it now."""
+        self._auto[id(region)] = spacing
+
+    def shift(self, delta: int) -> None:
+        """Move the insertion point for the next region by *delta* pixels."""
+        self._next_top += delta
+
+    def place(self, region: Region, spacing: int = 0) -> None:
+        """Position a newly added region and advance the flow past it."""
+        if id(region) not in self._auto and region.top != DEFAULT_TOP_START:
+            self._advance(region)
+            return
+        self._auto[id(region)] = spacing
+        self._place_auto(region, spacing)
+
+    def reflow(self, regions: Sequence[Region]) -> None:
+        """Recompute positions of all auto-placed regions in document order."""
+        with sizing_pass():
+            self.reset()
+            for region in regions:
+                spacing = self._auto.get(id(region))
+                if spacing is None:
+                    self._advance(region)
+                else:
+                    self._place_auto(region, spacing)
+
+    # -- internals -------------------------------------------------------------
+
+    def _place_auto(self, region: Region, spacing: int) -> None:
+        region.top = self._position(region, self._next_top + spacing)
+        self._after(region, region.top)
+
+    def _position(self, region: Region, top: int) -> int:
+        """Return the top at which an auto-placed region starts."""
+        return top
+
+    def _advance(self, region: Region) -> None:
+        self._after(region, region.top)
+
+    def _after(self, region: Region, top: int) -> None:
+        if isinstance(region, AreaRegion):
+            bottom = self._layout_area(region)
+        else:
+            bottom = top + region_size(region)[1]
+        self._next_top = max(self._next_top, bottom + self.gap)
+
+    def _layout_area(self, area: AreaRegion) -> int:
+        """Stack an area's auto-placed children; return the bottom of its end marker."""
+        next_top = area.top + AREA_MARKER_HEIGHT
+        bottoms = []
+        for child in area.children:
+            if id(child) in self._auto or child.top == DEFAULT_TOP_START:
+                self._auto.setdefault(id(child), 0)
+                child.top = next_top
+            if isinstance(child, AreaRegion):
+                bottom = self._layout_area(child)
+            else:
+                bottom = child.top + region_size(child)[1]
+            bottoms.append(bottom)
+            next_top = max(next_top, bottom + self.gap)
+        return terminator_top(area, bottoms, self.gap) + AREA_MARKER_HEIGHT
+
+
+class PageLayout(StackLayout):
+    """Stack layout that keeps regions from straddling printed pages.
+
+    The worksheet is cut into pages of ``page_height`` pixels (the printable
+    height, i.e. paper height minus top and bottom margins). An auto-placed
+    region that would cross a page boundary is pushed to the start of the
+    next page. Regions taller than a page are left where they are. Each
+    placement is O(1), so a document lays out in linear time.
+    """
+
+    def __init__(self, page_height: int, top: int = DEFAULT_TOP_START,
+                 left: int = DEFAULT_LEFT, gap: int = REGION_GAP) -> None:
+        if page_height <= top:
+            raise ValueError("page_height must be larger than the top offset")
+        super().__init__(top=top, left=left, gap=gap)
+        self.page_height = page_height
+        self.page_breaks = 0
+
+    @classmethod
+    def from_page_model(cls, page_model: PageModel, dpi: int = 96,
+                        **kwargs: Any) -> PageLayout:
+        """Create a page layout matching a worksheet's paper and margins."""
+        return cls(page_model.content_height(dpi), **kwargs)
+
+    def reset(self) -> None:
+        super().reset()
+        self.page_breaks = 0
+
+    def page_of(self, region: Region) -> int:
+        """Return the 0-based page index on which *region* starts."""
+        return region.top // self.page_height
+
+    def _position(self, region: Region, top: int) -> int:
+        h = region_size(region)[1]
+        page = top // self.page_height
+        page_end = (page + 1) * self.page_height
+        if top + h > page_end and h <= self.page_height - self.top:
+            self.page_breaks += 1
+            return page_end + self.top
+        return top
+
+
+class FlowLayout(StackLayout):
+    """Pack short regions side by side in a column grid within the page width.
+
+    Consecutive auto-placed regions narrower than ``max_item_width`` form a
+    *run*. At reflow each run is laid out as a grid, filled row by row so
+    SMath still evaluates it top-to-bottom, left-to-right in document order.
+    The column count is the largest one whose column widths (the widest
+    region in each column) fit in ``width``, found by trying counts from
+    the widest that could fit down to one, with an O(n) fit check each
+    (see :meth:`_columns`).
+
+    Headings (titles, bordered sections), areas, wide regions and regions
+    preceded by explicit spacing start a new row. While regions are being
+    added they are placed greedily row by row; the grid is applied by
+    :meth:`reflow`, which the worksheet runs before saving.
+    """
+
+    def __init__(self, width: int, top: int = DEFAULT_TOP_START,
+                 left: int = DEFAULT_LEFT, gap: int = REGION_GAP,
+                 column_gap: int = 20, max_item_width: int | None = None,
+                 max_columns: int | None = None) -> None:
+        super().__init__(top=top, left=left, gap=gap)
+        self.width = width
+        self.column_gap = column_gap
+        self.max_item_width = max_item_width if max_item_width is not None else width // 2
+        self.max_columns = max_columns
+        self._row_open = False
+        self._row_top = top
+        self._row_bottom = top
+        self._cursor = left
+
+    @classmethod
+    def from_page_model(cls, page_model: PageModel, dpi: int = 96,
+                        **kwargs: Any) -> FlowLayout:
+        """Create a flow layout spanning the printable width of the page."""
+        return cls(page_model.content_width(dpi), **kwargs)
+
+    def reset(self) -> None:
+        super().reset()
+        self._row_open = False
+
+    def flows(self, region: Region) -> bool:
+        """Whether *region* may share a row with its neighbours."""
+        if isinstance(region, AreaRegion):
+            return False
+        if isinstance(region, TextRegion) and (region.border or region.font_size > FONT_DEFAULT):
+            return False
+        return region_size(region)[0] <= self.max_item_width
+
+    def reflow(self, regions: Sequence[Region]) -> None:
+        with sizing_pass():
+            self.reset()
+            run: list[Region] = []
+            for region in regions:
+                spacing = self._auto.get(id(region))
+                if spacing is not None and self.flows(region):
+                    if spacing:
+                        self._pack(run)
+                        run = []
+                        self._next_top += spacing
+                    run.append(region)
+                    continue
+                self._pack(run)
+                run = []
+                if spacing is None:
+                    self._advance(region)
+                else:
+                    StackLayout._place_auto(self, region, spacing)
+            self._pack(run)
+
+    # -- internals -------------------------------------------------------------
+
+    def _place_auto(self, region: Region, spacing: int) -> None:
+        if spacing or not self.flows(region):
+            self._close_row()
+            super()._place_auto(region, spacing)
+            return
+        w, h = region_size(region)
+        if not self._row_open or self._cursor + w > self.left + self.width:
+            self._close_row()
+            self._row_open = True
+            self._row_top = self._row_bottom = self._next_top
+            self._cursor = self.left
+        region.top = self._row_top
+        region.left = self._cursor
+        self._cursor += w + self.column_gap
+        self._row_bottom = max(self._row_bottom, region.top + h)
+
+    def _advance(self, region: Region) -> None:
+        self._close_row()
+        super()._advance(region)
+
+    def shift(self, delta: int) -> None:
+        self._close_row()
+        super().shift(delta)
+
+    def _close_row(self) -> None:
+        if self._row_open:
+            self._next_top = max(self._next_top, self._row_bottom + self.gap)
+            self._row_open = False
+
+    def _fits(self, widths: Sequence[int], columns: int) -> bool:
+        """Whether the grid of *columns* columns fits, stopping at the first
+        column that makes it overflow."""
+        total = self.column_gap * (columns - 1)
+        for j in range(columns):
+            total += max(widths[j::columns])
+            if total > self.width:
+                return False
+        return True
+
+    def _columns(self, widths: Sequence[int]) -> int:
+        """Largest column count whose grid fits in the available width.
+
+        The grid width does not grow monotonically with the column count
+        (widths 100, 10, 10, 100 give 200 px in two columns but 120 px in
+        three), so neither a binary search nor a bound carried from one
+        count to the next is sound, and counts are tried from the largest
+        down. Column *j* is at least ``widths[j]`` wide, so only counts up
+        to *k*, the number of regions that fit side by side in the first
+        row, are tried: a run of *n* regions costs O(n·k), with *k* at most
+        ``width / (column_gap + narrowest width)``. Runs of many narrow
+        regions are the worst case; the benchmark suite times one.
+        """
+        limit = min(len(widths), self.max_columns or len(widths))
+        k, row = 0, -self.column_gap
+        while k < limit and row + self.column_gap + widths[k] <= self.width:
+            row += self.column_gap + widths[k]
+            k += 1
+        for columns in range(k, 1, -1):
+            if self._fits(widths, columns):
+                return columns
+        return 1
+
+    def _pack(self, run: Sequence[Region]) -> None:
+        """Lay out a run of flowing regions as a row-major grid."""
+        if not run:
+            return
+        self._close_row()
+        sizes = [region_size(r) for r in run]
+        widths = [w for w, _ in sizes]
+        k = self._columns(widths)
+        offsets = [self.left]
+        for j in range(k - 1):
+            offsets.append(offsets[-1] + max(widths[j::k]) + self.column_gap)
+
+        for start in range(0, len(run), k):
+            top = self._next_top
+            bottom = top
+            for j, region in enumerate(run[start:start + k]):
+                region.top = top
+                region.left = offsets[j]
+                bottom = max(bottom, top + sizes[start + j][1])
+            self._next_top = bottom + self.gap
+
+
+# ---------------------------------------------------------------------------
+# Offset tree
+# ---------------------------------------------------------------------------
+
+class _Node:
+    __slots__ = ("region", "prio", "size", "lazy", "left", "right")
+
+    def __init__(self, region: Region) -> None:
+        self.region = region
+        self.prio = random.random()
+        self.size = 1
+        self.lazy = 0  # pending ``top`` shift for this whole subtree
+        self.left: _Node | None = None
+        self.right: _Node | None = None
+
+
+def _size(node: _Node | None) -> int:
+    return node.size if node is not None else 0
+
+
+def _update(node: _Node) -> None:
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _push(node: _Node) -> None:
+    """Apply a node's pending shift to its region and hand it to its children."""
+    if node.lazy:
+        node.region.top += node.lazy
+        if node.left is not None:
+            node.left.lazy += node.lazy
+        if node.right is not None:
+            node.right.lazy += node.lazy
+        node.lazy = 0
+
+
+def _split(node: _Node | None, k: int) -> tuple[_Node | None, _Node | None]:
+    """Split into the first *k* nodes and the rest."""
+    if node is None:
+        return (None, None)
+    _push(node)
+    if _size(node.left) >= k:
+        left, node.left = _split(node.left, k)
+        _update(node)
+        return (left, node)
+    node.right, right = _split(node.right, k - _size(node.left) - 1)
+    _update(node)
+    return (node, right)
+
+
+def _merge(a: _Node | None, b: _Node | None) -> _Node | None:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        _push(a)
+        a.right = _merge(a.right, b)
+        _update(a)
+        return a
+    _push(b)
+    b.left = _merge(a, b.left)
+    _update(b)
+    return b
+
+
+class OffsetTree:
+    """Region sequence with O(log n) insertion, removal and suffix shifts.
+
+    An implicit treap (keyed by position) mirrors ``Worksheet.regions``.
+    Inserting or removing a region shifts the ``top`` of every following
+    region, but the shift is only recorded on O(log n) subtree roots and
+    pushed down lazily: a region's ``top`` is exact once it has been
+    reached through :meth:`get`, and :meth:`flush` settles all of them in
+    one pass (done before serialization).
+    """
+
+    def __init__(self, regions: Sequence[Region] = ()) -> None:
+        # Cartesian-tree construction: O(n) for a sequence in order
+        stack: list[_Node] = []
+        for region in regions:
+            node = _Node(region)
+            last: _Node | None = None
+            while stack and stack[-1].prio < node.prio:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        self._root: _Node | None = stack[0] if stack else None
+        self._fix_sizes()
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def _fix_sizes(self) -> None:
+        order: list[_Node] = []
+        todo = [self._root] if self._root is not None else []
+        while todo:
+            node = todo.pop()
+            order.append(node)
+            todo.extend(c for c in (node.left, node.right) if c is not None)
+        for node in reversed(order):
+            _update(node)
+
+    def get(self, index: int) -> Region:
+        """Return the region at *index* with its ``top`` brought up to date."""
+        if not 0 <= index < len(self):
+            raise IndexError("region index out of range")
+        node = self._root
+        while node is not None:
+            _push(node)
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node.region
+            else:
+                index -= left + 1
+                node = node.right
+        raise IndexError("region index out of range")  # pragma: no cover
+
+    def append(self, region: Region) -> None:
+        """Add a region at the end (no shift)."""
+        self._root = _merge(self._root, _Node(region))
+
+    def insert(self, index: int, region: Region, shift: int = 0) -> None:
+        """Insert *region* at *index* and shift every following region."""
+        left, right = _split(self._root, index)
+        if right is not None:
+            right.lazy += shift
+        self._root = _merge(_merge(left, _Node(region)), right)
+
+    def remove(self, index: int, shift: int = 0) -> Region:
+        """Remove the region at *index* and shift every following region."""
+        if not 0 <= index < len(self):
+            raise IndexError("region index out of range")
+        left, rest = _split(self._root, index)
+        mid, right = _split(rest, 1)
+        assert mid is not None
+        if right is not None:
+            right.lazy += shift
+        self._root = _merge(left, right)
+        return mid.region
+
+    def flush(self) -> None:
+        """Apply every pending shift to the regions."""
+        todo = [self._root] if self._root is not None else []
+        while todo:
+            node = todo.pop()
+            _push(node)
+            todo.extend(c for c in (node.left, node.right) if c is not None)
+
+
+def make_layout(layout: str | StackLayout | None,
+                settings: Settings | None = None) -> StackLayout | None:
+    """Resolve the ``layout`` argument of :class:`Worksheet`.
+
+    ``"stack"`` (or ``None``) keeps the classic fixed-height stacking done
+    in ``Worksheet.add``; ``"auto"`` uses :class:`StackLayout` and
+    ``"page"`` a :class:`PageLayout` sized from ``settings.page_model``;
+    ``"flow"`` a :class:`FlowLayout` spanning the page width. Engine
+    instances are used as is.
+    """
+    if layout is None or layout == "stack":
+        return None
+    if layout == "auto":
+        return StackLayout()
+    if layout == "page":
+        settings = settings or Settings()
+        return PageLayout.from_page_model(settings.page_model, settings.dpi)
+    if layout == "flow":
+        settings = settings or Settings()
+        return FlowLayout.from_page_model(settings.page_model, settings.dpi)
+    if isinstance(layout, StackLayout):
+        return layout
+    raise ValueError(f"Unknown layout: {layout!r}")
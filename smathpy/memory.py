@@ -0,0 +1,355 @@
+"""Memory use of worksheet construction and serialization.
+
+To size workers for batch jobs, :func:`track` traces allocations with
+:mod:`tracemalloc` and attributes them to region types and expression
+sizes::
+
+    with memory.track() as tracker:
+        ws = build_report()
+        with tracker.serializing():
+            ws.save("report.sm")
+    print(tracker.construction.format())
+    print(tracker.serialization.format())
+
+    phase            peak KiB  retained KiB
+    construction       1843.2        1790.5
+    ...
+    region type        count       KiB    elements  B/element
+    MathRegion          9000    1612.4       72000       22.9
+    ...
+    RPN elements       count       KiB    elements  B/element
+    5-8                 7000    1175.0       49000       24.6
+    ...
+    top allocators               KiB  blocks
+    smathpy/expression/builder.py:48   ...
+
+While constructing, the memory allocated since the previous region was
+added to the worksheet is charged to the region being added (its
+expressions are built just before). While serializing, each top-level
+region is charged the memory its XML elements retain, and its elements
+are the ``<e>`` elements written. Regions are grouped by type and by the
+number of RPN elements of their expressions, in powers of two. Each phase
+also reports its peak, the memory it left allocated, and the source lines
+that allocated most of that.
+
+:func:`measure` runs both phases for a builder function (as the benchmark
+suite does). Tracing slows allocation-heavy code several times, so in
+production trace a sample of jobs::
+
+    if random.random() < 0.01:
+        with memory.track() as tracker:
+            ...
+        log.info(tracker.as_dict())
+"""
+
+from __future__ import annotations
+
+import os
+import tracemalloc
+import xml.etree.ElementTree as ET
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from .constants import SMATH_NAMESPACE
+from .regions.area_region import AreaRegion
+from .regions.base import Region
+from .regions.math_region import MathRegion
+from .regions.plot_region import PlotRegion
+
+if TYPE_CHECKING:
+    from .document import Worksheet
+
+DEFAULT_TOP = 10  # allocators listed per phase
+
+_E_TAG = f"{{{SMATH_NAMESPACE}}}e"
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def expr_size(region: Region) -> int:
+    """RPN elements of a region's expressions (input, contract, stored result).
+
+    Plots count their inputs and areas their children's expressions.
+    """
+    if isinstance(region, MathRegion):
+        n = len(region.expr._elements) if region.expr is not None else 0
+        if region.contract_expr is not None:
+            n += len(region.contract_expr._elements)
+        if region.result_elements:
+            n += len(region.result_elements)
+        return n
+    if isinstance(region, PlotRegion):
+        return sum(len(e._elements) for e in region.inputs)
+    if isinstance(region, AreaRegion):
+        return sum(expr_size(child) for child in region.children)
+    return 0
+
+
+def size_bucket(elements: int) -> int:
+    """The power of two at or above *elements* (0 for regions without expressions)."""
+    return 1 << (elements - 1).bit_length() if elements > 0 else 0
+
+
+def _bucket_label(bucket: int) -> str:
+    if bucket <= 2:
+        return str(bucket)
+    return f"{bucket // 2 + 1}-{bucket}"
+
+
+@dataclass
+class MemoryStats:
+    """Regions of one group: how many, the bytes charged to them and their elements."""
+
+    count: int = 0
+    bytes: int = 0
+    elements: int = 0
+
+    @property
+    def bytes_per_element(self) -> float | None:
+        return self.bytes / self.elements if self.elements else None
+
+
+def _stats(table: dict[Any, MemoryStats], key: Any) -> MemoryStats:
+    stats = table.get(key)
+    if stats is None:
+        stats = table[key] = MemoryStats()
+    return stats
+
+
+@dataclass
+class Allocator:
+    """A source line and the memory its allocations still hold."""
+
+    location: str  # "path:line"
+    bytes: int
+    blocks: int
+
+
+@dataclass
+class MemoryProfile:
+    """Traced memory of one phase (``"construction"`` or ``"serialization"``)."""
+
+    phase: str
+    peak: int = 0  # highest traced memory during the phase, above its start
+    retained: int = 0  # traced memory at the end, above the start
+    region_types: dict[str, MemoryStats] = field(default_factory=dict)
+    expr_sizes: dict[int, MemoryStats] = field(default_factory=dict)  # by size_bucket()
+    top: list[Allocator] = field(default_factory=list)
+
+    @property
+    def elements(self) -> int:
+        return sum(s.elements for s in self.region_types.values())
+
+    @property
+    def bytes_per_element(self) -> float | None:
+        """Bytes charged to regions with expressions, per element."""
+        stats = [s for bucket, s in self.expr_sizes.items() if bucket > 0]
+        elements = sum(s.elements for s in stats)
+        return sum(s.bytes for s in stats) / elements if elements else None
+
+    def add_region(self, region: Region, size: int, elements: int) -> None:
+        for stats in (
+            _stats(self.region_types, type(region).__name__),
+            _stats(self.expr_sizes, size_bucket(expr_size(region))),
+        ):
+            stats.count += 1
+            stats.bytes += size
+            stats.elements += elements
+
+    def as_dict(self) -> dict[str, Any]:
+        """The profile as plain data (for JSON logs)."""
+        def table(stats: dict[Any, MemoryStats]) -> dict[str, Any]:
+            return {
+                str(key): {"count": s.count, "bytes": s.bytes, "elements": s.elements}
+                for key, s in stats.items()
+            }
+
+        return {
+            "phase": self.phase,
+            "peak": self.peak,
+            "retained": self.retained,
+            "elements": self.elements,
+            "bytes_per_element": self.bytes_per_element,
+            "region_types": table(self.region_types),
+            "expr_sizes": table(self.expr_sizes),
+            "top": [
+                {"location": a.location, "bytes": a.bytes, "blocks": a.blocks}
+                for a in self.top
+            ],
+        }
+
+    def format(self) -> str:
+        """A plain-text report of the phase."""
+        def rows(title: str, stats: list[tuple[str, MemoryStats]]) -> list[str]:
+            out = [f"{title:<16} {'count':>7} {'KiB':>9} {'elements':>9} {'B/element':>10}"]
+            for name, s in stats:
+                per = s.bytes_per_element
+                out.append(f"{name:<16} {s.count:>7} {s.bytes / 1024:>9.1f} {s.elements:>9} "
+                           f"{'' if per is None else f'{per:.1f}':>10}")
+            return out
+
+        lines = [f"{'phase':<16} {'peak KiB':>9} {'retained KiB':>13}",
+                 f"{self.phase:<16} {self.peak / 1024:>9.1f} {self.retained / 1024:>13.1f}", ""]
+        lines += rows("region type", sorted(self.region_types.items(), key=lambda kv: -kv[1].bytes))
+        lines.append("")
+        lines += rows("RPN elements", [(_bucket_label(b), s) for b, s in sorted(self.expr_sizes.items())])
+        per = self.bytes_per_element
+        if per is not None:
+            lines.append(f"{per:.1f} bytes per element")
+        if self.top:
+            lines.append("")
+            lines.append(f"{'top allocators':<48} {'KiB':>9} {'blocks':>7}")
+            for a in self.top:
+                lines.append(f"{a.location:<48} {a.bytes / 1024:>9.1f} {a.blocks:>7}")
+        return "\n".join(lines)
+
+
+class Tracker:
+    """Attributes traced memory to regions; created by :func:`track`."""
+
+    def __init__(self, top: int = DEFAULT_TOP) -> None:
+        self.construction = MemoryProfile("construction")
+        self.serialization = MemoryProfile("serialization")
+        self.top = top
+        self._active: MemoryProfile | None = None
+        self._start = 0
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._mark = 0
+        self._children = 0
+
+    @property
+    def peak(self) -> int:
+        return max(self.construction.peak, self.serialization.peak)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "peak": self.peak,
+            "construction": self.construction.as_dict(),
+            "serialization": self.serialization.as_dict(),
+        }
+
+    @contextmanager
+    def serializing(self) -> Iterator[MemoryProfile]:
+        """Trace the block as the serialization phase; construction ends here."""
+        if self._active is self.construction:
+            self._end()
+        self._begin(self.serialization)
+        try:
+            yield self.serialization
+        finally:
+            self._end()
+
+    # -- Phases ---------------------------------------------------------------
+
+    def _begin(self, profile: MemoryProfile) -> None:
+        # The snapshot is taken before the mark, so its own memory is not counted
+        self._snapshot = tracemalloc.take_snapshot() if self.top else None
+        tracemalloc.reset_peak()
+        self._start = self._mark = tracemalloc.get_traced_memory()[0]
+        self._active = profile
+
+    def _end(self) -> None:
+        profile = self._active
+        if profile is None:
+            return
+        self._active = None
+        current, peak = tracemalloc.get_traced_memory()
+        profile.peak = max(peak - self._start, 0)
+        profile.retained = current - self._start
+        if self._snapshot is not None:
+            profile.top = _top_allocators(self._snapshot, tracemalloc.take_snapshot(), self.top)
+            self._snapshot = None
+
+    # -- Hooks called by Worksheet --------------------------------------------
+
+    def added(self, region: Region) -> None:
+        """*region* was added: charge it the memory allocated since the last one."""
+        if self._active is not self.construction:
+            return
+        current = tracemalloc.get_traced_memory()[0]
+        self.construction.add_region(region, current - self._mark, expr_size(region))
+        self._mark = current
+
+    def building(self, root: ET.Element) -> None:
+        """The next region's XML is about to be appended to *root*."""
+        if self._active is self.serialization:
+            self._mark = tracemalloc.get_traced_memory()[0]
+            self._children = len(root)
+
+    def built(self, region: Region, root: ET.Element) -> None:
+        """*region*'s XML was appended to *root*: charge it what it retains."""
+        if self._active is not self.serialization:
+            return
+        size = tracemalloc.get_traced_memory()[0] - self._mark
+        elements = sum(1 for child in root[self._children:] for _ in child.iter(_E_TAG))
+        self.serialization.add_region(region, size, elements)
+
+
+def _top_allocators(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot,
+                    limit: int) -> list[Allocator]:
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    top = []
+    for stat in sorted(stats, key=lambda s: -s.size_diff)[:limit]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        top.append(Allocator(f"{_short(frame.filename)}:{frame.lineno}",
+                             stat.size_diff, stat.count_diff))
+    return top
+
+
+def _short(filename: str) -> str:
+    """*filename* relative to the project, or its last two components."""
+    if filename.startswith(_ROOT + os.sep):
+        return os.path.relpath(filename, _ROOT).replace(os.sep, "/")
+    return "/".join(filename.replace(os.sep, "/").split("/")[-2:])
+
+
+_tracker: Tracker | None = None
+
+
+def get_tracker() -> Tracker | None:
+    return _tracker
+
+
+@contextmanager
+def track(top: int = DEFAULT_TOP, frames: int = 1) -> Iterator[Tracker]:
+    """Trace memory inside the block; it is the construction phase until
+    :meth:`Tracker.serializing`.
+
+    Starts :mod:`tracemalloc` (storing *frames* frames per allocation)
+    unless it is already tracing, and stops it again at the end. *top* is
+    the number of allocators listed per phase; 0 skips the snapshots.
+    """
+    global _tracker
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    tracker = Tracker(top)
+    previous, _tracker = _tracker, tracker
+    try:
+        tracker._begin(tracker.construction)
+        yield tracker
+        tracker._end()
+    finally:
+        _tracker = previous
+        if started:
+            tracemalloc.stop()
+
+
+def measure(build: Callable[[], Worksheet],
+            serialize: Callable[[Worksheet], Any] | None = None,
+            top: int = DEFAULT_TOP) -> Tracker:
+    """Trace ``build()`` as construction and *serialize* of its worksheet
+    (default :meth:`~smathpy.Worksheet.to_xml_string`) as serialization.
+    """
+    with track(top) as tracker:
+        ws = build()
+        with tracker.serializing():
+            if serialize is None:
+                ws.to_xml_string()
+            else:
+                serialize(ws)
+    return tracker
@@ -0,0 +1,449 @@
+"""NumPy implementations of SMath numeric built-ins.
+
+These functions compute what ``linterp``, ``cinterp``, ``polyroots``,
+``csort`` and ``solve`` return in SMath Studio, on NumPy arrays, so results
+can be checked in bulk from Python. SMath conventions are kept:
+
+* indices (``csort`` columns) start at 1;
+* polynomial coefficients are in ascending powers, ``v[1] + v[2]·x + …``;
+* ``polyroots`` orders roots by magnitude, the negative one first on ties;
+* when the ordinates are a matrix, each column is interpolated.
+
+Every function accepts arrays of evaluation points, and the ``*_batch``
+variants evaluate many problems of the same shape at once::
+
+    from smathpy import numeric
+    numeric.linterp([0, 1, 2], [0, 10, 40], [0.5, 1.5])    # array([ 5., 25.])
+    numeric.polyroots_batch([[-1, 0, 1], [-4, 0, 1]])      # roots of x²-1, x²-4
+
+Long series can be reduced to a plot-sized number of points that keeps
+their shape (:func:`lttb`, :func:`minmax`) and turned into the matrices a
+:class:`~smathpy.regions.PlotRegion` draws::
+
+    plot_data(x, moment, max_points=500)   # 10⁵ samples → 500-row mat(...)
+    plot_data(x, shear, moment)            # sys(...) of two curves
+
+NumPy is an optional dependency (``pip install smathpy[numeric]``).
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from .expression.builder import Expr
+from .expression.elements import Element, function, operand, operator
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Sub-intervals scanned by solve() to bracket sign changes
+SOLVE_SAMPLES = 1000
+
+
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "smathpy.numeric requires NumPy: pip install smathpy[numeric]"
+        ) from None
+    return numpy
+
+
+def _abscissae(vx: Any) -> np.ndarray:
+    np = _numpy()
+    x = np.asarray(vx, dtype=float).ravel()
+    if x.size < 2:
+        raise ValueError("interpolation needs at least two points")
+    if np.any(np.diff(x) <= 0):
+        raise ValueError("abscissae must be strictly increasing")
+    return x
+
+
+def _ordinates(vy: Any, n: int) -> np.ndarray:
+    np = _numpy()
+    y = np.asarray(vy, dtype=float)
+    if y.ndim == 2 and 1 in y.shape and y.shape[0] != n:
+        y = y.T  # a row vector of ordinates
+    if y.shape[0] != n:
+        raise ValueError("abscissae and ordinates differ in length")
+    return y
+
+
+def _shape_result(values: np.ndarray, x: Any) -> Any:
+    np = _numpy()
+    if np.ndim(x) == 0 and values.ndim == 1:
+        return float(values[0])
+    if np.ndim(x) == 0:
+        return values[0]
+    return values
+
+
+# ---------------------------------------------------------------------------
+# Interpolation
+# ---------------------------------------------------------------------------
+
+def linterp(vx: Any, vy: Any, x: Any) -> Any:
+    """Linear interpolation of ``(vx, vy)`` at *x*; extrapolates from the end segments.
+
+    *vy* may be a matrix with one row per abscissa, in which case every
+    column is interpolated and the result has one row per point of *x*.
+    """
+    np = _numpy()
+    xs = _abscissae(vx)
+    ys = _ordinates(vy, xs.size)
+    t = np.atleast_1d(np.asarray(x, dtype=float)).ravel()
+    k = np.clip(np.searchsorted(xs, t, side="right") - 1, 0, xs.size - 2)
+    w = (t - xs[k]) / (xs[k + 1] - xs[k])
+    if ys.ndim == 2:
+        w = w[:, None]
+    return _shape_result(ys[k] + w * (ys[k + 1] - ys[k]), x)
+
+
+def spline_moments(vx: Any, vy: Any) -> np.ndarray:
+    """Second derivatives of the natural cubic spline through ``(vx, vy)``.
+
+    Solves the tridiagonal system once; pass the result to :func:`cinterp`
+    (``moments=``) to evaluate the same spline repeatedly.
+    """
+    np = _numpy()
+    xs = _abscissae(vx)
+    ys = _ordinates(vy, xs.size)
+    n = xs.size
+    flat = ys.reshape(n, -1)
+    m = np.zeros_like(flat)
+    if n > 2:
+        h = np.diff(xs)
+        slope = np.diff(flat, axis=0) / h[:, None]
+        rhs = 6.0 * np.diff(slope, axis=0)
+        diag = 2.0 * (h[:-1] + h[1:])
+        off = h[1:-1]
+        # Thomas algorithm, all columns at once
+        c = np.zeros(n - 2)
+        d = np.zeros_like(rhs)
+        c[0] = off[0] / diag[0] if n > 3 else 0.0
+        d[0] = rhs[0] / diag[0]
+        for i in range(1, n - 2):
+            den = diag[i] - off[i - 1] * c[i - 1]
+            if i < n - 3:
+                c[i] = off[i] / den
+            d[i] = (rhs[i] - off[i - 1] * d[i - 1]) / den
+        for i in range(n - 4, -1, -1):
+            d[i] -= c[i] * d[i + 1]
+        m[1:-1] = d
+    return m.reshape(ys.shape)
+
+
+def cinterp(vx: Any, vy: Any, x: Any, moments: np.ndarray | None = None) -> Any:
+    """Natural cubic spline interpolation of ``(vx, vy)`` at *x*.
+
+    Outside the data the end polynomials are extended. Matrix ordinates are
+    interpolated column by column, as in :func:`linterp`.
+    """
+    np = _numpy()
+    xs = _abscissae(vx)
+    ys = _ordinates(vy, xs.size)
+    m = spline_moments(xs, ys) if moments is None else np.asarray(moments, dtype=float)
+    t = np.atleast_1d(np.asarray(x, dtype=float)).ravel()
+    k = np.clip(np.searchsorted(xs, t, side="right") - 1, 0, xs.size - 2)
+    h = xs[k + 1] - xs[k]
+    a = (xs[k + 1] - t) / h
+    b = (t - xs[k]) / h
+    if ys.ndim == 2:
+        a, b, h = a[:, None], b[:, None], h[:, None]
+    values = (
+        a * ys[k] + b * ys[k + 1]
+        + ((a**3 - a) * m[k] + (b**3 - b) * m[k + 1]) * h**2 / 6.0
+    )
+    return _shape_result(values, x)
+
+
+def cinterp_batch(vx: Any, vy: Any, x: Any) -> np.ndarray:
+    """Interpolate many data sets sharing *vx*: ``vy`` has shape ``(sets, n)``.
+
+    Returns an array of shape ``(sets, len(x))``.
+    """
+    np = _numpy()
+    ys = np.asarray(vy, dtype=float)
+    return np.atleast_2d(cinterp(vx, ys.T, np.atleast_1d(x))).T
+
+
+def linterp_batch(vx: Any, vy: Any, x: Any) -> np.ndarray:
+    """Linear counterpart of :func:`cinterp_batch`."""
+    np = _numpy()
+    ys = np.asarray(vy, dtype=float)
+    return np.atleast_2d(linterp(vx, ys.T, np.atleast_1d(x))).T
+
+
+# ---------------------------------------------------------------------------
+# Polynomials
+# ---------------------------------------------------------------------------
+
+def _order_roots(roots: np.ndarray, tol: float = 1e-9) -> np.ndarray:
+    """SMath root order along the last axis: by magnitude, then real part, then imaginary."""
+    np = _numpy()
+    scale = np.maximum(np.abs(roots).max(axis=-1, keepdims=True), 1.0) * tol
+    keys = [np.round(k / scale) for k in (roots.imag, roots.real, np.abs(roots))]
+    order = np.lexsort(keys, axis=-1)
+    ordered = np.take_along_axis(roots, order, axis=-1)
+    if np.all(np.abs(ordered.imag) <= scale):
+        return ordered.real
+    return ordered
+
+
+def polyroots(v: Any) -> np.ndarray:
+    """Roots of ``v[1] + v[2]·x + … + v[n]·x^(n-1)`` (coefficients in ascending powers).
+
+    Real when every root is real (within rounding), complex otherwise.
+    """
+    np = _numpy()
+    coeffs = np.trim_zeros(np.asarray(v, dtype=complex).ravel(), "b")
+    if coeffs.size < 2:
+        raise ValueError("polyroots needs a polynomial of degree 1 or more")
+    return _order_roots(np.roots(coeffs[::-1]))
+
+
+def polyroots_batch(vs: Any) -> np.ndarray:
+    """Roots of many polynomials of the same degree, one per row of *vs*.
+
+    The companion matrices are stacked and their eigenvalues computed in a
+    single call. Leading coefficients must be non-zero.
+    """
+    np = _numpy()
+    c = np.atleast_2d(np.asarray(vs, dtype=complex))
+    lead = c[:, -1]
+    if np.any(lead == 0):
+        raise ValueError("leading coefficients must be non-zero")
+    degree = c.shape[1] - 1
+    companion = np.zeros((c.shape[0], degree, degree), dtype=complex)
+    companion[:, 1:, :-1] = np.eye(degree - 1)
+    companion[:, :, -1] = -c[:, :-1] / lead[:, None]
+    return _order_roots(np.linalg.eigvals(companion))
+
+
+# ---------------------------------------------------------------------------
+# Sorting
+# ---------------------------------------------------------------------------
+
+def csort(m: Any, j: int) -> np.ndarray:
+    """Rows of *m* sorted by column *j* (1-based), keeping ties in order."""
+    np = _numpy()
+    a = np.asarray(m)
+    if a.ndim == 1:
+        a = a[:, None]
+    if not 1 <= j <= a.shape[1]:
+        raise IndexError(f"column {j} out of range")
+    return a[np.argsort(a[:, j - 1], kind="stable")]
+
+
+# ---------------------------------------------------------------------------
+# Root finding
+# ---------------------------------------------------------------------------
+
+def _bisect(f: Callable[[np.ndarray], np.ndarray], lo: np.ndarray, hi: np.ndarray,
+            flo: np.ndarray, tol: float) -> np.ndarray:
+    np = _numpy()
+    for _ in range(200):
+        mid = 0.5 * (lo + hi)
+        fmid = f(mid)
+        left = np.sign(fmid) == np.sign(flo)
+        lo = np.where(left, mid, lo)
+        flo = np.where(left, fmid, flo)
+        hi = np.where(left, hi, mid)
+        if np.all(hi - lo <= tol * np.maximum(1.0, np.abs(mid))):
+            break
+    return 0.5 * (lo + hi)
+
+
+def solve(f: Callable[[np.ndarray], np.ndarray], a: float, b: float,
+          samples: int = SOLVE_SAMPLES, tol: float = 1e-14) -> np.ndarray:
+    """All roots of ``f(x) = 0`` in ``[a, b]``, ascending, like ``solve(f, x, a, b)``.
+
+    *f* must accept and return arrays. The interval is scanned on
+    *samples* sub-intervals; every sign change is refined by bisection, so
+    roots of even multiplicity that do not change sign are missed.
+    """
+    np = _numpy()
+    grid = np.linspace(a, b, samples + 1)
+    values = np.asarray(f(grid), dtype=float)
+    exact = grid[values == 0]
+    change = np.nonzero(np.sign(values[:-1]) * np.sign(values[1:]) < 0)[0]
+    roots = _bisect(f, grid[change], grid[change + 1], values[change], tol)
+    return np.unique(np.concatenate([exact, roots]))
+
+
+def solve_batch(f: Callable[[np.ndarray, np.ndarray], np.ndarray], a: Any, b: Any,
+                params: Any, tol: float = 1e-14) -> np.ndarray:
+    """One root of ``f(x, p) = 0`` in ``[a, b]`` for every parameter *p*.
+
+    *a* and *b* may be scalars or arrays matching *params*; ``f(a, p)`` and
+    ``f(b, p)`` must differ in sign. Returns NaN where they do not.
+    """
+    np = _numpy()
+    p = np.asarray(params, dtype=float)
+    lo = np.broadcast_to(np.asarray(a, dtype=float), p.shape).copy()
+    hi = np.broadcast_to(np.asarray(b, dtype=float), p.shape).copy()
+    flo, fhi = f(lo, p), f(hi, p)
+    bracketed = np.sign(flo) * np.sign(fhi) <= 0
+    root = _bisect(lambda x: f(x, p), lo, hi, flo, tol)
+    root = np.where(flo == 0, lo, np.where(fhi == 0, hi, root))
+    return np.where(bracketed, root, np.nan)
+
+
+# ---------------------------------------------------------------------------
+# Plot decimation
+# ---------------------------------------------------------------------------
+
+def _series(x: Any, y: Any) -> tuple[np.ndarray, np.ndarray]:
+    np = _numpy()
+    xs = np.asarray(x, dtype=float).ravel()
+    ys = np.asarray(y, dtype=float).ravel()
+    if xs.size != ys.size:
+        raise ValueError("x and y differ in length")
+    return xs, ys
+
+
+def _bucket_edges(n: int, buckets: int) -> np.ndarray:
+    """Boundaries splitting the interior points ``1 … n-2`` into *buckets* runs."""
+    np = _numpy()
+    return np.linspace(1, n - 1, buckets + 1).astype(np.intp)
+
+
+def lttb(x: Any, y: Any, n_out: int) -> np.ndarray:
+    """Indices of the *n_out* points Largest-Triangle-Three-Buckets keeps.
+
+    The first and last points are always kept; from each bucket in between
+    the point forming the largest triangle with the previously kept point
+    and the average of the next bucket is chosen, which preserves peaks
+    and the overall shape of the curve.
+    """
+    np = _numpy()
+    xs, ys = _series(x, y)
+    n = xs.size
+    if n_out < 3:
+        raise ValueError("lttb keeps at least 3 points")
+    if n_out >= n:
+        return np.arange(n)
+    edges = _bucket_edges(n, n_out - 2)
+    counts = np.diff(edges)
+    # Average of every bucket; the last point stands in for the bucket after the last
+    avg_x = np.append(np.add.reduceat(xs[1:-1], edges[:-1] - 1) / counts, xs[-1])
+    avg_y = np.append(np.add.reduceat(ys[1:-1], edges[:-1] - 1) / counts, ys[-1])
+    keep = np.empty(n_out, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (xs[a] - avg_x[i + 1]) * (ys[lo:hi] - ys[a])
+            - (xs[a] - xs[lo:hi]) * (avg_y[i + 1] - ys[a])
+        )
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(x: Any, y: Any, n_out: int) -> np.ndarray:
+    """Indices of the minimum and maximum of *y* in each of ``(n_out - 2) // 2`` buckets.
+
+    Keeps the first and last points too, so at most *n_out* indices are
+    returned, in ascending order. Cheaper than :func:`lttb` and never
+    clips an extreme value.
+    """
+    np = _numpy()
+    xs, ys = _series(x, y)
+    n = xs.size
+    if n_out < 4:
+        raise ValueError("minmax keeps at least 4 points")
+    if n_out >= n:
+        return np.arange(n)
+    edges = _bucket_edges(n, (n_out - 2) // 2)
+    bucket = np.repeat(np.arange(edges.size - 1), np.diff(edges))
+    order = np.lexsort((ys[1:-1], bucket)) + 1  # by bucket, then by value
+    lowest = order[edges[:-1] - 1]
+    highest = order[edges[1:] - 2]
+    return np.unique(np.concatenate(([0], lowest, highest, [n - 1])))
+
+
+DECIMATORS: dict[str, Callable[[Any, Any, int], Any]] = {"lttb": lttb, "minmax": minmax}
+
+
+def decimate(x: Any, y: Any, n_out: int, method: str = "lttb") -> tuple[np.ndarray, np.ndarray]:
+    """*x* and *y* reduced to at most *n_out* points with *method* (``"lttb"`` or ``"minmax"``)."""
+    try:
+        pick = DECIMATORS[method]
+    except KeyError:
+        raise ValueError(f"unknown decimation method {method!r}") from None
+    xs, ys = _series(x, y)
+    keep = pick(xs, ys, n_out)
+    return xs[keep], ys[keep]
+
+
+def _number(value: float, digits: int) -> list[Element]:
+    np = _numpy()
+    text = np.format_float_positional(
+        abs(value), precision=digits, unique=False, fractional=False, trim="-"
+    )
+    if value < 0 and text != "0":
+        return [operand(text), operator("-", 1)]
+    return [operand(text)]
+
+
+def _points(x: Any, ys: tuple[Any, ...], z: Any, max_points: int | None,
+            method: str) -> list[np.ndarray]:
+    """One ``n×2`` (or ``n×3`` with *z*) array of finite points per series."""
+    np = _numpy()
+    if not ys:
+        raise ValueError("at least one y series is needed")
+    if z is not None:
+        if len(ys) != 1:
+            raise ValueError("a 3D series takes exactly one y")
+        if max_points is not None:
+            raise ValueError("decimation applies to 2D series only")
+        xs, yv = _series(x, ys[0])
+        zs = np.asarray(z, dtype=float).ravel()
+        if zs.size != xs.size:
+            raise ValueError("x and z differ in length")
+        blocks = [np.column_stack((xs, yv, zs))]
+    else:
+        blocks = []
+        for y in ys:
+            xs, yv = _series(x, y)
+            finite = np.isfinite(xs) & np.isfinite(yv)
+            xs, yv = xs[finite], yv[finite]
+            if max_points is not None and xs.size:
+                xs, yv = decimate(xs, yv, max_points, method)
+            blocks.append(np.column_stack((xs, yv)))
+    blocks = [b[np.isfinite(b).all(axis=1)] for b in blocks]
+    if any(b.shape[0] == 0 for b in blocks):
+        raise ValueError("a series has no finite points")
+    return blocks
+
+
+def plot_data(x: Any, *ys: Any, z: Any = None, max_points: int | None = None,
+              method: str = "lttb", digits: int = 6) -> Expr:
+    """The plot input drawing each *ys* series against *x*, decimated to *max_points*.
+
+    One series gives the ``n×2`` matrix ``mat(x, y)``; several give
+    ``sys(M1, …, Mk, k, 1)``, which SMath draws as one curve per matrix.
+    With *z* the single series becomes the ``n×3`` point matrix of a 3D
+    plot. Values are written with *digits* significant digits in
+    positional notation, each distinct value formatted once for all series;
+    non-finite points are dropped.
+    """
+    np = _numpy()
+    blocks = _points(x, ys, z, max_points, method)
+    values, inverse = np.unique(np.concatenate([b.ravel() for b in blocks]), return_inverse=True)
+    literals = [_number(v, digits) for v in values.tolist()]
+    elements: list[Element] = []
+    start = 0
+    for block in blocks:
+        rows, cols = block.shape
+        for k in inverse[start:start + block.size].tolist():
+            elements += literals[k]
+        start += block.size
+        elements += [operand(rows), operand(cols), function("mat", rows * cols + 2)]
+    if len(blocks) > 1:
+        elements += [operand(len(blocks)), operand(1), function("sys", len(blocks) + 2)]
+    return Expr(elements)
@@ -0,0 +1,164 @@
+"""Timing of worksheet serialization, phase by phase.
+
+When a save is slow, a profile shows where the time goes::
+
+    with ws.profile() as profiler:
+        ws.save("beam.sm")
+    print(profiler.last.format())
+
+    phase                ms      %
+    reflow              0.0    0.0
+    ...
+    regions            35.1   19.6
+    indent              8.3    4.6
+    tostring          125.5   70.1
+    write               1.0    0.6
+    total             179.1
+    ...
+    2001 regions, 14000 <e> elements, 825898 bytes
+
+Each serialization (:meth:`~smathpy.Worksheet.to_xml`,
+:meth:`~smathpy.Worksheet.to_xml_string`, :meth:`~smathpy.Worksheet.save`)
+records the time of every phase in :data:`PHASES`, the time and count of
+each region type, and the number of regions, ``<e>`` elements and output
+bytes. To profile every serialization in the process (for example to
+sample production jobs), install a hook::
+
+    profiling.set_hook(lambda profile: log.info(profile.as_dict()))
+
+Nothing is measured while no profiler or hook is active.
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, ContextManager
+
+# Serialization phases, in the order they run
+PHASES = ("reflow", "digest", "settings", "assign_ids", "regions", "indent", "tostring", "write")
+
+
+@dataclass
+class RegionStats:
+    """Regions of one type: how many, and the time spent building them.
+
+    Time is measured per top-level region, so an area's time includes its
+    children; the count includes nested regions.
+    """
+
+    count: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class SerializationProfile:
+    """Timings and counts of one serialization."""
+
+    operation: str  # "to_xml", "to_xml_string" or "save"
+    phases: dict[str, float] = field(default_factory=dict)
+    region_types: dict[str, RegionStats] = field(default_factory=dict)
+    regions: int = 0
+    elements: int = 0  # <e> elements written
+    bytes: int = 0  # output size; 0 for to_xml()
+    seconds: float = 0.0  # whole operation
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Add the time spent in the block to phase *name*."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add_region(self, type_name: str, seconds: float) -> None:
+        stats = self.region_types.get(type_name)
+        if stats is None:
+            stats = self.region_types[type_name] = RegionStats()
+        stats.seconds += seconds
+
+    def count_region(self, type_name: str) -> None:
+        stats = self.region_types.get(type_name)
+        if stats is None:
+            stats = self.region_types[type_name] = RegionStats()
+        stats.count += 1
+        self.regions += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        """The profile as plain data (for JSON logs)."""
+        return {
+            "operation": self.operation,
+            "seconds": self.seconds,
+            "phases": dict(self.phases),
+            "region_types": {
+                name: {"count": s.count, "seconds": s.seconds}
+                for name, s in self.region_types.items()
+            },
+            "regions": self.regions,
+            "elements": self.elements,
+            "bytes": self.bytes,
+        }
+
+    def format(self) -> str:
+        """A plain-text table of phases and region types."""
+        total = self.seconds or 1.0
+        lines = [f"{'phase':<14} {'ms':>8} {'%':>6}"]
+        for name in sorted(self.phases, key=_phase_order):
+            t = self.phases[name]
+            lines.append(f"{name:<14} {t * 1000:>8.1f} {100 * t / total:>6.1f}")
+        lines.append(f"{'total':<14} {self.seconds * 1000:>8.1f}")
+        lines.append("")
+        lines.append(f"{'region type':<16} {'count':>7} {'ms':>8}")
+        for name, s in sorted(self.region_types.items(), key=lambda kv: -kv[1].seconds):
+            lines.append(f"{name:<16} {s.count:>7} {s.seconds * 1000:>8.1f}")
+        lines.append("")
+        lines.append(f"{self.regions} regions, {self.elements} <e> elements, {self.bytes} bytes")
+        return "\n".join(lines)
+
+
+def _phase_order(name: str) -> int:
+    return PHASES.index(name) if name in PHASES else len(PHASES)
+
+
+class Profiler:
+    """Collects the profiles of serializations run inside :meth:`Worksheet.profile`."""
+
+    def __init__(self, callback: Callable[[SerializationProfile], Any] | None = None) -> None:
+        self.runs: list[SerializationProfile] = []
+        self.callback = callback
+
+    @property
+    def last(self) -> SerializationProfile | None:
+        return self.runs[-1] if self.runs else None
+
+    def record(self, profile: SerializationProfile) -> None:
+        self.runs.append(profile)
+        if self.callback is not None:
+            self.callback(profile)
+
+
+_hook: Callable[[SerializationProfile], Any] | None = None
+
+
+def set_hook(
+    callback: Callable[[SerializationProfile], Any] | None,
+) -> Callable[[SerializationProfile], Any] | None:
+    """Profile every serialization in the process; returns the previous hook.
+
+    Pass ``None`` to stop.
+    """
+    global _hook
+    previous, _hook = _hook, callback
+    return previous
+
+
+def get_hook() -> Callable[[SerializationProfile], Any] | None:
+    return _hook
+
+
+def phase(profile: SerializationProfile | None, name: str) -> ContextManager[None]:
+    """:meth:`SerializationProfile.phase`, or a no-op without a profile."""
+    return nullcontext() if profile is None else profile.phase(name)
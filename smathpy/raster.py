@@ -0,0 +1,319 @@
+"""Offline PNG previews of plots.
+
+SMath Studio draws a plot only when it recalculates the worksheet, so a
+report opened without recalculation shows empty frames, and a worksheet
+with many plots is slow to open. This module rasterizes plot data with the
+standard library only (line and point drawing into an RGB buffer, PNG
+encoding with :mod:`zlib`) and wraps the image in a
+:class:`~smathpy.regions.PictureRegion`::
+
+    ws.add(preview(x, shear, moment, width=500, height=300))
+
+    plots = [PlotRegion.from_series(x, m) for m in moments]
+    pictures = preview_all(plots, workers=8)   # same position and size as each plot
+
+Plots whose inputs are data matrices (literal ``mat(...)``, ``sys(...)``
+of matrices, or names holding matrices in an evaluator) can be previewed;
+function inputs and 3D plots cannot.
+"""
+
+from __future__ import annotations
+
+import math
+import struct
+import zlib
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from .evaluator import EvaluationError, Evaluator, Matrix, Quantity
+from .expression.builder import Expr
+from .expression.tree import Node, to_tree
+from .regions.picture_region import PictureRegion
+from .regions.plot_region import PlotRegion
+
+Color = tuple[int, int, int]
+
+BACKGROUND: Color = (255, 255, 255)
+GRID: Color = (225, 225, 225)
+AXES: Color = (0, 0, 0)
+# Curve colors in the order SMath assigns them
+PALETTE: tuple[Color, ...] = (
+    (0, 0, 255), (255, 0, 0), (0, 128, 0), (255, 0, 255),
+    (0, 128, 128), (128, 0, 0), (128, 128, 0), (0, 0, 128),
+)
+
+DEFAULT_WIDTH = 400
+DEFAULT_HEIGHT = 300
+MARGIN = 8
+GRID_DIVISIONS = 10
+
+Series = tuple[Sequence[float], Sequence[float]]
+
+
+# ---------------------------------------------------------------------------
+# Canvas
+# ---------------------------------------------------------------------------
+
+class Canvas:
+    """An RGB pixel buffer with line and point drawing."""
+
+    def __init__(self, width: int, height: int, background: Color = BACKGROUND) -> None:
+        if width < 1 or height < 1:
+            raise ValueError("canvas size must be positive")
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(background) * (width * height))
+
+    def set(self, x: int, y: int, color: Color) -> None:
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = 3 * (y * self.width + x)
+            self.pixels[i:i + 3] = bytes(color)
+
+    def hline(self, y: int, color: Color) -> None:
+        if 0 <= y < self.height:
+            i = 3 * y * self.width
+            self.pixels[i:i + 3 * self.width] = bytes(color) * self.width
+
+    def vline(self, x: int, color: Color) -> None:
+        if 0 <= x < self.width:
+            c = bytes(color)
+            for i in range(3 * x, len(self.pixels), 3 * self.width):
+                self.pixels[i:i + 3] = c
+
+    def line(self, x0: int, y0: int, x1: int, y1: int, color: Color) -> None:
+        """Bresenham line from ``(x0, y0)`` to ``(x1, y1)``, clipped to the canvas."""
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            self.set(x0, y0, color)
+            if x0 == x1 and y0 == y1:
+                return
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def point(self, x: int, y: int, color: Color, radius: int = 1) -> None:
+        """A filled square of side ``2·radius + 1`` centred on ``(x, y)``."""
+        for py in range(y - radius, y + radius + 1):
+            for px in range(x - radius, x + radius + 1):
+                self.set(px, py, color)
+
+    def png(self, level: int = 6) -> bytes:
+        """The canvas as a PNG file (8-bit RGB, no filtering)."""
+        return encode_png(self.width, self.height, self.pixels, level)
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(width: int, height: int, rgb: bytes | bytearray, level: int = 6) -> bytes:
+    """Encode packed 8-bit RGB rows as a PNG file."""
+    stride = 3 * width
+    if len(rgb) != stride * height:
+        raise ValueError("pixel buffer does not match the image size")
+    view = memoryview(rgb)
+    # Filter type 0 (none) in front of every scanline
+    raw = b"".join(b"\x00" + view[y * stride:(y + 1) * stride] for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk(b"IHDR", header)
+        + _chunk(b"IDAT", zlib.compress(raw, level))
+        + _chunk(b"IEND", b"")
+    )
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+def _floats(values: Any) -> list[float]:
+    if hasattr(values, "tolist"):  # NumPy arrays
+        values = values.tolist()
+    return [float(v) for v in values]
+
+
+def _range(values: Iterable[float]) -> tuple[float, float]:
+    finite = [v for v in values if math.isfinite(v)]
+    if not finite:
+        return -1.0, 1.0
+    lo, hi = min(finite), max(finite)
+    if lo == hi:
+        pad = abs(lo) * 0.5 or 1.0
+        return lo - pad, hi + pad
+    return lo, hi
+
+
+def render_png(series: Sequence[Series], width: int = DEFAULT_WIDTH,
+               height: int = DEFAULT_HEIGHT, render: str = "lines", grid: bool = True,
+               axes: bool = True, level: int = 6) -> bytes:
+    """Draw ``(x, y)`` series, scaled to fit, and return the PNG bytes.
+
+    *render* is ``"lines"`` or ``"points"``, as in :class:`PlotRegion`.
+    Non-finite points break a line.
+    """
+    if render not in ("lines", "points"):
+        raise ValueError(f"cannot render {render!r} plots")
+    data = [(_floats(x), _floats(y)) for x, y in series]
+    for xs, ys in data:
+        if len(xs) != len(ys):
+            raise ValueError("x and y differ in length")
+    x_lo, x_hi = _range(v for xs, _ in data for v in xs)
+    y_lo, y_hi = _range(v for _, ys in data for v in ys)
+    canvas = Canvas(width, height)
+    inner_w = max(width - 2 * MARGIN - 1, 1)
+    inner_h = max(height - 2 * MARGIN - 1, 1)
+
+    def px(v: float) -> int:
+        return MARGIN + round((v - x_lo) / (x_hi - x_lo) * inner_w)
+
+    def py(v: float) -> int:
+        return height - 1 - MARGIN - round((v - y_lo) / (y_hi - y_lo) * inner_h)
+
+    if grid:
+        for k in range(GRID_DIVISIONS + 1):
+            canvas.vline(MARGIN + round(k * inner_w / GRID_DIVISIONS), GRID)
+            canvas.hline(MARGIN + round(k * inner_h / GRID_DIVISIONS), GRID)
+    if axes:
+        canvas.vline(px(min(max(0.0, x_lo), x_hi)), AXES)
+        canvas.hline(py(min(max(0.0, y_lo), y_hi)), AXES)
+    for n, (xs, ys) in enumerate(data):
+        color = PALETTE[n % len(PALETTE)]
+        previous = None
+        for x, y in zip(xs, ys):
+            if not (math.isfinite(x) and math.isfinite(y)):
+                previous = None
+                continue
+            current = (px(x), py(y))
+            if render == "points":
+                canvas.point(*current, color)
+            elif previous is not None:
+                canvas.line(*previous, *current, color)
+            else:
+                canvas.set(*current, color)
+            previous = current
+    return canvas.png(level)
+
+
+# ---------------------------------------------------------------------------
+# Plot regions
+# ---------------------------------------------------------------------------
+
+def _expr(node: Node) -> Expr:
+    elements = []
+    stack = [node]
+    while stack:  # children before their operator, as in RPN
+        n = stack.pop()
+        elements.append(n.element)
+        stack.extend(n.children)
+    return Expr(elements[::-1])
+
+
+def _number(node: Node) -> float | None:
+    if node.is_number():
+        return float(node.value)
+    if node.type == "operator" and node.value == "-" and len(node.children) == 1:
+        v = _number(node.children[0])
+        return None if v is None else -v
+    return None
+
+
+def _literal(node: Node) -> Matrix | None:
+    """A ``mat(...)`` of number literals read directly, without evaluation."""
+    if node.type != "function" or node.value != "mat" or len(node.children) < 3:
+        return None
+    values = [_number(child) for child in node.children]
+    if any(v is None for v in values):
+        return None
+    rows, cols = int(values[-2]), int(values[-1])
+    return Matrix(rows, cols, values[:-2])
+
+
+def _matrix_series(value: Any) -> Series:
+    if type(value) is not Matrix or value.cols < 2:
+        raise EvaluationError("plot input is not an n×2 data matrix")
+    cells = [c.value if type(c) is Quantity else c for c in value.cells]
+    if not all(type(c) is float for c in cells):
+        raise EvaluationError("plot data must be numeric")
+    c = value.cols
+    return cells[0::c], cells[1::c]
+
+
+def plot_series(region: PlotRegion, evaluator: Evaluator | None = None) -> list[Series]:
+    """The ``(x, y)`` series drawn by a 2D plot whose inputs are data matrices.
+
+    Inputs are evaluated with *evaluator*, so they may name matrices
+    defined earlier in a worksheet; ``sys(M1, …, Mk, k, 1)`` gives one series
+    per matrix. Raises :class:`~smathpy.evaluator.EvaluationError` for
+    anything else.
+    """
+    if region.plot_type != "2d":
+        raise EvaluationError(f"cannot preview {region.plot_type} plots")
+    evaluator = evaluator if evaluator is not None else Evaluator()
+    series: list[Series] = []
+    for expr in region.inputs:
+        root = to_tree(expr)
+        if root.type == "function" and root.value == "sys":
+            parts = root.children[:-2]
+        else:
+            parts = [root]
+        for part in parts:
+            value = _literal(part)
+            if value is None:
+                value = evaluator.evaluate(_expr(part))
+            series.append(_matrix_series(value))
+    return series
+
+
+def _picture(png: bytes, region: PlotRegion) -> PictureRegion:
+    return PictureRegion.from_bytes(
+        png, left=region.left, top=region.top, width=region.width, height=region.height,
+    )
+
+
+def preview_plot(region: PlotRegion, evaluator: Evaluator | None = None,
+                 level: int = 6) -> PictureRegion:
+    """A picture of *region*, at its position and size."""
+    return _picture(_render(region, plot_series(region, evaluator), level), region)
+
+
+def _render(region: PlotRegion, series: list[Series], level: int) -> bytes:
+    return render_png(
+        series, region.width or DEFAULT_WIDTH, region.height or DEFAULT_HEIGHT,
+        region.render, region.grid, region.axes, level,
+    )
+
+
+def preview_all(regions: Iterable[PlotRegion], evaluator: Evaluator | None = None,
+                workers: int | None = None, level: int = 6) -> list[PictureRegion]:
+    """:func:`preview_plot` for many plots, rendered in a thread pool.
+
+    Plot data is read first, in order (the evaluator is not thread-safe);
+    drawing and compression then run concurrently. ``workers=1`` renders in
+    the calling thread.
+    """
+    regions = list(regions)
+    evaluator = evaluator if evaluator is not None else Evaluator()
+    series = [plot_series(r, evaluator) for r in regions]
+    if workers == 1 or len(regions) <= 1:
+        images = [_render(r, s, level) for r, s in zip(regions, series)]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            images = list(pool.map(_render, regions, series, [level] * len(regions)))
+    return [_picture(png, r) for png, r in zip(images, regions)]
+
+
+def preview(x: Any, *ys: Any, width: int = DEFAULT_WIDTH, height: int = DEFAULT_HEIGHT,
+            render: str = "lines", grid: bool = True, axes: bool = True,
+            **kwargs: Any) -> PictureRegion:
+    """A picture of the curves *ys* against *x*; *kwargs* go to the region."""
+    png = render_png([(x, y) for y in ys], width, height, render, grid, axes)
+    return PictureRegion.from_bytes(png, width=width, height=height, **kwargs)
@@ -2,6 +2,7 @@
 
 from .area_region import AreaRegion
 from .base import Region
+from .fragment_region import FragmentRegion
 from .math_region import MathRegion
 from .picture_region import PictureRegion
 from .plot_region import PlotRegion
@@ -14,4 +15,5 @@ __all__ = [
     "PlotRegion",
     "PictureRegion",
     "AreaRegion",
+    "FragmentRegion",
 ]
@@ -3,12 +3,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
+from typing import TypeVar
 
 from ..constants import COLOR_BLACK, COLOR_WHITE
 from .base import Region
 
+R = TypeVar("R", bound=Region)
 
-@dataclass
+
+@dataclass(slots=True)
 class AreaRegion(Region):
     """A collapsible area that contains child regions.
 
@@ -19,6 +22,11 @@ class AreaRegion(Region):
         area.add(MathRegion.assignment('y', 10))
 
     The area will automatically get a terminator region during serialization.
+    Areas can be nested to any depth::
+
+        chapter = AreaRegion()
+        section = chapter.add(AreaRegion(collapsed=True))
+        section.add(MathRegion.assignment('z', 1))
     """
 
     collapsed: bool = False
@@ -29,7 +37,11 @@ class AreaRegion(Region):
     width: int | None = None
     height: int | None = None
 
-    def add(self, region: Region) -> Region:
+    # Assigned during serialization, like ``id``
+    terminator_id: int | None = field(default=None, compare=False, repr=False)
+    terminator_top: int | None = field(default=None, compare=False, repr=False)
+
+    def add(self, region: R) -> R:
         """Add a child region to this collapsible area."""
         self.children.append(region)
         return region
@@ -7,7 +7,7 @@ from dataclasses import dataclass, field
 from ..constants import COLOR_BLACK, COLOR_WHITE, FONT_DEFAULT
 
 
-@dataclass
+@dataclass(slots=True)
 class Region:
     """Base class for all SMath regions.
 
@@ -0,0 +1,47 @@
+"""Fragment region for pre-serialized regions of another worksheet."""
+
+from __future__ import annotations
+
+import copy
+import xml.etree.ElementTree as ET
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from ..constants import SMATH_NAMESPACE
+from .base import Region
+
+_REGION_TAG = f"{{{SMATH_NAMESPACE}}}region"
+
+
+@dataclass(slots=True)
+class FragmentRegion(Region):
+    """Already serialized ``<region>`` elements, written out verbatim.
+
+    Created by ``Worksheet.fragment()`` and added with
+    ``Worksheet.include(module, fragment=True)``. On output the elements are
+    copied with their ids renumbered and their tops shifted so that the
+    first element lands on ``top``. The regions inside are opaque to the
+    symbol index.
+
+    ``width`` and ``height`` hold the extent of the fragment so layout
+    engines can place it like any other region.
+    """
+
+    elements: list[ET.Element] = field(default_factory=list, metadata={"hash": False})
+    origin: int = 0  # top of the first element as serialized
+    id_count: int = 0  # number of ids used, including nested and terminator regions
+    digest: str = ""  # content digest of the source worksheet
+
+    def iter_elements(self) -> Iterator[ET.Element]:
+        """Yield output copies of the elements with ids from ``self.id``."""
+        next_id = self.id if self.id is not None else 0
+        delta = self.top - self.origin
+        for element in self.elements:
+            dup = copy.deepcopy(element)
+            for el in dup.iter(_REGION_TAG):
+                el.set("id", str(next_id))
+                next_id += 1
+                top = el.get("top")
+                if top is not None:
+                    el.set("top", str(int(top) + delta))
+            yield dup
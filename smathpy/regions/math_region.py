@@ -11,7 +11,7 @@ from ..expression.elements import Element, unit_operand, operator
 from .base import Region
 
 
-@dataclass
+@dataclass(slots=True)
 class MathRegion(Region):
     """A math region containing an RPN expression, optional result, contract, and description.
 
@@ -3,14 +3,75 @@
 from __future__ import annotations
 
 import base64
-from dataclasses import dataclass
+import hashlib
+import mmap
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from .base import Region
 
+if TYPE_CHECKING:
+    from ..cache import PictureCache
 
-@dataclass
+# Files at least this large are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1 << 20
+# Raw bytes per streamed base64 chunk; a multiple of 3, so chunks concatenate
+CHUNK_SIZE = 3 << 16
+
+
+@dataclass(slots=True)
+class PictureSource:
+    """Image bytes that are read and base64-encoded only when written.
+
+    Holds either a file *path* or an in-memory *data* buffer. Saving a
+    worksheet streams the encoding in chunks straight into the output file.
+    """
+
+    path: str | None = None
+    data: bytes | None = None
+
+    @contextmanager
+    def _buffer(self) -> Iterator[Any]:
+        if self.data is not None:
+            yield memoryview(self.data)
+            return
+        if self.path is None:
+            raise ValueError("picture source has neither a path nor data")
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    yield m
+            else:
+                yield f.read()
+
+    def head(self, n: int) -> bytes:
+        """The first *n* bytes of the image."""
+        with self._buffer() as buf:
+            return bytes(buf[:n])
+
+    def chunks(self, size: int = CHUNK_SIZE) -> Iterator[str]:
+        """The base64 encoding of the image, in pieces of *size* raw bytes."""
+        if size % 3:
+            raise ValueError("chunk size must be a multiple of 3")
+        with self._buffer() as buf:
+            for start in range(0, len(buf), size):
+                yield base64.b64encode(buf[start:start + size]).decode("ascii")
+
+    def encode(self) -> str:
+        """The whole base64 encoding."""
+        return "".join(self.chunks())
+
+    def sha256(self) -> str:
+        """Hex SHA-256 of the image bytes."""
+        with self._buffer() as buf:
+            return hashlib.sha256(buf).hexdigest()
+
+
+@dataclass(slots=True)
 class PictureRegion(Region):
     """A picture region for embedding base64-encoded images.
 
@@ -19,31 +80,88 @@ class PictureRegion(Region):
         # From file
         pic = PictureRegion.from_file('diagram.png')
 
+        # From file, read and encoded only while saving
+        pic = PictureRegion.from_file('photo.jpg', lazy=True)
+
+        # From file, encoded once for all worksheets sharing the cache
+        pic = PictureRegion.from_file('logo.png', cache=pictures)
+
         # From raw base64
         pic = PictureRegion(data_base64='iVBORw0KGgo...', format='png')
     """
 
-    data_base64: str | None = None
+    # Digests hash the image bytes (see sha256()), not how they are held
+    data_base64: str | None = field(default=None, metadata={"hash": False})
     format: str = "png"
+    # Lazy alternative to data_base64
+    source: PictureSource | None = field(default=None, metadata={"hash": False})
 
     @classmethod
-    def from_file(cls, path: str, **kwargs: Any) -> PictureRegion:
-        """Create a picture region from an image file."""
-        p = Path(path)
-        with open(p, "rb") as f:
-            data = base64.b64encode(f.read()).decode("ascii")
+    def from_file(cls, path: str, lazy: bool = False, cache: PictureCache | None = None,
+                  **kwargs: Any) -> PictureRegion:
+        """Create a picture region from an image file.
 
+        With *lazy*, only the path is recorded; the file is read (memory-mapped
+        when large) and encoded when the worksheet is written. With a
+        *cache*, the encoded data is shared with every other picture of the
+        same content.
+        """
+        p = Path(path)
         fmt = p.suffix.lstrip(".").lower()
         if fmt == "jpg":
             fmt = "jpeg"
 
+        if lazy:
+            if cache is not None:
+                raise ValueError("lazy pictures are encoded while saving and not cached")
+            return cls(format=fmt, source=PictureSource(path=str(p)), **kwargs)
+
+        if cache is not None:
+            return cls(data_base64=cache.encode_file(p), format=fmt, **kwargs)
+
+        with open(p, "rb") as f:
+            data = base64.b64encode(f.read()).decode("ascii")
+
         return cls(data_base64=data, format=fmt, **kwargs)
 
     @classmethod
-    def from_bytes(cls, data: bytes, fmt: str = "png", **kwargs: Any) -> PictureRegion:
-        """Create a picture region from raw image bytes."""
+    def from_bytes(cls, data: bytes, fmt: str = "png", lazy: bool = False,
+                   cache: PictureCache | None = None, **kwargs: Any) -> PictureRegion:
+        """Create a picture region from raw image bytes.
+
+        With *lazy*, the bytes are kept and encoded when the worksheet is
+        written; with a *cache*, see :meth:`from_file`.
+        """
+        if lazy:
+            if cache is not None:
+                raise ValueError("lazy pictures are encoded while saving and not cached")
+            return cls(format=fmt, source=PictureSource(data=bytes(data)), **kwargs)
+        if cache is not None:
+            return cls(data_base64=cache.encode(data), format=fmt, **kwargs)
         return cls(
             data_base64=base64.b64encode(data).decode("ascii"),
             format=fmt,
             **kwargs,
         )
+
+    def encoded(self) -> str | None:
+        """The base64 image data, encoding a lazy source if needed."""
+        if self.source is not None:
+            return self.source.encode()
+        return self.data_base64
+
+    def sha256(self) -> str | None:
+        """Hex SHA-256 of the image bytes, whether eager or lazy (``None`` without data)."""
+        if self.source is not None:
+            return self.source.sha256()
+        if self.data_base64 is None:
+            return None
+        return hashlib.sha256(base64.b64decode(self.data_base64)).hexdigest()
+
+    def head(self, n: int) -> bytes:
+        """The first *n* bytes of the image (empty without image data)."""
+        if self.source is not None:
+            return self.source.head(n)
+        if not self.data_base64:
+            return b""
+        return base64.b64decode(self.data_base64[:-(-n // 3) * 4])[:n]
@@ -3,13 +3,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
+from typing import Any
 
 from ..constants import COLOR_BLACK, COLOR_WHITE
 from ..expression.builder import Expr
+from ..numeric import plot_data
 from .base import Region
 
 
-@dataclass
+@dataclass(slots=True)
 class PlotRegion(Region):
     """A plot region for 2D (and potentially 3D) charts.
 
@@ -39,6 +41,23 @@ class PlotRegion(Region):
     animate: str | None = None
     show_input_data: bool = True
 
+    @classmethod
+    def from_series(cls, x: Any, *ys: Any, z: Any = None, max_points: int | None = None,
+                    method: str = "lttb", digits: int = 6, **kwargs: Any) -> PlotRegion:
+        """Plot NumPy series directly: one curve per *ys* against *x*.
+
+        The data matrices are built by :func:`smathpy.numeric.plot_data`
+        (decimated to *max_points* with *method*). With *z* the plot is 3D.
+
+        Usage::
+
+            PlotRegion.from_series(x, shear, moment, max_points=500, width=500)
+        """
+        if z is not None:
+            kwargs.setdefault("plot_type", "3d")
+        data = plot_data(x, *ys, z=z, max_points=max_points, method=method, digits=digits)
+        return cls(inputs=[data], **kwargs)
+
     def plot_xml_attribs(self) -> dict:
         """Return XML attributes for the <plot> element."""
         attribs = {
@@ -71,7 +90,9 @@ class PlotRegion(Region):
 
     def xml_attribs(self) -> dict:
         """Override to add showInputData."""
-        attribs = super().xml_attribs()
+        # Zero-argument super() breaks in slots=True dataclasses (the class
+        # is recreated), so call the base implementation explicitly.
+        attribs = Region.xml_attribs(self)
         if not self.show_input_data:
             attribs["showInputData"] = "False"
         return attribs
@@ -9,7 +9,7 @@ from ..constants import COLOR_BLACK, COLOR_BLUE, COLOR_WHITE, FONT_DEFAULT, FONT
 from .base import Region
 
 
-@dataclass
+@dataclass(slots=True)
 class TextRegion(Region):
     """A text region supporting multilingual paragraphs.
 
@@ -56,6 +56,23 @@ class PageModel:
     header_color: str = "#a9a9a9"
     footer_color: str = "#a9a9a9"
 
+    def paper_size(self) -> tuple[int, int]:
+        """Return the (width, height) of the paper in 1/100 inch, as oriented."""
+        w, h = int(self.paper_width), int(self.paper_height)
+        if self.orientation.lower() == "landscape":
+            return (h, w)
+        return (w, h)
+
+    def content_width(self, dpi: int = 96) -> int:
+        """Printable width in worksheet pixels (paper width minus margins)."""
+        w = self.paper_size()[0] - self.margin_left - self.margin_right
+        return w * dpi // 100
+
+    def content_height(self, dpi: int = 96) -> int:
+        """Printable height in worksheet pixels (paper height minus margins)."""
+        h = self.paper_size()[1] - self.margin_top - self.margin_bottom
+        return h * dpi // 100
+
 
 @dataclass
 class Assembly:
@@ -73,6 +90,7 @@ class Settings:
     # Identity
     doc_id: str = field(default_factory=lambda: str(uuid.uuid4()))
     revision: int = 1
+    deterministic_id: bool = False  # derive doc_id from a content hash on save
 
     # Metadata (multiple languages)
     metadata: list[Metadata] = field(default_factory=lambda: [Metadata()])
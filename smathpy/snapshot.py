@@ -0,0 +1,422 @@
+"""Compact binary snapshots of the worksheet model.
+
+A snapshot stores everything needed to rebuild a :class:`Worksheet` —
+settings, regions, expressions and layout state — so a model built in one
+process can be serialized to ``.sm`` later in another::
+
+    data = ws.dump_binary("beam.smpb")
+    ws = Worksheet.load_binary("beam.smpb")   # memory-mapped
+
+File layout::
+
+    magic "SMPB", u8 format version, u8 token width (1, 2 or 4 bytes)
+    u32 length of the string blob, string blob (UTF-8)
+    token array     unsigned little-endian integers of the token width:
+      strings       count, then the length in characters of each string
+      schema        count, then per record class: name, field count, names
+      elements      count, then per element: flags (type code, has args,
+                    has style, preserve), value, [args], [style]
+      body          tagged values (see ``_T_*``): settings, layout, legacy
+                    layout state, regions, auto-placement spacings
+
+Strings (names, values, styles, text) and RPN elements are interned, so each
+distinct one is stored once; expressions are lists of element indices.
+Dataclass records list only the fields that differ from the class defaults,
+as (field index, value) pairs. Field names are resolved on load, so
+fields added in later versions keep their defaults. The token array is
+decoded with a single ``array`` call, which keeps loading fast.
+"""
+
+from __future__ import annotations
+
+import base64
+import inspect
+import mmap
+import os
+import struct
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+from dataclasses import dataclass, fields
+from itertools import accumulate, islice
+from typing import Any
+
+from .cache import _SKIPPED_FIELDS
+from .expression.builder import Expr
+from .expression.elements import Element
+from .layout import FlowLayout, PageLayout, StackLayout
+from .regions.area_region import AreaRegion
+from .regions.base import Region
+from .regions.fragment_region import FragmentRegion
+from .regions.math_region import MathRegion
+from .regions.picture_region import PictureRegion, PictureSource
+from .regions.plot_region import PlotRegion
+from .regions.text_region import TextRegion
+from .settings import Assembly, Metadata, PageModel, Settings
+
+MAGIC = b"SMPB"
+FORMAT_VERSION = 1
+
+# Value tags
+_T_NONE, _T_FALSE, _T_TRUE, _T_INT, _T_BIGINT, _T_FLOAT, _T_STR = range(7)
+_T_LIST, _T_TUPLE, _T_DICT, _T_RECORD, _T_EXPR, _T_ELEMENT, _T_XML = range(7, 14)
+_T_BYTES = 14  # stored base64-encoded in the string table
+
+_ELEMENT_TYPES = ("operand", "operator", "function", "bracket")
+_HAS_ARGS, _HAS_STYLE, _PRESERVE, _OTHER_TYPE = 0x04, 0x08, 0x10, 0x20
+
+_TOKEN_TYPES = {1: "B", 2: "H", 4: "I"}
+_MAX_INT_TOKEN = 1 << 16  # larger ints go to the string table, keeping tokens narrow
+
+_RECORD_CLASSES: dict[str, type] = {
+    cls.__name__: cls
+    for cls in (
+        Settings, Metadata, PageModel, Assembly,
+        Region, TextRegion, MathRegion, PlotRegion, PictureRegion, AreaRegion,
+        FragmentRegion, PictureSource,
+    )
+}
+_CONSTANTS = (None, False, True)  # values of _T_NONE, _T_FALSE, _T_TRUE
+
+_LAYOUT_CLASSES: dict[str, type[StackLayout]] = {
+    cls.__name__: cls for cls in (StackLayout, PageLayout, FlowLayout)
+}
+
+
+@dataclass
+class Snapshot:
+    """Decoded contents of a snapshot, ready to populate a worksheet."""
+
+    settings: Settings
+    layout: StackLayout | None
+    next_top: int
+    pending_spacing: int
+    auto_layout: bool
+    regions: list[Region]
+    spacings: list[int | None]  # auto-placement spacing, per region in iter_regions order
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+class _Encoder:
+    def __init__(self) -> None:
+        self.tokens: list[int] = []
+        self.strings: dict[str, int] = {}
+        self.elements: dict[tuple, int] = {}
+        self.element_list: list[Element] = []
+        self.classes: dict[type, tuple[int, list[str], list[Any]]] = {}
+
+    def string(self, s: str) -> int:
+        index = self.strings.get(s)
+        if index is None:
+            index = self.strings[s] = len(self.strings)
+        return index
+
+    def element(self, e: Element) -> int:
+        key = (e.type, e.value, e.args, e.style, e.preserve)
+        index = self.elements.get(key)
+        if index is None:
+            index = self.elements[key] = len(self.element_list)
+            self.element_list.append(e)
+        return index
+
+    def record_class(self, cls: type) -> tuple[int, list[str], list[Any]]:
+        info = self.classes.get(cls)
+        if info is None:
+            if _RECORD_CLASSES.get(cls.__name__) is not cls:
+                raise TypeError(f"cannot snapshot {cls.__name__} objects")
+            names = [f.name for f in fields(cls) if f.name not in _SKIPPED_FIELDS]
+            template = cls()
+            defaults = [getattr(template, n) for n in names]
+            if cls is Settings:
+                defaults[names.index("doc_id")] = None
+            info = self.classes[cls] = (len(self.classes), names, defaults)
+        return info
+
+    def value(self, v: Any) -> None:
+        out = self.tokens
+        t = type(v)
+        if t is str:
+            out.append(_T_STR)
+            out.append(self.string(v))
+        elif v is None:
+            out.append(_T_NONE)
+        elif v is True:
+            out.append(_T_TRUE)
+        elif v is False:
+            out.append(_T_FALSE)
+        elif t is int:
+            n = v << 1 if v >= 0 else (-v << 1) - 1  # zigzag
+            if n < _MAX_INT_TOKEN:
+                out.append(_T_INT)
+                out.append(n)
+            else:
+                out.append(_T_BIGINT)
+                out.append(self.string(str(v)))
+        elif t is float:
+            out.append(_T_FLOAT)
+            out.append(self.string(repr(v)))
+        elif t is Expr:
+            out.append(_T_EXPR)
+            out.append(len(v._elements))
+            element = self.element
+            out.extend([element(e) for e in v._elements])
+        elif t is Element:
+            out.append(_T_ELEMENT)
+            out.append(self.element(v))
+        elif t is list or t is tuple:
+            out.append(_T_LIST if t is list else _T_TUPLE)
+            out.append(len(v))
+            for item in v:
+                self.value(item)
+        elif t is dict:
+            out.append(_T_DICT)
+            out.append(len(v))
+            for k, item in v.items():
+                self.value(k)
+                self.value(item)
+        elif t is ET.Element:
+            out.append(_T_XML)
+            out.append(self.string(ET.tostring(v, encoding="unicode")))
+        elif t is bytes:
+            out.append(_T_BYTES)
+            out.append(self.string(base64.b64encode(v).decode("ascii")))
+        else:
+            self.record(v)
+
+    def record(self, obj: Any) -> None:
+        code, names, defaults = self.record_class(type(obj))
+        changed = []
+        for i, name in enumerate(names):
+            value = getattr(obj, name)
+            default = defaults[i]
+            if value is not default and value != default:
+                changed.append((i, value))
+        out = self.tokens
+        out.append(_T_RECORD)
+        out.append(code)
+        out.append(len(changed))
+        for i, value in changed:
+            out.append(i)
+            self.value(value)
+
+    def finish(self) -> bytes:
+        head: list[int] = []
+        # Schema and element strings must be interned before the table is written
+        schema = sorted(self.classes.items(), key=lambda item: item[1][0])
+        head.append(len(schema))
+        for cls, (_, names, _) in schema:
+            head.append(self.string(cls.__name__))
+            head.append(len(names))
+            head.extend(self.string(n) for n in names)
+
+        head.append(len(self.element_list))
+        for e in self.element_list:
+            if e.type in _ELEMENT_TYPES:
+                flags = _ELEMENT_TYPES.index(e.type)
+            else:
+                flags = _OTHER_TYPE
+            flags |= (_HAS_ARGS if e.args is not None else 0) | \
+                (_HAS_STYLE if e.style is not None else 0) | (_PRESERVE if e.preserve else 0)
+            head.append(flags)
+            if flags & _OTHER_TYPE:
+                head.append(self.string(e.type))
+            head.append(self.string(e.value))
+            if e.args is not None:
+                head.append(e.args)
+            if e.style is not None:
+                head.append(self.string(e.style))
+
+        strings = list(self.strings)
+        tokens = [len(strings)]
+        tokens.extend(map(len, strings))
+        tokens.extend(head)
+        tokens.extend(self.tokens)
+
+        top = max(tokens)
+        width = 1 if top < 1 << 8 else 2 if top < 1 << 16 else 4
+        packed = array(_TOKEN_TYPES[width], tokens)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        blob = "".join(strings).encode("utf-8")
+        return b"".join((
+            MAGIC, bytes((FORMAT_VERSION, width)), struct.pack("<I", len(blob)),
+            blob, packed.tobytes(),
+        ))
+
+
+def _layout_spec(layout: StackLayout | None) -> tuple[str, dict[str, Any]] | None:
+    if layout is None:
+        return None
+    cls = type(layout)
+    if _LAYOUT_CLASSES.get(cls.__name__) is not cls:
+        raise TypeError(f"cannot snapshot layout engine {cls.__name__}")
+    params = inspect.signature(cls.__init__).parameters
+    return (cls.__name__, {n: getattr(layout, n) for n in params if n != "self"})
+
+
+def encode(
+    settings: Settings,
+    layout: StackLayout | None,
+    next_top: int,
+    pending_spacing: int,
+    auto_layout: bool,
+    regions: list[Region],
+    spacings: list[int | None],
+) -> bytes:
+    """Encode worksheet state as a snapshot."""
+    enc = _Encoder()
+    for value in (settings, _layout_spec(layout), next_top, pending_spacing,
+                  auto_layout, regions, spacings):
+        enc.value(value)
+    return enc.finish()
+
+
+# ---------------------------------------------------------------------------
+# Decoding
+# ---------------------------------------------------------------------------
+
+class _Decoder:
+    def __init__(self, buf: Any) -> None:
+        if len(buf) < 10 or bytes(buf[:4]) != MAGIC:
+            raise ValueError("not a smathpy snapshot")
+        version, width = buf[4], buf[5]
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot version {version}")
+        if width not in _TOKEN_TYPES:
+            raise ValueError(f"corrupt snapshot: token width {width}")
+        (blob_len,) = struct.unpack_from("<I", buf, 6)
+        text = str(buf[10:10 + blob_len], "utf-8")
+        tokens = array(_TOKEN_TYPES[width])
+        tokens.frombytes(buf[10 + blob_len:])
+        if sys.byteorder == "big":
+            tokens.byteswap()
+
+        self.tokens = iter(tokens.tolist())
+        self.next = nxt = self.tokens.__next__
+        lengths = [nxt() for _ in range(nxt())]
+        ends = list(accumulate(lengths))
+        self.strings = [text[end - n:end] for n, end in zip(lengths, ends)]
+        self.schema = self._read_schema()
+        self.elements = self._read_elements()
+
+    def _read_schema(self) -> list[tuple[type, list[str | None]]]:
+        nxt, strings = self.next, self.strings
+        schema = []
+        for _ in range(nxt()):
+            name = strings[nxt()]
+            cls = _RECORD_CLASSES.get(name)
+            if cls is None:
+                raise ValueError(f"unknown record class {name!r} in snapshot")
+            known = {f.name for f in fields(cls)}
+            names = [strings[nxt()] for _ in range(nxt())]
+            schema.append((cls, [n if n in known else None for n in names]))
+        return schema
+
+    def _read_elements(self) -> list[Element]:
+        nxt, strings = self.next, self.strings
+        elements = []
+        for _ in range(nxt()):
+            flags = nxt()
+            etype = strings[nxt()] if flags & _OTHER_TYPE else _ELEMENT_TYPES[flags & 0x03]
+            value = strings[nxt()]
+            args = nxt() if flags & _HAS_ARGS else None
+            style = strings[nxt()] if flags & _HAS_STYLE else None
+            elements.append(Element(etype, value, args, style, True if flags & _PRESERVE else None))
+        return elements
+
+    def value(self) -> Any:
+        return self._value(self.next())
+
+    def _value(self, tag: int) -> Any:
+        nxt, strings = self.next, self.strings
+        if tag == _T_STR:
+            return strings[nxt()]
+        if tag == _T_RECORD:
+            cls, names = self.schema[nxt()]
+            kwargs = {}
+            for _ in range(nxt()):
+                name = names[nxt()]
+                tag = nxt()
+                # Scalars inline: most field values are strings and small ints
+                if tag == _T_STR:
+                    value = strings[nxt()]
+                elif tag == _T_INT:
+                    n = nxt()
+                    value = (n >> 1) ^ -(n & 1)
+                elif tag <= _T_TRUE:
+                    value = _CONSTANTS[tag]
+                else:
+                    value = self._value(tag)
+                if name is not None:
+                    kwargs[name] = value
+            return cls(**kwargs)
+        if tag == _T_INT:
+            n = nxt()
+            return (n >> 1) ^ -(n & 1)
+        if tag <= _T_TRUE:
+            return _CONSTANTS[tag]
+        if tag == _T_EXPR:
+            expr = Expr()
+            expr._elements = list(map(self.elements.__getitem__, islice(self.tokens, nxt())))
+            return expr
+        if tag == _T_LIST:
+            return [self.value() for _ in range(nxt())]
+        if tag == _T_ELEMENT:
+            return self.elements[nxt()]
+        if tag == _T_TUPLE:
+            return tuple([self.value() for _ in range(nxt())])
+        if tag == _T_DICT:
+            result = {}
+            for _ in range(nxt()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        if tag == _T_FLOAT:
+            return float(strings[nxt()])
+        if tag == _T_BIGINT:
+            return int(strings[nxt()])
+        if tag == _T_XML:
+            return ET.fromstring(strings[nxt()])
+        if tag == _T_BYTES:
+            return base64.b64decode(strings[nxt()])
+        raise ValueError(f"corrupt snapshot: unknown tag {tag}")
+
+
+def decode(buf: Any) -> Snapshot:
+    """Decode a snapshot from a bytes-like or memory-mapped buffer."""
+    dec = _Decoder(buf)
+    try:
+        settings = dec.value()
+        spec = dec.value()
+        layout = None
+        if spec is not None:
+            name, params = spec
+            cls = _LAYOUT_CLASSES.get(name)
+            if cls is None:
+                raise ValueError(f"unknown layout engine {name!r} in snapshot")
+            layout = cls(**params)
+        return Snapshot(
+            settings=settings,
+            layout=layout,
+            next_top=dec.value(),
+            pending_spacing=dec.value(),
+            auto_layout=dec.value(),
+            regions=dec.value(),
+            spacings=dec.value(),
+        )
+    except (StopIteration, IndexError):
+        raise ValueError("corrupt snapshot: truncated or inconsistent data") from None
+
+
+def read(path: str | os.PathLike[str]) -> Snapshot:
+    """Decode a snapshot file, memory-mapping it."""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return decode(f.read())
+        with mm:
+            return decode(mm)
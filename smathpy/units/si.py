@@ -0,0 +1,64 @@
+"""SI definitions of the unit names used in worksheets.
+
+Every unit maps to a factor and a dimension vector over the SI base units
+(m, kg, s, A, K, mol, cd), so that ``kN`` is ``(1000.0, (1, 1, -2, 0, 0, 0, 0))``.
+Angles are dimensionless (``rad`` is 1).
+"""
+
+from __future__ import annotations
+
+import math
+
+Dims = tuple[int, int, int, int, int, int, int]
+
+DIMENSIONLESS: Dims = (0, 0, 0, 0, 0, 0, 0)
+BASE_UNITS = ("m", "kg", "s", "A", "K", "mol", "cd")
+
+_M = (1, 0, 0, 0, 0, 0, 0)
+_KG = (0, 1, 0, 0, 0, 0, 0)
+_S = (0, 0, 1, 0, 0, 0, 0)
+_A = (0, 0, 0, 1, 0, 0, 0)
+_K = (0, 0, 0, 0, 1, 0, 0)
+_MOL = (0, 0, 0, 0, 0, 1, 0)
+_CD = (0, 0, 0, 0, 0, 0, 1)
+_M2 = (2, 0, 0, 0, 0, 0, 0)
+_M3 = (3, 0, 0, 0, 0, 0, 0)
+_N = (1, 1, -2, 0, 0, 0, 0)
+_PA = (-1, 1, -2, 0, 0, 0, 0)
+_J = (2, 1, -2, 0, 0, 0, 0)
+_W = (2, 1, -3, 0, 0, 0, 0)
+
+_G0 = 9.80665  # standard gravity, m/s²
+_LB = 0.45359237
+_IN = 0.0254
+
+UNITS: dict[str, tuple[float, Dims]] = {
+    # Length
+    "m": (1.0, _M), "km": (1e3, _M), "dm": (0.1, _M), "cm": (0.01, _M),
+    "mm": (1e-3, _M), "μm": (1e-6, _M), "in": (_IN, _M), "ft": (12 * _IN, _M),
+    "yd": (36 * _IN, _M), "mi": (63360 * _IN, _M),
+    # Area & volume
+    "ha": (1e4, _M2), "L": (1e-3, _M3), "mL": (1e-6, _M3),
+    # Mass
+    "kg": (1.0, _KG), "g": (1e-3, _KG), "mg": (1e-6, _KG), "t": (1e3, _KG),
+    "lb": (_LB, _KG),
+    # Time
+    "s": (1.0, _S), "ms": (1e-3, _S), "min": (60.0, _S), "hr": (3600.0, _S),
+    "h": (3600.0, _S), "day": (86400.0, _S),
+    # Force
+    "N": (1.0, _N), "kN": (1e3, _N), "MN": (1e6, _N), "kgf": (_G0, _N),
+    "tf": (1e3 * _G0, _N), "lbf": (_LB * _G0, _N), "kip": (1e3 * _LB * _G0, _N),
+    # Pressure / stress
+    "Pa": (1.0, _PA), "kPa": (1e3, _PA), "MPa": (1e6, _PA), "GPa": (1e9, _PA),
+    "bar": (1e5, _PA), "psi": (_LB * _G0 / _IN**2, _PA),
+    "ksi": (1e3 * _LB * _G0 / _IN**2, _PA),
+    # Energy & power
+    "J": (1.0, _J), "kJ": (1e3, _J), "W": (1.0, _W), "kW": (1e3, _W),
+    # Other base units
+    "A": (1.0, _A), "K": (1.0, _K), "mol": (1.0, _MOL), "cd": (1.0, _CD),
+    # Angle
+    "rad": (1.0, DIMENSIONLESS), "°": (math.pi / 180, DIMENSIONLESS),
+}
+
+# Named SI units used to display results whose dimension matches exactly
+DERIVED_UNITS: dict[Dims, str] = {_N: "N", _PA: "Pa", _J: "J", _W: "W"}
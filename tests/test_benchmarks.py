@@ -0,0 +1,144 @@
+"""Tests for the benchmark suite.
+
+The timing run itself is marked ``benchmark`` and deselected by default;
+run it with ``pytest -m benchmark``. ``SMATHPY_BENCH_THRESHOLD`` sets the
+allowed slowdown (default 0.5), ``SMATHPY_BENCH_ROUNDS`` the number of
+rounds (default 5), ``SMATHPY_BENCH_SIZES`` the synthetic
+sizes (comma-separated) and ``SMATHPY_BENCH_OUTPUT`` a JSON file for the
+results.
+"""
+
+import json
+import os
+
+import pytest
+
+from benchmarks import suite
+from smathpy.layout import region_size
+
+
+def _document(calibration, **seconds):
+    return {
+        "calibration": calibration,
+        "results": {name: {"seconds": s} for name, s in seconds.items()},
+    }
+
+
+class TestCompare:
+    def test_threshold(self):
+        baseline = _document(1.0, a=0.100, b=0.100)
+        current = _document(1.0, a=0.120, b=0.130)
+        regressions = suite.compare(current, baseline, threshold=0.25)
+        assert [r.name for r in regressions] == ["b"]
+        assert regressions[0].ratio == pytest.approx(1.3)
+        assert suite.compare(current, baseline, threshold=0.5) == []
+
+    def test_normalized_by_calibration(self):
+        # Twice as slow on a machine that is twice as slow: no regression
+        baseline = _document(0.01, a=0.100)
+        assert suite.compare(_document(0.02, a=0.200), baseline) == []
+        assert suite.compare(_document(0.01, a=0.200), baseline)
+
+    def test_noise_floor_and_new_cases(self):
+        baseline = _document(1.0, tiny=0.0001)
+        current = _document(1.0, tiny=0.0005, new=1.0)
+        assert suite.compare(current, baseline) == []
+
+    def test_save_floor(self):
+        baseline = _document(1.0, **{"a/save": 0.005, "a/serialize": 0.005})
+        current = _document(1.0, **{"a/save": 0.008, "a/serialize": 0.008})
+        assert [r.name for r in suite.compare(current, baseline)] == ["a/serialize"]
+
+    def test_format(self):
+        baseline = _document(1.0, a=0.100)
+        table = suite.format_results(_document(1.0, a=0.150, b=0.010), baseline)
+        assert "+50.0%" in table
+        assert "b" in table.splitlines()[-1]
+
+
+class TestCases:
+    def test_example_build_intercepts_save(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        save = suite.Worksheet.save
+        ws = suite.build_example(suite.load_example("generate_beam"))
+        assert len(ws.regions) > 0
+        assert not (tmp_path / "output").exists()
+        assert suite.Worksheet.save is save
+        ws.save(str(tmp_path / "beam.sm"))
+        assert (tmp_path / "beam.sm").exists()
+
+    def test_synthetic_worksheet(self):
+        ws = suite.synthetic_worksheet(30)
+        assert len(ws.regions) == 30
+        assert ws.to_xml_string().count("<region ") == 30
+
+    def test_run_document(self):
+        document = suite.run(examples=["generate_gcd"], sizes=[20], chain_sizes=[10],
+                             repeats=1, rounds=1, flow_sizes=[50])
+        data = json.loads(json.dumps(document))
+        assert data["version"] == suite.FORMAT_VERSION and data["calibration"] > 0
+        assert set(data["results"]) == {
+            "example/generate_gcd/build", "example/generate_gcd/serialize",
+            "example/generate_gcd/save", "synthetic/20/build",
+            "synthetic/20/serialize", "synthetic/20/save", "expr/chain/10",
+            "layout/flow/50",
+        }
+        assert data["results"]["synthetic/20/save"]["regions"] == 20
+
+    def test_median_of_rounds(self, monkeypatch):
+        # Each time is divided by the calibration timed after it
+        rounds = iter([(0.010, 1.0), (0.040, 2.0), (0.090, 3.0)])
+
+        def time_round(cases, chain_sizes, flows, repeats, directory, progress):
+            seconds, calibration = next(rounds)
+            return {"a": {"seconds": seconds, "calibration": calibration, "terms": 1}}
+
+        monkeypatch.setattr(suite, "_time_round", time_round)
+        document = suite.run(examples=[], sizes=[], chain_sizes=[], rounds=3, flow_sizes=[])
+        assert document["calibration"] == 2.0
+        assert document["results"]["a"] == {
+            "seconds": pytest.approx(0.040), "terms": 1, "rounds": [0.010, 0.040, 0.090],
+        }
+
+    def test_memory_traces(self):
+        document = suite.run(examples=[], sizes=[20], chain_sizes=[], repeats=1, rounds=1,
+                             memory=True, flow_sizes=[])
+        trace = document["memory"]["synthetic/20"]
+        assert trace["construction"]["region_types"]["MathRegion"]["count"] == 18
+        assert trace["serialization"]["bytes_per_element"] > 0
+        assert "synthetic/20" in suite.format_memory(document)
+        assert "memory" not in suite.run(examples=[], sizes=[], chain_sizes=[], repeats=1,
+                                         rounds=1, flow_sizes=[])
+
+    def test_baseline_covers_default_cases(self):
+        baseline = suite.load(suite.BASELINE)
+        names = set(baseline["results"])
+        for example in suite.EXAMPLES:
+            assert f"example/{example}/save" in names
+        for n in suite.SIZES:
+            assert f"synthetic/{n}/build" in names
+        for n in suite.FLOW_SIZES:
+            assert f"layout/flow/{n}" in names
+
+    def test_flow_worksheet_is_a_worst_case(self):
+        # Many more regions fit in the first row than columns in the grid
+        ws = suite.flow_worksheet(1000)
+        ws.reflow()
+        widths = [region_size(r)[0] for r in ws.regions]
+        first_row = next(k for k in range(len(widths)) if sum(widths[:k + 1]) > ws.layout.width)
+        assert 1 < len({r.left for r in ws.regions}) < first_row // 4
+
+
+@pytest.mark.benchmark
+def test_no_regressions():
+    sizes = os.environ.get("SMATHPY_BENCH_SIZES")
+    threshold = float(os.environ.get("SMATHPY_BENCH_THRESHOLD", suite.DEFAULT_THRESHOLD))
+    rounds = int(os.environ.get("SMATHPY_BENCH_ROUNDS", suite.DEFAULT_ROUNDS))
+    current = suite.run(sizes=[int(s) for s in sizes.split(",")] if sizes else suite.SIZES,
+                        rounds=rounds)
+    output = os.environ.get("SMATHPY_BENCH_OUTPUT")
+    if output:
+        suite.dump(current, output)
+    baseline = suite.load(suite.BASELINE)
+    regressions = suite.compare(current, baseline, threshold)
+    assert not regressions, "\n" + suite.format_results(current, baseline)
@@ -0,0 +1,168 @@
+"""Tests for content digests, deterministic ids and the output cache."""
+
+import base64
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from smathpy import (
+    MathRegion, OutputCache, PictureCache, PictureRegion, Settings, TextRegion, Worksheet, assign,
+)
+from smathpy.constants import SMATH_NAMESPACE
+
+
+def _build(value=5, deterministic=True):
+    ws = Worksheet(title="Cache", settings=Settings(deterministic_id=deterministic))
+    ws.add(TextRegion.title("Cached worksheet"))
+    ws.add(MathRegion(expr=assign("x", value), show_result=True))
+    return ws
+
+
+def _doc_id(xml_str):
+    root = ET.fromstring(xml_str.split("\n", 2)[2])
+    return root.find(f".//{{{SMATH_NAMESPACE}}}id").text
+
+
+class TestDigest:
+    def test_same_model_same_digest(self):
+        assert _build().digest() == _build().digest()
+
+    def test_content_change_changes_digest(self):
+        assert _build(5).digest() != _build(6).digest()
+
+    def test_random_ids_make_digests_differ(self):
+        assert _build(deterministic=False).digest() != _build(deterministic=False).digest()
+
+    def test_deterministic_output_is_byte_identical(self):
+        a, b = _build().to_xml_string(), _build().to_xml_string()
+        assert a == b
+        assert _doc_id(a) == _build().document_id()
+
+    def test_deterministic_id_tracks_content(self):
+        assert _build(5).document_id() != _build(6).document_id()
+
+    def test_explicit_doc_id_used_when_not_deterministic(self):
+        ws = _build(deterministic=False)
+        ws.settings.doc_id = "fixed-id"
+        assert _doc_id(ws.to_xml_string()) == "fixed-id"
+
+    def test_eager_and_lazy_pictures_hash_alike(self, tmp_path):
+        logo = tmp_path / "logo.png"
+        logo.write_bytes(b"\x89PNG logo")
+        sheets = []
+        for lazy in (False, True):
+            ws = Worksheet(settings=Settings(deterministic_id=True))
+            ws.add(PictureRegion.from_file(str(logo), lazy=lazy))
+            sheets.append(ws)
+        eager, lazy = sheets
+        assert eager.digest() == lazy.digest()
+        assert eager.document_id() == lazy.document_id()
+        assert eager.to_xml_string() == lazy.to_xml_string()
+        logo.write_bytes(b"\x89PNG other")
+        assert lazy.digest() != eager.digest()
+
+
+class TestOutputCache:
+    def test_miss_then_skip(self, tmp_path):
+        cache = OutputCache(tmp_path / "cache")
+        out = tmp_path / "out" / "a.sm"
+
+        assert cache.save(_build(), out) == "miss"
+        assert cache.save(_build(), out) == "skipped"
+        assert (cache.misses, cache.skipped) == (1, 1)
+        assert out.read_text(encoding="utf-8") == _build().to_xml_string()
+
+    def test_hit_links_to_new_target(self, tmp_path):
+        cache = OutputCache(tmp_path / "cache")
+        _build().save(str(tmp_path / "a.sm"), cache=cache)
+        _build().save(str(tmp_path / "b.sm"), cache=cache)
+
+        assert cache.hits == 1
+        entry = cache.entry_path(_build().digest())
+        assert os.path.samefile(entry, tmp_path / "b.sm")
+
+    def test_changed_model_rewrites(self, tmp_path):
+        cache = OutputCache(tmp_path / "cache")
+        out = tmp_path / "a.sm"
+        _build(5).save(str(out), cache=cache)
+        _build(6).save(str(out), cache=cache)
+
+        assert cache.misses == 2
+        assert ">6<" in out.read_text(encoding="utf-8")
+
+    def test_copy_mode(self, tmp_path):
+        cache = OutputCache(tmp_path / "cache", link=False)
+        out = tmp_path / "a.sm"
+        cache.save(_build(), out)
+
+        assert not os.path.samefile(cache.entry_path(_build().digest()), out)
+        assert cache.save(_build(), out) == "hit"
+
+
+class TestPictureCache:
+    def test_file_encoded_once(self, tmp_path):
+        logo = tmp_path / "logo.png"
+        logo.write_bytes(b"\x89PNG logo")
+        cache = PictureCache()
+        pics = [PictureRegion.from_file(str(logo), cache=cache) for _ in range(3)]
+        assert pics[0].data_base64 == base64.b64encode(b"\x89PNG logo").decode()
+        assert all(p.data_base64 is pics[0].data_base64 for p in pics)
+        assert (cache.misses, cache.hits) == (1, 2)
+
+    def test_identical_content_shares_payload(self, tmp_path):
+        a, b = tmp_path / "a.png", tmp_path / "b.png"
+        a.write_bytes(b"same")
+        b.write_bytes(b"same")
+        cache = PictureCache()
+        assert cache.encode_file(a) is cache.encode_file(b) is cache.encode(b"same")
+        assert len(cache) == 1
+
+    def test_changed_file_is_reencoded(self, tmp_path):
+        img = tmp_path / "sketch.png"
+        img.write_bytes(b"v1")
+        cache = PictureCache()
+        cache.encode_file(img)
+        img.write_bytes(b"v2, longer")
+        assert cache.encode_file(img) == base64.b64encode(b"v2, longer").decode()
+
+    def test_lru_eviction_by_size(self):
+        cache = PictureCache(max_bytes=20)
+        for data in (b"aaaaaaaaa", b"bbbbbbbbb", b"ccccccccc"):  # 12 characters each
+            cache.encode(data)
+        assert len(cache) == 1 and cache.size == 12
+        cache.encode(b"ccccccccc")
+        assert cache.hits == 1
+
+    def test_disk_shared_between_caches(self, tmp_path):
+        first = PictureCache(directory=tmp_path / "pictures")
+        payload = first.encode(b"detail drawing")
+        second = PictureCache(directory=tmp_path / "pictures")
+        assert second.encode(b"detail drawing") == payload
+        assert (second.disk_hits, second.misses) == (1, 0)
+
+    def test_threads(self):
+        cache = PictureCache()
+        images = [bytes([i % 4]) * 1000 for i in range(64)]
+        with ThreadPoolExecutor(8) as pool:
+            payloads = list(pool.map(cache.encode, images))
+        assert len(cache) == 4
+        assert len({id(p) for p in payloads}) == 4
+        assert cache.hits + cache.misses == 64
+
+    def test_evicted_files_are_forgotten(self, tmp_path):
+        cache = PictureCache(max_bytes=20)
+        paths = []
+        for i in range(5):
+            path = tmp_path / f"p{i}.png"
+            path.write_bytes(bytes([i]) * 9)  # 12 base64 characters each
+            paths.append(path)
+            cache.encode_file(path)
+        assert len(cache._files) == len(cache) == 1
+        assert cache.encode_file(paths[0]) == base64.b64encode(bytes([0]) * 9).decode()
+        assert len(cache._files) == 1
+
+    def test_lazy_pictures_are_not_cached(self, tmp_path):
+        with pytest.raises(ValueError, match="lazy"):
+            PictureRegion.from_bytes(b"x", lazy=True, cache=PictureCache())
@@ -0,0 +1,215 @@
+"""Tests for the expression tree, symbol index and dependency graph."""
+
+import pytest
+
+from smathpy import (
+    AreaRegion, MathRegion, PlotRegion, TextRegion, Worksheet, assign, call, define,
+    func_assign, var,
+)
+from smathpy.dependencies import expr_symbols
+from smathpy.evaluator import Evaluator
+from smathpy.expression import (
+    Expr, el, for_range, if_, line, operator, range_, sum_, to_tree,
+)
+
+
+class TestTree:
+    def test_structure(self):
+        root = to_tree(var("x") ** 2 + 3)
+        assert root.value == "+"
+        assert root.children[0].value == "^"
+        assert [c.value for c in root.children[0].children] == ["x", "2"]
+
+    def test_malformed(self):
+        with pytest.raises(ValueError):
+            to_tree(Expr([operator("+", 2)]))
+        with pytest.raises(ValueError):
+            to_tree(Expr(var("a").elements + var("b").elements))
+
+    def test_deep_expression(self):
+        expr = var("x0")
+        for i in range(1, 3000):
+            expr = expr + var(f"x{i}")
+        assert len(expr_symbols(expr).uses) == 3000
+
+
+class TestExprSymbols:
+    def test_assignment(self):
+        s = expr_symbols(assign("A_s", var("b") * var("d") / var("f_y")))
+        assert s.defines == ["A_s"]
+        assert s.uses == {"b", "d", "f_y"}
+
+    def test_function_parameters_and_recursion_are_bound(self):
+        body = if_(var("n").eq(0), 1, var("x") * call("H", var("n") - 1, "x") + var("c"))
+        s = expr_symbols(func_assign("H", ["n", "x"], body))
+        assert s.defines == ["H"]
+        assert s.uses == {"c"}
+
+    def test_loop_and_sum_variables_are_bound(self):
+        loop = for_range("i", range_(1, "n"), assign("s", var("s") + var("i")))
+        s = expr_symbols(line(assign("s", 0), loop, sum_(var("k"), "k", 1, "m")))
+        assert s.defines == ["s"]
+        assert s.uses == {"n", "m"}
+
+    def test_units_numbers_and_builtins_ignored(self):
+        s = expr_symbols(assign("L", (var("a") @ "m") + 2.5 * call("sqrt", "π")))
+        assert s.uses == {"a"}
+
+    def test_element_assignment(self):
+        expr = Expr(el("A", "i").elements + var("v").elements + [operator(":", 2)])
+        s = expr_symbols(expr)
+        assert s.defines == ["A"]
+        assert s.uses == {"A", "i", "v"}
+
+
+class TestSymbolIndex:
+    def _ws(self):
+        ws = Worksheet()
+        ws.add(MathRegion.assignment("f_y", 420, unit_name="MPa"))
+        ws.add(MathRegion.assignment("b", 300))
+        ws.add(MathRegion.assignment("d", 450))
+        ws.add(MathRegion(expr=assign("A_s", var("b") * var("d") / var("f_y"))))
+        ws.add(MathRegion.evaluation("A_s"))
+        return ws
+
+    def test_lookup(self):
+        ws = self._ws()
+        idx = ws.symbols
+        assert idx.definition_of("A_s") is ws.regions[3]
+        assert idx.users_of("f_y") == [ws.regions[3]]
+        assert idx.definitions_of("missing") == []
+
+    def test_incremental_add(self):
+        ws = self._ws()
+        idx = ws.symbols
+        new = ws.add(MathRegion(expr=assign("rho", var("A_s") / (var("b") * var("d")))))
+        assert ws.symbols is idx
+        assert idx.users_of("A_s")[-1] is new
+
+    def test_rebuilt_after_insert(self):
+        ws = self._ws()
+        idx = ws.symbols
+        ws.insert(0, MathRegion.assignment("k", 1))
+        assert ws.symbols is not idx
+        assert ws.symbols.definition_of("k") is ws.regions[0]
+
+    def test_topological_order(self):
+        ws = self._ws()
+        order = ws.symbols.graph().topological_order()
+        pos = {id(r): i for i, r in enumerate(order)}
+        assert pos[id(ws.regions[3])] > pos[id(ws.regions[0])]
+        assert pos[id(ws.regions[4])] > pos[id(ws.regions[3])]
+
+    def test_dependencies(self):
+        ws = self._ws()
+        g = ws.symbols.graph()
+        assert g.dependencies(ws.regions[4]) == [ws.regions[3]]
+        assert g.dependencies(ws.regions[4], transitive=True) == ws.regions[:4]
+        assert g.dependents(ws.regions[1]) == [ws.regions[3]]
+
+    def test_redefinition_binds_to_nearest(self):
+        ws = Worksheet()
+        ws.add(MathRegion.assignment("x", 1))
+        ws.add(MathRegion.assignment("x", 2))
+        user = ws.add(MathRegion(expr=assign("y", var("x") + 1)))
+        assert ws.symbols.graph().dependencies(user) == [ws.regions[1]]
+
+    def test_equivalence_does_not_define(self):
+        # x ≡ 2 is a boolean equation, so the later use binds to x := 1
+        ws = Worksheet()
+        ws.add(MathRegion.assignment("x", 1))
+        ws.add(MathRegion(expr=define("x", 2)))
+        user = ws.add(MathRegion(expr=assign("y", var("x") + 1)))
+        assert ws.symbols.definitions_of("x") == [ws.regions[0]]
+        assert ws.symbols.graph().dependencies(user) == [ws.regions[0]]
+        evaluator = Evaluator()
+        assert [evaluator.run(r) for r in ws.regions] == [1.0, 0.0, 2.0]
+        assert evaluator.variables["x"] == 1.0
+
+    def test_use_before_definition_and_cycle(self):
+        ws = Worksheet()
+        ws.add(MathRegion(expr=assign("a", var("b") + 1)))
+        ws.add(MathRegion(expr=assign("b", var("a") * 2)))
+        ws.add(MathRegion(expr=assign("c", var("z"))))
+        kinds = {(d.kind, d.name) for d in ws.symbols.diagnostics()}
+        assert ("use-before-definition", "b") in kinds
+        assert ("undefined", "z") in kinds
+        assert any(k == "cycle" for k, _ in kinds)
+        with pytest.raises(ValueError):
+            ws.symbols.graph().topological_order()
+
+    def test_area_children_and_plots(self):
+        ws = Worksheet()
+        area = AreaRegion()
+        area.add(MathRegion.assignment("q", 4))
+        ws.add(area)
+        plot = ws.add(PlotRegion(inputs=[var("q")]))
+        assert ws.symbols.definition_of("q") is area.children[0]
+        assert ws.symbols.users_of("q") == [plot]
+
+
+class TestSlice:
+    def _worksheet(self, layout="auto"):
+        ws = Worksheet(layout=layout)
+        ws.add(TextRegion.title("Beam"))
+        ws.add(TextRegion.section("Inputs"))
+        ws.add(MathRegion.assignment("a", 2))
+        ws.add(MathRegion.assignment("b", 3))
+        ws.add(TextRegion.section("Unused"))
+        ws.add(MathRegion.assignment("z", 3))
+        ws.add(MathRegion.evaluation("z"))
+        ws.add(TextRegion.section("Results"))
+        area = AreaRegion()
+        area.add(MathRegion.assignment("c", 1))
+        area.add(MathRegion.assignment("d", "b"))
+        ws.add(area)
+        ws.add(MathRegion.assignment("r", var("a") + var("d")))
+        ws.add(MathRegion.evaluation("r"))
+        return ws
+
+    def _describe(self, regions):
+        out = []
+        for r in regions:
+            if isinstance(r, TextRegion):
+                out.append(r.text)
+            elif isinstance(r, AreaRegion):
+                out.append([repr(c.expr) for c in r.children])
+            else:
+                out.append(repr(r.expr))
+        return out
+
+    def test_keeps_dependencies_and_headings(self):
+        s = self._worksheet().slice(["r"])
+        assert self._describe(s.regions) == [
+            "Beam", "Inputs", "Expr(a 2 :)", "Expr(b 3 :)",
+            "Results", ["Expr(d b :)"], "Expr(r a d + :)", "Expr(r)",
+        ]
+
+    def test_region_output(self):
+        ws = self._worksheet()
+        z_eval = ws.regions[6]
+        s = ws.slice([z_eval])
+        assert self._describe(s.regions) == ["Beam", "Unused", "Expr(z 3 :)", "Expr(z)"]
+
+    def test_definition_when_not_evaluated(self):
+        s = self._worksheet().slice(["b"])
+        assert self._describe(s.regions) == ["Beam", "Inputs", "Expr(b 3 :)"]
+
+    def test_copies_and_relayout(self):
+        ws = self._worksheet()
+        s = ws.slice(["r"])
+        assert all(r is not o for r in s.regions for o in ws.regions)
+        assert s.regions[0].top == ws.regions[0].top
+        assert s.settings.doc_id != ws.settings.doc_id
+        tops = [r.top for r in s.regions]
+        assert tops == sorted(tops)
+        assert s.to_xml_string().count("<region ") < ws.to_xml_string().count("<region ")
+
+    def test_legacy_layout(self):
+        s = self._worksheet(layout="stack").slice(["z"])
+        assert s.layout is None
+        assert [r.top for r in s.regions] == [9, 36, 63, 90]
+
+    def test_unknown_output(self):
+        with pytest.raises(ValueError):
+            self._worksheet().slice(["nope"])
@@ -1,9 +1,15 @@
 """Tests for document creation and XML serialization."""
 
+import base64
 import xml.etree.ElementTree as ET
 
-from smathpy import Worksheet, TextRegion, MathRegion, assign, var, num, evaluate
-from smathpy.constants import SMATH_NAMESPACE
+import pytest
+
+from smathpy import (
+    FragmentRegion, MathRegion, Settings, TextRegion, Worksheet, assign, evaluate, num, var,
+)
+from smathpy import document
+from smathpy.constants import AREA_MARKER_HEIGHT, REGION_GAP, SMATH_NAMESPACE
 from smathpy.regions.plot_region import PlotRegion
 from smathpy.regions.picture_region import PictureRegion
 from smathpy.regions.area_region import AreaRegion
@@ -447,6 +453,51 @@ class TestPictureRegionSerialization:
         assert raw_el.get("format") == "bmp"
 
 
+class TestLazyPictures:
+    def _image(self, tmp_path, size):
+        img = tmp_path / "photo.png"
+        img.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * (size // 256))
+        return img
+
+    def test_lazy_file_is_not_read(self, tmp_path):
+        img = self._image(tmp_path, 1024)
+        pic = PictureRegion.from_file(str(img), lazy=True)
+        assert pic.data_base64 is None and pic.source.path == str(img)
+        img.write_bytes(b"changed")
+        assert pic.encoded() == base64.b64encode(b"changed").decode()
+
+    def test_save_streams_same_output(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("smathpy.regions.picture_region.MMAP_THRESHOLD", 4096)
+        monkeypatch.setattr("smathpy.regions.picture_region.CHUNK_SIZE", 3 * 100)
+        img = self._image(tmp_path, 64 * 1024)  # memory-mapped, many chunks
+        eager, lazy = Worksheet(), Worksheet()
+        for ws, is_lazy in ((eager, False), (lazy, True)):
+            ws.settings.doc_id = "fixed"
+            ws.add(TextRegion.title("Photos"))
+            ws.add(PictureRegion.from_file(str(img), lazy=is_lazy))
+            ws.add(PictureRegion.from_bytes(img.read_bytes()[:600], lazy=is_lazy))
+        eager.save(str(tmp_path / "eager.sm"))
+        lazy.save(str(tmp_path / "lazy.sm"))
+        assert (tmp_path / "lazy.sm").read_bytes() == (tmp_path / "eager.sm").read_bytes()
+        assert lazy.to_xml_string() == eager.to_xml_string()
+        assert "\0" not in lazy.to_xml_string()
+
+    def test_digest_follows_content(self, tmp_path):
+        img = self._image(tmp_path, 512)
+        ws = Worksheet()
+        ws.add(PictureRegion.from_file(str(img), lazy=True))
+        before = ws.digest()
+        img.write_bytes(b"other")
+        assert ws.digest() != before
+
+    def test_layout_reads_png_header(self, tmp_path):
+        png = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + (120).to_bytes(4, "big") + (45).to_bytes(4, "big")
+        img = tmp_path / "small.png"
+        img.write_bytes(png + b"rest")
+        from smathpy.layout import region_size
+        assert region_size(PictureRegion.from_file(str(img), lazy=True)) == (120, 45)
+
+
 class TestAreaRegionSerialization:
     def test_area_empty(self):
         """Empty area produces start marker + terminator."""
@@ -531,3 +582,311 @@ class TestAreaRegionSerialization:
         term_id = int(term_region.get("id"))
 
         assert term_id == area_id + 2 + 1  # 2 children + 1
+
+    def _nested(self, layout="stack"):
+        ws = Worksheet(layout=layout)
+        ws.add(TextRegion.title("Report"))
+        chapter = AreaRegion()
+        chapter.add(TextRegion(text="Chapter 1"))
+        section = chapter.add(AreaRegion(collapsed=True))
+        section.add(MathRegion.assignment("a", 1))
+        check = section.add(AreaRegion())
+        check.add(MathRegion.assignment("b", 2))
+        chapter.add(MathRegion.assignment("c", 3))
+        ws.add(chapter)
+        ws.add(MathRegion.evaluation("c"))
+        return ws
+
+    def _walk(self, el):
+        """(id, top, is_terminator) for every region element, depth-first."""
+        out = []
+        for child in el.findall(f"{{{SMATH_NAMESPACE}}}region"):
+            marker = child.find(f"{{{SMATH_NAMESPACE}}}area")
+            term = marker is not None and marker.get("terminator") == "true"
+            out.append((int(child.get("id")), int(child.get("top")), term))
+            out.extend(self._walk(child))
+        return out
+
+    @pytest.mark.parametrize("layout", ["stack", "auto"])
+    def test_nested_ids_sequential(self, layout):
+        regions = self._walk(self._nested(layout).to_xml().getroot())
+        assert [r[0] for r in regions] == list(range(12))
+        # chapter(1) text(2) section(3) a(4) check(5) b(6) term(7) term(8) c(9) term(10)
+        assert [r[0] for r in regions if r[2]] == [7, 8, 10]
+
+    @pytest.mark.parametrize("layout", ["stack", "auto"])
+    def test_nested_tops_follow_content(self, layout):
+        regions = self._walk(self._nested(layout).to_xml().getroot())
+        tops = [r[1] for r in regions]
+        assert tops == sorted(tops)
+        assert len(set(tops)) == len(tops)
+
+    @pytest.mark.parametrize("layout", ["stack", "auto", "page"])
+    def test_gap_after_nested_area(self, layout):
+        tops = {r[0]: r[1] for r in self._walk(self._nested(layout).to_xml().getroot())}
+        step = AREA_MARKER_HEIGHT + REGION_GAP
+        # check ends (7), then section (8), then c (9) follows; chapter ends (10), then c's result
+        assert tops[8] == tops[7] + step
+        assert tops[9] == tops[8] + step
+        assert tops[11] == tops[10] + step
+
+    def test_terminator_below_children(self):
+        ws = Worksheet()
+        area = AreaRegion()
+        area.add(MathRegion.assignment("x", 1, height=200))
+        ws.add(area)
+        after = ws.add(MathRegion.evaluation("x"))
+        regions = self._walk(ws.to_xml().getroot())
+        child_top, term_top = regions[1][1], regions[2][1]
+        assert term_top >= child_top + 200
+        assert after.top > term_top
+
+    def test_deep_nesting(self):
+        ws = Worksheet()
+        outer = area = AreaRegion()
+        for i in range(100):
+            area.add(MathRegion.assignment(f"x{i}", i))
+            area = area.add(AreaRegion())
+        ws.add(outer)
+        regions = self._walk(ws.to_xml().getroot())
+        assert [r[0] for r in regions] == list(range(len(regions)))
+        assert sum(r[2] for r in regions) == 101
+
+
+class TestCompactRegions:
+    @pytest.mark.parametrize("region", [
+        MathRegion.assignment("x", 1, unit_name="m"),
+        TextRegion.title("T"),
+        PlotRegion(),
+        PictureRegion(),
+        AreaRegion(),
+    ])
+    def test_no_instance_dict(self, region):
+        assert not hasattr(region, "__dict__")
+        with pytest.raises(AttributeError):
+            region.unknown = 1
+
+    def test_elements_slotted(self):
+        expr = assign("x", var("y") + num(1))
+        assert all(not hasattr(e, "__dict__") for e in expr.elements)
+
+    def test_copy_and_pickle(self):
+        import copy
+        import pickle
+
+        region = MathRegion.evaluation("x", contract_unit="kN")
+        assert copy.copy(region) == region
+        restored = pickle.loads(pickle.dumps(region))
+        assert restored.contract_unit == "kN"
+        assert restored.expr.elements == region.expr.elements
+
+
+class TestFork:
+    def _worksheet(self, layout="stack"):
+        ws = Worksheet(layout=layout)
+        for i in range(5):
+            ws.add(MathRegion.assignment(f"x{i}", i))
+        return ws
+
+    def test_shares_until_edited(self):
+        ws = self._worksheet()
+        variant = ws.fork()
+        assert all(a is b for a, b in zip(ws.regions, variant.regions))
+        region = variant.edit(2)
+        region.expr = assign("x2", 42)
+        assert region is variant.regions[2]
+        assert ws.regions[2] is not region
+        assert repr(ws.regions[2].expr) == "Expr(x2 2 :)"
+        assert variant.regions[3] is ws.regions[3]
+        assert variant.edit(2) is region
+
+    def test_copy_keeps_expr_shared(self):
+        ws = self._worksheet()
+        variant = ws.fork()
+        region = variant.edit(ws.regions[1])
+        assert region.expr is ws.regions[1].expr
+
+    def test_original_must_edit_too(self):
+        ws = self._worksheet()
+        variant = ws.fork()
+        ws.edit(0).top = 500
+        assert variant.regions[0].top == 9
+
+    def test_unforked_edit_in_place(self):
+        ws = self._worksheet()
+        assert ws.edit(1) is ws.regions[1]
+
+    def test_edit_area_child(self):
+        ws = Worksheet()
+        area = AreaRegion()
+        child = area.add(MathRegion.assignment("a", 1))
+        ws.add(area)
+        variant = ws.fork()
+        copy = variant.edit(child)
+        assert copy is not child
+        assert variant.regions[0] is not area
+        assert variant.regions[0].children[0] is copy
+        assert area.children[0] is child
+
+    def test_settings(self):
+        ws = self._worksheet()
+        variant = ws.fork()
+        assert variant.settings.doc_id != ws.settings.doc_id
+        variant.edit_settings().page_model.orientation = "Landscape"
+        assert ws.settings.page_model.orientation == "Portrait"
+        variant.settings.precision = 8
+        assert ws.settings.precision == 4
+
+    def test_insert_does_not_move_original(self):
+        ws = self._worksheet()
+        before = [r.top for r in ws.regions]
+        variant = ws.fork()
+        variant.insert(1, TextRegion(text="note"))
+        variant.remove(4)
+        variant.reflow()
+        assert [r.top for r in ws.regions] == before
+        assert len(variant.regions) == 5
+
+    def test_auto_layout_outputs(self):
+        ws = self._worksheet(layout="auto")
+        expected = ws.to_xml_string()
+        variant = ws.fork()
+        variant.edit(1).expr = assign("x1", var("x0") / (var("x0") + num(1)))
+        assert variant.to_xml_string() != expected
+        assert ws.to_xml_string().replace(ws.settings.doc_id, "") == \
+            expected.replace(ws.settings.doc_id, "")
+
+
+def _module():
+    m = Worksheet()
+    m.add(TextRegion.section("Materials"))
+    m.add(MathRegion.assignment("f_c", 25))
+    m.add_spacing(20)
+    m.add(MathRegion.assignment("f_y", 420))
+    return m
+
+
+def _region_attrs(ws):
+    root = ws.to_xml().getroot()
+    return [
+        (int(el.get("id")), int(el.get("top")))
+        for el in root.iter(f"{{{SMATH_NAMESPACE}}}region")
+    ]
+
+
+class TestInclude:
+    def test_inline_remaps_tops(self):
+        ws = Worksheet()
+        ws.add(TextRegion.title("Main"))
+        added = ws.include(_module())
+        assert [r.top for r in added] == [36, 63, 110]
+        ws.add(MathRegion.evaluation("f_y"))
+        assert ws.regions[-1].top == 137
+
+    def test_module_not_modified(self):
+        module = _module()
+        before = [r.top for r in module.regions]
+        ws = Worksheet()
+        ws.add(TextRegion.title("Main"))
+        added = ws.include(module)
+        assert [r.top for r in module.regions] == before
+        assert all(a is not b for a, b in zip(added, module.regions))
+
+    def test_collapsed_area(self):
+        ws = Worksheet()
+        ws.add(TextRegion.title("Main"))
+        (area,) = ws.include(_module(), collapsed=True)
+        assert isinstance(area, AreaRegion)
+        assert area.collapsed
+        assert area.top == 36
+        assert [c.top for c in area.children] == [54, 81, 128]
+        ids = [i for i, _ in _region_attrs(ws)]
+        assert ids == list(range(len(ids)))
+
+    def test_auto_layout_keeps_spacing(self):
+        ws = Worksheet(layout="auto")
+        ws.add(TextRegion.title("Main"))
+        added = ws.include(_module())
+        ws.reflow()
+        assert added[2].top - (added[1].top + 24 + 3) >= 20
+        assert ws.layout.is_auto(added[0])
+
+    def test_merges_assemblies(self):
+        module = _module()
+        module.settings.add_assembly("Plot Region")
+        ws = Worksheet()
+        ws.include(module)
+        ws.include(module)
+        names = [a.name for a in ws.settings.assemblies]
+        assert names.count("Plot Region") == 1
+
+    def test_symbols_see_included_regions(self):
+        ws = Worksheet()
+        ws.include(_module())
+        assert ws.symbols.definition_of("f_c") is ws.regions[1]
+
+
+class TestFragment:
+    def test_matches_inline_output(self):
+        inline = Worksheet(settings=Settings(doc_id="x"))
+        inline.add(TextRegion.title("Main"))
+        inline.include(_module(), collapsed=False)
+        inline.add(MathRegion.evaluation("f_c"))
+
+        frag = Worksheet(settings=Settings(doc_id="x"))
+        frag.add(TextRegion.title("Main"))
+        (region,) = frag.include(_module(), collapsed=False, fragment=True)
+        frag.add(MathRegion.evaluation("f_c"))
+
+        assert isinstance(region, FragmentRegion)
+        assert region.id_count == 5
+        # Identical up to the region after the module, whose top depends on
+        # how the module height is measured
+        inline_regions = inline.to_xml().getroot().findall(f"{{{SMATH_NAMESPACE}}}region")
+        frag_regions = frag.to_xml().getroot().findall(f"{{{SMATH_NAMESPACE}}}region")
+        assert len(frag_regions) == len(inline_regions)
+        for a, b in zip(inline_regions[:-1], frag_regions[:-1]):
+            assert ET.tostring(a) == ET.tostring(b)
+
+    def test_cached_per_content(self):
+        a = _module().fragment()
+        b = _module().fragment()
+        assert a is not b
+        assert a.elements is b.elements
+        other = _module()
+        other.add(MathRegion.assignment("E", 200))
+        assert other.fragment().elements is not a.elements
+
+    def test_cache_shared_between_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def fragment(i):
+            module = _module()
+            module.add(MathRegion.assignment("k", i % 40))  # more contents than cache slots
+            return i % 40, module.fragment()
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(fragment, range(400)))
+        assert len(document._FRAGMENTS) <= document.FRAGMENT_CACHE_SIZE
+        by_content = {}
+        for k, region in results:
+            by_content.setdefault(k, region)
+            assert region.id_count == by_content[k].id_count
+
+    def test_ids_and_tops_rewritten(self):
+        ws = Worksheet()
+        ws.add(TextRegion.title("Main"))
+        ws.include(_module(), fragment=True)
+        ws.include(_module(), fragment=True)
+        attrs = _region_attrs(ws)
+        assert [i for i, _ in attrs] == list(range(7))
+        tops = [t for _, t in attrs]
+        assert tops == sorted(tops)
+        assert len(set(tops)) == 7
+
+    def test_digest_stable(self):
+        def build():
+            ws = Worksheet(settings=Settings(deterministic_id=True))
+            ws.include(_module(), fragment=True)
+            return ws
+        assert build().digest() == build().digest()
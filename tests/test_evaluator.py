@@ -0,0 +1,246 @@
+"""Tests for offline evaluation and result precomputation."""
+
+import math
+
+import pytest
+
+from smathpy import MathRegion, Settings, Worksheet, assign, call, func_assign, num, unit, var
+from smathpy.evaluator import (
+    EvaluationError, Evaluator, Matrix, Quantity, convert, result_elements,
+)
+from smathpy.expression import (
+    abs_, for_range, if_, line, mat, mod, range_, sqrt, sum_, while_loop,
+)
+from smathpy.expression.builder import Expr
+from smathpy.expression.elements import function, operand, operator
+from smathpy.units import power_unit
+
+
+def _values(elements):
+    return [e.value for e in elements]
+
+
+class TestEvaluator:
+    def test_arithmetic(self):
+        ev = Evaluator()
+        assert ev.evaluate((num(2) + 3) * 4 - num(6) / 3) == 18.0
+        assert ev.evaluate(num(2) ** 10) == 1024.0
+        assert ev.evaluate(-num(3)) == -3.0
+        assert ev.evaluate(num(-3)) == -3.0
+        assert ev.evaluate(var("π")) == math.pi
+
+    def test_assignments_in_order(self):
+        ev = Evaluator()
+        ev.evaluate(assign("a", 2))
+        assert ev.evaluate(assign("b", var("a") * 3)) == 6.0
+        assert ev.variables == {"a": 2.0, "b": 6.0}
+
+    def test_units(self):
+        ev = Evaluator()
+        f = ev.evaluate(num(4) @ "kN" / unit("m") * (num(3) @ "m"))
+        assert f == Quantity(12000.0, (1, 1, -2, 0, 0, 0, 0))
+        assert ev.evaluate(num(1) @ "m" + num(20) @ "cm") == Quantity(1.2, (1, 0, 0, 0, 0, 0, 0))
+        assert ev.evaluate(sqrt(num(16) @ "m" * (num(1) @ "m"))) == Quantity(4.0, (1, 0, 0, 0, 0, 0, 0))
+        with pytest.raises(EvaluationError, match="units"):
+            ev.evaluate(num(1) @ "m" + num(1) @ "s")
+        with pytest.raises(EvaluationError, match="unknown unit"):
+            ev.evaluate(num(1) @ "furlong")
+
+    def test_gcd_program(self):
+        ev = Evaluator()
+        ev.evaluate(assign("x", abs_(20405)))
+        ev.evaluate(assign("y", abs_(84645)))
+        x, y = var("x"), var("y")
+        body = line(
+            while_loop(x.neq(0).and_(y.neq(0)),
+                       if_(x > y, assign("x", mod("x", "y")), assign("y", mod("y", "x")))),
+            assign("GCD", x + y),
+        )
+        assert ev.evaluate(assign("GCD", body)) == 55.0
+
+    def test_user_functions(self):
+        ev = Evaluator()
+        assert ev.evaluate(func_assign("f", ["x", "y"], var("x") ** 2 + var("y"))) is None
+        ev.evaluate(assign("x", 100))
+        assert ev.evaluate(call("f", 3, 1)) == 10.0
+        assert ev.variables["x"] == 100.0
+
+    def test_loops_and_sums(self):
+        ev = Evaluator()
+        ev.evaluate(assign("s", 0))
+        ev.evaluate(for_range("i", range_(1, 4), assign("s", var("s") + var("i"))))
+        assert ev.variables["s"] == 10.0
+        assert ev.evaluate(sum_(var("k") ** 2, "k", 1, 3)) == 14.0
+        assert "k" not in ev.variables
+        assert ev.evaluate(range_(1, 6, 3)) == Matrix(3, 1, [1.0, 3.0, 5.0])
+
+    def test_matrices(self):
+        ev = Evaluator()
+        ev.evaluate(assign("A", mat([[1, 2], [3, 4]])))
+        assert ev.evaluate(call("el", "A", 2, 1)) == 3.0
+        assert ev.evaluate(call("det", "A")) == pytest.approx(-2.0)
+        inv = ev.evaluate(var("A") ** -1)
+        assert ev.evaluate(var("A") * mat([[1], [1]])) == Matrix(2, 1, [3.0, 7.0])
+        assert [round(c, 9) for c in inv.cells] == [-2.0, 1.0, 1.5, -0.5]
+
+    def test_element_assignment_grows_vector(self):
+        ev = Evaluator()
+        ev.evaluate(Expr([operand("v"), operand(3), function("el", 2), operand(7), operator(":", 2)]))
+        assert ev.variables["v"] == Matrix(3, 1, [0.0, 0.0, 7.0])
+
+    def test_errors(self):
+        ev = Evaluator()
+        with pytest.raises(EvaluationError, match="not defined"):
+            ev.evaluate(var("nope") + 1)
+        with pytest.raises(EvaluationError, match="not supported"):
+            ev.evaluate(call("diff", var("x") ** 2, "x"))
+        with pytest.raises(EvaluationError, match="division by zero"):
+            ev.evaluate(num(1) / 0)
+
+    def test_iteration_limit(self):
+        ev = Evaluator()
+        ev.max_iterations = 100
+        with pytest.raises(EvaluationError, match="iterations"):
+            ev.evaluate(while_loop(num(1), num(0)))
+
+
+class TestUserFunctionMemo:
+    def _fib(self, ev):
+        n = var("n")
+        ev.evaluate(func_assign("fib", ["n"], if_(n < 2, n, call("fib", n - 1) + call("fib", n - 2))))
+
+    def test_recursion_is_linear(self):
+        ev = Evaluator()
+        self._fib(ev)
+        assert ev.evaluate(call("fib", 40)) == 102334155
+        assert len(ev.functions[("fib", 1)].memo) == 41
+
+    def test_lru_bound(self):
+        ev = Evaluator()
+        ev.memo_size = 3
+        ev.evaluate(func_assign("sq", ["x"], var("x") ** 2))
+        for i in range(5):
+            ev.evaluate(call("sq", i))
+        assert list(ev.functions[("sq", 1)].memo) == [(2.0,), (3.0,), (4.0,)]
+
+    def test_rebinding_a_global_invalidates(self):
+        ev = Evaluator()
+        ev.evaluate(assign("a", 1))
+        ev.evaluate(func_assign("f", ["x"], var("x") + var("a")))
+        ev.evaluate(func_assign("g", ["x"], call("f", "x") * 2))
+        assert ev.evaluate(call("g", 1)) == 4.0
+        ev.evaluate(assign("a", 5))
+        assert ev.evaluate(call("g", 1)) == 12.0
+
+    def test_redefinition_invalidates_callers(self):
+        ev = Evaluator()
+        ev.evaluate(func_assign("f", ["x"], var("x") + 1))
+        ev.evaluate(func_assign("g", ["x"], call("f", "x") * 2))
+        assert ev.evaluate(call("g", 1)) == 4.0
+        ev.evaluate(func_assign("f", ["x"], var("x") + 10))
+        assert ev.evaluate(call("g", 1)) == 22.0
+
+    def test_loop_variable_invalidates(self):
+        ev = Evaluator()
+        ev.evaluate(func_assign("f", ["x"], var("x") * var("k")))
+        ev.evaluate(assign("s", 0))
+        ev.evaluate(for_range("k", range_(1, 3), assign("s", var("s") + call("f", 1))))
+        assert ev.variables["s"] == 6.0
+
+    def test_matrix_arguments(self):
+        ev = Evaluator()
+        ev.evaluate(func_assign("first", ["v"], call("el", "v", 1)))
+        assert ev.evaluate(call("first", mat([[1], [2]]))) == 1.0
+        assert ev.evaluate(call("first", mat([[3], [2]]))) == 3.0
+
+    def test_recursion_depth_guard(self):
+        ev = Evaluator()
+        ev.evaluate(func_assign("loop", ["n"], call("loop", var("n") + 1)))
+        with pytest.raises(EvaluationError, match="deeper than 100"):
+            ev.evaluate(call("loop", 0))
+        assert ev.evaluate(num(1) + 1) == 2.0
+
+
+class TestResultFormatting:
+    def test_rounding(self):
+        assert _values(result_elements(41.33333333)) == ["41.3333"]
+        assert _values(result_elements(0.33998, decimal_places=4)) == ["0.34"]
+        assert _values(result_elements(55.0)) == ["55"]
+        assert _values(result_elements(-12.45333)) == ["12.4533", "-"]
+        assert _values(result_elements(-0.00001, decimal_places=2, exponential_threshold=9)) == ["0"]
+
+    def test_significant_digits_and_trailing_zeros(self):
+        g = Quantity(3.702, (1, 0, -2, 0, 0, 0, 0))
+        assert _values(result_elements(g, 5, significant_digits=True, trailing_zeros=True)) == [
+            "3.7020", "m", "s", "2", "^", "/", "*",
+        ]
+
+    def test_exponential(self):
+        assert _values(result_elements(5.722e-6)) == ["5.722", "10", "6", "-", "^", "*"]
+        assert _values(result_elements(-9.0375e-6)) == ["9.0375", "10", "6", "-", "^", "*", "-"]
+        assert _values(result_elements(123456.0)) == ["1.2346", "10", "5", "^", "*"]
+
+    def test_matrix(self):
+        m = Matrix(2, 1, [2.0, -1.0])
+        assert _values(result_elements(m)) == ["2", "1", "-", "2", "1", "mat"]
+
+    def test_derived_units_and_strings(self):
+        assert _values(result_elements(Quantity(5000.0, (1, 1, -2, 0, 0, 0, 0)))) == ["5000", "N", "*"]
+        assert _values(result_elements("Mars")) == ["Mars"]
+
+    def test_convert(self):
+        ev = Evaluator()
+        force = ev.evaluate(num(12453.3) @ "N")
+        assert convert(force, ev.evaluate(unit("kN"))) == pytest.approx(12.4533)
+        with pytest.raises(EvaluationError, match="contract"):
+            convert(force, ev.evaluate(unit("m")))
+
+
+class TestPrecompute:
+    def _beam(self):
+        ws = Worksheet()
+        ws.add(MathRegion.assignment("L", 3, unit_name="m"))
+        ws.add(MathRegion(expr=assign("q", num(4) @ "kN" / unit("m"))))
+        ws.add(MathRegion(expr=assign("R", var("q") * var("L") / 2), show_result=True))
+        ws.add(MathRegion.evaluation("R", contract_unit="kN", decimal_places=1))
+        ws.add(MathRegion(expr=assign("A", num(0.3) * num(0.5) @ "m" * (num(1) @ "m")),
+                          show_result=True, contract_expr=power_unit("mm", 2)))
+        return ws
+
+    def test_fills_results(self):
+        ws = self._beam()
+        assert ws.precompute() == []
+        assert ws.regions[0].result_elements is None
+        assert _values(ws.regions[2].result_elements) == ["6000", "N", "*"]
+        assert _values(ws.regions[3].result_elements) == ["6"]
+        assert _values(ws.regions[4].result_elements) == ["1.5", "10", "5", "^", "*"]
+        assert '<e type="operand">6</e>' in ws.to_xml_string()
+
+    def test_document_precision(self):
+        ws = Worksheet(settings=Settings(precision=2))
+        ws.add(MathRegion(expr=assign("x", num(2) / 3), show_result=True))
+        ws.precompute()
+        assert _values(ws.regions[0].result_elements) == ["0.67"]
+
+    def test_diagnostics_keep_result(self):
+        ws = Worksheet()
+        ws.add(MathRegion(expr=assign("y", call("diff", var("t") ** 2, "t")), show_result=True))
+        ws.add(MathRegion.evaluation("y"))
+        problems = ws.precompute()
+        assert [(p.kind, p.name) for p in problems] == [("evaluation", "y"), ("evaluation", "")]
+        assert ws.regions[0].result_elements is None
+        with pytest.raises(EvaluationError):
+            ws.precompute(strict=True)
+
+    def test_symbolic_results_untouched(self):
+        ws = Worksheet()
+        ws.add(MathRegion(expr=var("π"), result_action="symbolic"))
+        ws.precompute()
+        assert ws.regions[0].result_elements is None
+
+    def test_fork_is_not_modified(self):
+        ws = self._beam()
+        variant = ws.fork()
+        variant.precompute()
+        assert ws.regions[2].result_elements is None
+        assert variant.regions[2].result_elements is not None
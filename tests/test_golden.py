@@ -1,12 +1,16 @@
-"""Golden-file test: recreate EuclideanGCD.sm and compare structure."""
+"""Golden-file tests: recreate EuclideanGCD.sm and check the stored example results."""
 
 import xml.etree.ElementTree as ET
+from pathlib import Path
 
 from smathpy import Worksheet, TextRegion, MathRegion, var, assign, evaluate
+from smathpy import golden
 from smathpy.expression import (
     abs_, mod, if_, while_loop, line,
 )
 from smathpy.constants import SMATH_NAMESPACE
+from smathpy.evaluator import Quantity
+from smathpy.golden import Check, GoldenReport, _matches, verify, verify_all
 
 
 def test_euclidean_gcd_structure():
@@ -112,3 +116,77 @@ def test_save_euclidean_gcd(tmp_path):
     # Verify processing instructions are present in raw text
     content = path.read_text(encoding="utf-8")
     assert '<?application progid="SMath Studio Desktop"' in content
+
+
+# ---------------------------------------------------------------------------
+# Stored results of the example worksheets
+# ---------------------------------------------------------------------------
+
+EXAMPLES = Path(__file__).resolve().parent.parent / "examples"
+
+
+def test_example_results_match_offline_evaluation():
+    paths = sorted(EXAMPLES.glob("*.sm"))
+    reports = verify_all(paths, workers=2)
+    assert [r.path for r in reports] == [str(p) for p in paths]
+    assert [(r.path, c.region.id) for r in reports for c in r.mismatches] == []
+    by_name = {Path(r.path).name: r for r in reports}
+    assert len(by_name["EuclideanGCD.sm"].ok) == 3
+    assert len(by_name["Beam.sm"].ok) >= 4
+    assert all(r.seconds > 0 for r in reports)
+
+
+def test_verify_reads_in_top_left_order():
+    report = verify(EXAMPLES / "EuclideanGCD.sm")
+    assert report.mismatches == [] and report.skipped == []
+    assert [c.expected for c in report.ok] == [55.0, 371.0, 1539.0]
+
+
+def test_rounding_tolerance():
+    assert _matches(41.333333, 41.3333, 4, False, 5, 1e-9)
+    assert not _matches(41.3340, 41.3333, 4, False, 5, 1e-9)
+    assert _matches(123456.4, 1.2346e5, 4, False, 5, 1e-9)
+    assert _matches(3.70198, 3.702, 4, True, 5, 1e-9)
+
+
+def test_units_get_the_displayed_rounding(tmp_path):
+    # Stored in SI units, a result is rounded like a plain number...
+    g = Quantity(9.7985, (1, 0, -2, 0, 0, 0, 0))
+    assert _matches(Quantity(9.79853, g.dims), g, 4, False, 5, 1e-9)
+    assert not _matches(Quantity(9.7990, g.dims), g, 4, False, 5, 1e-9)
+    # ...and in a contract unit, as a plain number in that unit
+    ws = Worksheet()
+    ws.add(MathRegion.assignment("F", 12345.678, unit_name="N"))
+    ws.add(MathRegion.evaluation("F", contract_unit="kN", decimal_places=2))
+    ws.add(MathRegion.evaluation("F", decimal_places=2))
+    ws.precompute(strict=True)
+    path = tmp_path / "force.sm"
+    ws.save(str(path))
+    report = verify(path)
+    assert [c.expected for c in report.ok] == [12.35, Quantity(12345.68, (1, 1, -2, 0, 0, 0, 0))]
+
+
+def test_skipped_is_not_a_mismatch():
+    report = GoldenReport("x.sm", [Check(None, "skipped", message="diff")])
+    assert report.skipped and not report.mismatches and not report.ok
+
+
+def test_main_expands_directories(tmp_path, capsys):
+    for name in ("Beam.sm", "EuclideanGCD.sm"):
+        (tmp_path / name).write_bytes((EXAMPLES / name).read_bytes())
+    assert golden.expand_paths([tmp_path, EXAMPLES / "Thomas.sm"]) == [
+        tmp_path / "Beam.sm", tmp_path / "EuclideanGCD.sm", EXAMPLES / "Thomas.sm",
+    ]
+    assert golden.main([str(tmp_path)]) == 0
+    out = capsys.readouterr().out
+    assert "Beam.sm" in out and "EuclideanGCD.sm" in out
+
+
+def test_main_defaults_to_examples(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(EXAMPLES.parent)
+    assert golden.main([]) == 0
+    assert "EuclideanGCD.sm" in capsys.readouterr().out
+    monkeypatch.chdir(tmp_path)
+    assert golden.main([]) == 2
+    assert golden.main([str(tmp_path)]) == 2
+    assert "no worksheets" in capsys.readouterr().err
@@ -0,0 +1,131 @@
+"""Tests for the picture size optimisation pipeline."""
+
+import base64
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from smathpy import PictureRegion, Settings, Worksheet
+from smathpy.imaging import optimize_picture
+
+
+def _photo(size=(800, 600), fmt="JPEG", exif=True):
+    image = Image.new("RGB", size)
+    for x in range(0, size[0], 8):
+        for y in range(0, size[1], 8):
+            image.putpixel((x, y), (x % 256, y % 256, (x * y) % 256))
+    out = io.BytesIO()
+    kwargs = {"quality": 98}
+    if fmt == "JPEG" and exif:
+        e = Image.Exif()
+        e[0x010F] = "Camera maker " * 200  # Make
+        kwargs["exif"] = e.tobytes()
+    if fmt == "PNG":
+        kwargs = {"compress_level": 0}
+    image.save(out, fmt, **kwargs)
+    return out.getvalue()
+
+
+def _image(region):
+    return Image.open(io.BytesIO(base64.b64decode(region.data_base64)))
+
+
+class TestOptimizePicture:
+    def test_downsamples_to_displayed_size(self):
+        region = PictureRegion.from_bytes(_photo(), fmt="jpeg", width=200, height=150)
+        result = optimize_picture(region, quality=70)
+        assert result.size == (200, 150) and result.saved > 0
+        assert region.data_base64 != result.data_base64  # the region is untouched
+
+    def test_keeps_aspect_ratio_and_scale(self):
+        region = PictureRegion.from_bytes(_photo(), fmt="jpeg", width=300)
+        assert optimize_picture(region, scale=2.0).size == (600, 450)
+
+    def test_strips_metadata(self):
+        region = PictureRegion.from_bytes(_photo(), fmt="jpeg")
+        result = optimize_picture(region)
+        region.data_base64 = result.data_base64
+        assert not _image(region).getexif()
+
+    def test_strips_png_metadata(self):
+        from PIL import ImageCms, PngImagePlugin
+
+        image = Image.open(io.BytesIO(_photo((120, 90), "PNG")))
+        info = PngImagePlugin.PngInfo()
+        info.add_text("Comment", "generated " * 500)
+        icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        out = io.BytesIO()
+        image.save(out, "PNG", compress_level=0, pnginfo=info, icc_profile=icc)
+        region = PictureRegion.from_bytes(out.getvalue(), fmt="png")
+        result = optimize_picture(region)
+        region.data_base64 = result.data_base64
+        optimized = _image(region)
+        assert "icc_profile" not in optimized.info
+        assert "Comment" not in optimized.info
+
+    def test_keeps_transparency(self):
+        palette = Image.new("P", (120, 90))
+        palette.putpalette([0, 0, 0, 255, 0, 0] + [0] * 762)
+        for x in range(0, 120, 3):
+            palette.putpixel((x, x % 90), 1)
+        rgba = Image.new("RGBA", (120, 90), (0, 0, 255, 0))
+        for x in range(0, 120, 3):
+            rgba.putpixel((x, x % 90), (255, 0, 0, 128))
+        for image, kwargs in ((palette, {"transparency": 0}), (rgba, {})):
+            out = io.BytesIO()
+            image.save(out, "PNG", compress_level=0, **kwargs)
+            region = PictureRegion.from_bytes(out.getvalue(), fmt="png")
+            result = optimize_picture(region)
+            assert result.data_base64 is not None
+            region.data_base64 = result.data_base64
+            original = Image.open(io.BytesIO(out.getvalue())).convert("RGBA")
+            assert _image(region).convert("RGBA").tobytes() == original.tobytes()
+
+    def test_png_recompressed_losslessly(self):
+        raw = _photo((120, 90), "PNG")
+        region = PictureRegion.from_bytes(raw, fmt="png")
+        result = optimize_picture(region)
+        assert result.after < result.before and result.size is None
+        region.data_base64 = result.data_base64
+        assert _image(region).tobytes() == Image.open(io.BytesIO(raw)).tobytes()
+
+    def test_never_grows(self):
+        region = PictureRegion.from_bytes(_photo((40, 30), exif=False), fmt="jpeg")
+        result = optimize_picture(region, quality=100)
+        assert result.data_base64 is None and result.saved == 0
+
+    def test_other_formats_skipped(self):
+        result = optimize_picture(PictureRegion.from_bytes(b"BM....", fmt="bmp"))
+        assert "bmp" in result.skipped
+
+
+class TestWorksheet:
+    def test_parallel_report_and_apply(self):
+        ws = Worksheet()
+        photo = _photo()
+        for _ in range(4):
+            ws.add(PictureRegion.from_bytes(photo, fmt="jpeg", width=160, height=120))
+        ws.add(PictureRegion.from_bytes(b"BM....", fmt="bmp"))
+        report = ws.optimize_pictures(quality=75, workers=4)
+        assert len(report.results) == 5 and len(report.changed) == 4
+        assert report.saved == report.before - report.after > 0
+        assert _image(ws.regions[0]).size == (160, 120)
+
+    def test_print_dpi_and_forks(self):
+        ws = Worksheet(settings=Settings(dpi=96))
+        ws.add(PictureRegion.from_bytes(_photo(), fmt="jpeg", width=200, height=150))
+        original = ws.regions[0].data_base64
+        variant = ws.fork()
+        variant.optimize_pictures(dpi=192)
+        assert _image(variant.regions[0]).size == (400, 300)
+        assert ws.regions[0].data_base64 == original
+
+    def test_lazy_sources_replaced(self, tmp_path):
+        img = tmp_path / "photo.jpg"
+        img.write_bytes(_photo())
+        ws = Worksheet()
+        ws.add(PictureRegion.from_file(str(img), lazy=True, width=100, height=75))
+        ws.optimize_pictures()
+        assert ws.regions[0].source is None and _image(ws.regions[0]).size == (100, 75)
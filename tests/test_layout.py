@@ -0,0 +1,313 @@
+"""Tests for region size estimation and content-based auto-layout."""
+
+from smathpy import (
+    AreaRegion, MathRegion, PictureRegion, PlotRegion, TextRegion, Worksheet,
+    assign, var,
+)
+from smathpy.expression import line, mat
+from smathpy import layout
+from smathpy.layout import FlowLayout, PageLayout, StackLayout, expr_box, region_size
+
+
+class TestExprBox:
+    def test_fraction_taller_than_sum(self):
+        a, b = var("a"), var("b")
+        assert expr_box(a / b)[1] > expr_box(a + b)[1]
+
+    def test_nested_fractions_grow(self):
+        a, b = var("a"), var("b")
+        assert expr_box((a / b) / (a / b))[1] > expr_box(a / b)[1]
+
+    def test_matrix_rows(self):
+        two = expr_box(mat([[1], [2]]))[1]
+        five = expr_box(mat([[1], [2], [3], [4], [5]]))[1]
+        assert five > two
+
+    def test_line_statements(self):
+        one = expr_box(line(assign("x", 1)))[1]
+        three = expr_box(line(assign("x", 1), assign("y", 2), assign("z", 3)))[1]
+        assert three >= 3 * one
+
+    def test_malformed_rpn_does_not_raise(self):
+        from smathpy.expression import Expr, operator
+        assert expr_box(Expr([operator("+", 2)]))[1] > 0
+
+
+class TestRegionSize:
+    def test_single_line_math_matches_default(self):
+        assert region_size(MathRegion(expr=assign("a", 20405)))[1] == 24
+
+    def test_text_line_count_and_font(self):
+        one = region_size(TextRegion(text="Title"))[1]
+        two = region_size(TextRegion(text="Title\nSubtitle"))[1]
+        big = region_size(TextRegion.title("Title"))[1]
+        assert two > one
+        assert big > one
+
+    def test_explicit_size_wins(self):
+        assert region_size(PlotRegion(width=500, height=400)) == (500, 400)
+
+    def test_png_picture_size(self):
+        import struct
+        import zlib
+        ihdr = struct.pack(">IIBBBBB", 120, 45, 8, 2, 0, 0, 0)
+        png = (b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + ihdr
+               + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr)))
+        assert region_size(PictureRegion.from_bytes(png)) == (120, 45)
+
+
+class TestAutoLayout:
+    def test_tall_region_pushes_next(self):
+        ws = Worksheet(layout="auto")
+        m = ws.add(MathRegion(expr=assign("K", mat([[1], [2], [3], [4]]))))
+        x = ws.add(MathRegion.assignment("x", 1))
+        assert x.top >= m.top + region_size(m)[1]
+
+    def test_stack_layout_unchanged(self):
+        ws = Worksheet()
+        ws.add(MathRegion(expr=assign("K", mat([[1], [2], [3], [4]]))))
+        x = ws.add(MathRegion.assignment("x", 1))
+        assert x.top == 9 + 24 + 3
+
+    def test_spacing_and_explicit_top(self):
+        ws = Worksheet(layout="auto")
+        ws.add(MathRegion.assignment("a", 1))
+        ws.add_spacing(40)
+        b = ws.add(MathRegion.assignment("b", 2))
+        assert b.top == 9 + 24 + 3 + 40
+
+        fixed = ws.add(MathRegion.assignment("c", 3, top=500))
+        d = ws.add(MathRegion.assignment("d", 4))
+        assert fixed.top == 500
+        assert d.top == 500 + 24 + 3
+
+    def test_reflow_after_content_change(self):
+        ws = Worksheet(layout="auto")
+        t = ws.add(TextRegion(text="one line"))
+        m = ws.add(MathRegion.assignment("x", 1))
+        t.text = "many\nlines\nof\ntext"
+        ws.to_xml()
+        assert m.top >= t.top + region_size(t)[1]
+
+    def test_area_children_stacked(self):
+        ws = Worksheet(layout="auto")
+        area = AreaRegion()
+        a = area.add(MathRegion.assignment("a", 1))
+        b = area.add(MathRegion.assignment("b", 2))
+        ws.add(area)
+        after = ws.add(MathRegion.assignment("c", 3))
+        ws.reflow()
+
+        assert a.top > area.top
+        assert b.top >= a.top + 24
+        assert after.top > b.top + 24
+
+    def test_custom_engine(self):
+        ws = Worksheet(layout=StackLayout(top=100, gap=10))
+        ws.add(MathRegion.assignment("a", 1))
+        b = ws.add(MathRegion.assignment("b", 2))
+        assert b.top == 100 + 24 + 10
+
+
+class TestPageLayout:
+    def test_content_height_from_page_model(self):
+        from smathpy import PageModel
+        pm = PageModel()  # A4: 1169 high, 39 margins, 1/100 inch
+        assert pm.content_height(96) == (1169 - 78) * 96 // 100
+        pm.orientation = "Landscape"
+        assert pm.content_height(96) == (827 - 78) * 96 // 100
+
+    def test_region_pushed_to_next_page(self):
+        engine = PageLayout(page_height=100)
+        ws = Worksheet(layout=engine)
+        a = ws.add(MathRegion.assignment("a", 1))   # 9..33
+        b = ws.add(MathRegion.assignment("b", 2))   # 36..60
+        c = ws.add(MathRegion.assignment("c", 3))   # 63..87
+        d = ws.add(MathRegion.assignment("d", 4))   # would be 90..114
+
+        assert (a.top, b.top, c.top) == (9, 36, 63)
+        assert d.top == 100 + 9
+        assert engine.page_of(d) == 1
+        assert engine.page_breaks == 1
+
+    def test_no_region_straddles_a_page(self):
+        ws = Worksheet(layout="page")
+        for i in range(200):
+            if i % 7 == 0:
+                ws.add(MathRegion(expr=assign("K", mat([[1], [2], [3], [4], [5]]))))
+            else:
+                ws.add(MathRegion.assignment(f"x{i}", i))
+        ws.reflow()
+
+        page_h = ws.layout.page_height
+        for r in ws.regions:
+            h = region_size(r)[1]
+            assert r.top // page_h == (r.top + h - 1) // page_h
+
+    def test_oversized_region_not_moved(self):
+        ws = Worksheet(layout=PageLayout(page_height=100))
+        ws.add(MathRegion.assignment("a", 1))
+        big = ws.add(PlotRegion(inputs=[var("x")]))
+        assert big.top == 9 + 24 + 3
+
+
+class TestFlowLayout:
+    def _build(self, n=30, **kwargs):
+        ws = Worksheet(layout=FlowLayout(width=600, **kwargs))
+        ws.add(TextRegion.section("Input data:"))
+        for i in range(n):
+            ws.add(MathRegion.assignment(f"x_{i}", i))
+        ws.add(TextRegion.section("Results:"))
+        ws.reflow()
+        return ws
+
+    def test_regions_share_rows(self):
+        ws = self._build()
+        tops = {r.top for r in ws.regions[1:-1]}
+        assert len(tops) < 30
+
+    def test_reading_order_preserved(self):
+        ws = self._build()
+        positions = [(r.top, r.left) for r in ws.regions]
+        assert positions == sorted(positions)
+
+    def test_rows_fit_width(self):
+        ws = self._build()
+        for r in ws.regions[1:-1]:
+            assert r.left + region_size(r)[0] <= 9 + 600
+
+    def test_headings_take_full_row(self):
+        ws = self._build()
+        first, last = ws.regions[0], ws.regions[-1]
+        assert all(r.top > first.top for r in ws.regions[1:])
+        assert all(r.top < last.top for r in ws.regions[:-1])
+
+    def test_max_columns(self):
+        ws = self._build(max_columns=2)
+        rows = {}
+        for r in ws.regions[1:-1]:
+            rows.setdefault(r.top, []).append(r)
+        assert max(len(v) for v in rows.values()) == 2
+
+    def test_sizes_estimated_once_per_pass(self, monkeypatch):
+        ws = self._build()
+        calls = []
+        original = layout.estimate_size
+
+        def counting(region):
+            calls.append(id(region))
+            return original(region)
+
+        monkeypatch.setattr(layout, "estimate_size", counting)
+        ws.reflow()
+        assert len(calls) == len(set(calls)) == len(ws.regions)
+        ws.reflow()  # a new pass estimates again
+        assert len(calls) == 2 * len(ws.regions)
+
+    def test_columns_not_monotonic_in_width(self):
+        # Two columns need 100 + 100, three only 100 + 10 + 10
+        widths = [100, 10, 10, 100]
+        layout = FlowLayout(width=160, column_gap=0, max_columns=3)
+        assert not layout._fits(widths, 2) and layout._fits(widths, 3)
+        assert layout._columns(widths) == 3
+        assert FlowLayout(width=160, column_gap=0)._columns(widths) == 3
+        assert FlowLayout(width=90, column_gap=0)._columns(widths) == 1
+
+    def test_wide_region_breaks_run(self):
+        ws = Worksheet(layout=FlowLayout(width=300))
+        a = ws.add(MathRegion.assignment("a", 1))
+        wide = ws.add(MathRegion(expr=assign("long_variable_name", var("another_long_name") + var("x"))))
+        b = ws.add(MathRegion.assignment("b", 2))
+        ws.reflow()
+        assert a.top < wide.top < b.top
+        assert wide.left == 9
+
+    def test_flow_from_settings(self):
+        ws = Worksheet(layout="flow")
+        assert ws.layout.width == ws.settings.page_model.content_width(ws.settings.dpi)
+
+
+class TestInsertRemove:
+    def _ws(self, n, **kwargs):
+        ws = Worksheet(**kwargs)
+        for i in range(n):
+            ws.add(MathRegion.assignment(f"x{i}", i))
+        return ws
+
+    def test_insert_shifts_following_regions(self):
+        ws = self._ws(5)
+        before = [r.top for r in ws.regions]
+        new = ws.insert(2, MathRegion.assignment("y", 1))
+        ws.reflow()
+
+        assert new.top == before[2]
+        assert [r.top for r in ws.regions] == before[:2] + [before[2]] + [t + 27 for t in before[2:]]
+
+    def test_insert_after_anchor(self):
+        ws = self._ws(3)
+        anchor = ws.regions[0]
+        new = ws.insert(anchor, MathRegion.assignment("y", 1))
+        assert ws.regions[1] is new
+
+    def test_remove_closes_gap(self):
+        ws = self._ws(5)
+        before = [r.top for r in ws.regions]
+        removed = ws.remove(1)
+        ws.reflow()
+
+        assert removed.expr.elements[0].value == "x1"
+        assert [r.top for r in ws.regions] == [before[0]] + before[1:4]
+
+    def test_insert_then_add_continues_flow(self):
+        ws = self._ws(3)
+        ws.insert(0, MathRegion.assignment("y", 1))
+        last = ws.add(MathRegion.assignment("z", 2))
+        ws.reflow()
+        tops = [r.top for r in ws.regions]
+        assert tops == sorted(tops)
+        assert last.top == ws.regions[-2].top + 27
+
+    def test_top_of_is_lazy_but_exact(self):
+        ws = self._ws(100)
+        for _ in range(10):
+            ws.insert(0, MathRegion.assignment("y", 1))
+        assert ws.top_of(109) == 9 + 109 * 27
+        assert ws.top_of(ws.regions[50]) == 9 + 50 * 27
+
+    def test_random_edits_match_naive(self):
+        import random
+        rng = random.Random(7)
+        ws = self._ws(50)
+        for step in range(300):
+            if rng.random() < 0.6 or len(ws.regions) < 2:
+                ws.insert(rng.randrange(len(ws.regions) + 1), MathRegion.assignment("e", step))
+            else:
+                ws.remove(rng.randrange(len(ws.regions)))
+        ws.reflow()
+        assert [r.top for r in ws.regions] == [9 + 27 * i for i in range(len(ws.regions))]
+
+    def test_insert_with_auto_layout(self):
+        ws = self._ws(3, layout="auto")
+        ws.insert(1, MathRegion(expr=assign("K", mat([[1], [2], [3]]))))
+        ws.reflow()
+        tops = [r.top for r in ws.regions]
+        assert tops == sorted(tops)
+        assert tops[2] >= tops[1] + region_size(ws.regions[1])[1]
+
+    def test_remove_unknown_region(self):
+        import pytest
+        ws = self._ws(2)
+        with pytest.raises(ValueError):
+            ws.remove(MathRegion.assignment("x0", 0))
+
+    def test_offset_tree_operations(self):
+        from smathpy.layout import OffsetTree
+        regions = [MathRegion(top=i * 10) for i in range(1000)]
+        tree = OffsetTree(regions)
+        assert len(tree) == 1000
+        tree.insert(500, MathRegion(top=5000), shift=7)
+        assert tree.get(501) is regions[500]
+        assert tree.get(501).top == 5007
+        assert tree.remove(0, shift=-1) is regions[0]
+        tree.flush()
+        assert regions[999].top == 9990 + 7 - 1
@@ -0,0 +1,90 @@
+"""Tests for memory tracing of construction and serialization."""
+
+import json
+import tracemalloc
+
+from smathpy import AreaRegion, MathRegion, TextRegion, Worksheet, assign, memory, var
+from smathpy.memory import expr_size, size_bucket
+
+
+def _build(n=20):
+    ws = Worksheet()
+    ws.add(TextRegion.title("Memory"))
+    for i in range(n):
+        ws.add(MathRegion(expr=assign(f"x{i}", var("a") * i + var("b") ** 2)))
+    area = AreaRegion()
+    area.add(MathRegion(expr=assign("c", 1)))
+    ws.add(area)
+    return ws
+
+
+class TestSizes:
+    def test_expr_size(self):
+        region = MathRegion(expr=assign("x", var("a") + 1))
+        assert expr_size(region) == 5
+        area = AreaRegion()
+        area.add(region)
+        area.add(TextRegion(text="note"))
+        assert expr_size(area) == 5
+        assert expr_size(TextRegion(text="t")) == 0
+
+    def test_buckets(self):
+        assert [size_bucket(n) for n in (0, 1, 2, 3, 4, 5, 8, 9)] == [0, 1, 2, 4, 4, 8, 8, 16]
+
+
+class TestTrack:
+    def test_construction_and_serialization(self, tmp_path):
+        path = tmp_path / "m.sm"
+        with memory.track() as tracker:
+            ws = _build()
+            with tracker.serializing():
+                ws.save(str(path))
+        built, saved = tracker.construction, tracker.serialization
+        assert built.region_types["MathRegion"].count == 20
+        assert built.region_types["AreaRegion"].count == 1
+        assert built.region_types["MathRegion"].bytes > 0
+        # x_i a i * b 2 ^ + := has 9 elements
+        assert built.expr_sizes[16].count == 20 and built.expr_sizes[16].elements == 180
+        assert built.peak >= built.retained > 0
+        assert built.bytes_per_element > 0
+        # Serialization counts the <e> elements written for each top-level region
+        assert saved.elements == path.read_text(encoding="utf-8").count("<e ")
+        assert saved.region_types["MathRegion"].bytes > 0
+        assert saved.peak > 0 and tracker.peak == max(built.peak, saved.peak)
+        assert any(a.location.startswith("smathpy/") for a in built.top)
+        assert not tracemalloc.is_tracing()
+        assert memory.get_tracker() is None
+
+    def test_measure_and_report(self):
+        tracker = memory.measure(_build, top=3)
+        assert len(tracker.construction.top) <= 3
+        data = json.loads(json.dumps(tracker.as_dict()))
+        assert data["construction"]["region_types"]["MathRegion"]["count"] == 20
+        assert "16" in data["serialization"]["expr_sizes"]
+        text = tracker.construction.format()
+        assert "MathRegion" in text and "9-16" in text and "bytes per element" in text
+
+    def test_inactive_outside_block(self):
+        ws = _build(2)
+        with memory.track(top=0) as tracker:
+            pass
+        ws.add(MathRegion(expr=assign("y", 1)))
+        ws.to_xml_string()
+        assert tracker.construction.region_types == {}
+        assert tracker.serialization.region_types == {}
+
+    def test_keeps_running_tracemalloc(self):
+        tracemalloc.start()
+        try:
+            with memory.track(top=0) as tracker:
+                _build(2)
+            assert tracemalloc.is_tracing()
+            assert tracker.construction.region_types["MathRegion"].count == 2
+        finally:
+            tracemalloc.stop()
+
+    def test_insert_is_charged(self):
+        ws = _build(2)
+        with memory.track(top=0) as tracker:
+            ws.insert(1, MathRegion(expr=assign("z", 2)))
+        assert tracker.construction.region_types["MathRegion"].count == 1
@@ -0,0 +1,175 @@
+"""Tests for the NumPy-backed numeric built-ins."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from smathpy import MathRegion, PlotRegion, Worksheet, numeric
+from smathpy.evaluator import EvaluationError, Evaluator, Matrix
+from smathpy.expression import call, mat, num, var
+
+
+class TestInterpolation:
+    def test_linterp(self):
+        assert numeric.linterp([0, 1, 2], [0, 10, 40], 1.5) == 25.0
+        assert numeric.linterp([0, 1, 2], [0, 10, 40], [-1, 3]).tolist() == [-10.0, 70.0]
+
+    def test_cinterp_reproduces_data_and_is_smooth(self):
+        x = np.linspace(0, 3, 7)
+        y = np.sin(x)
+        assert np.allclose(numeric.cinterp(x, y, x), y)
+        assert abs(numeric.cinterp(x, y, 1.3) - np.sin(1.3)) < 5e-3
+
+    def test_cinterp_natural_spline_on_line(self):
+        assert numeric.cinterp([0, 1, 2, 3], [1, 3, 5, 7], 2.5) == pytest.approx(6.0)
+
+    def test_columns(self):
+        ys = [[0, 0], [1, 2], [8, 4], [27, 6]]
+        result = numeric.cinterp([0, 1, 2, 3], ys, [1.5, 2.5])
+        assert result.shape == (2, 2)
+        assert result[:, 1].tolist() == pytest.approx([3.0, 5.0])
+
+    def test_batch(self):
+        sets = [[0, 1, 8, 27], [0, 2, 4, 6]]
+        batch = numeric.cinterp_batch([0, 1, 2, 3], sets, [1.5, 2.5])
+        assert batch.shape == (2, 2)
+        assert batch[0].tolist() == pytest.approx(numeric.cinterp([0, 1, 2, 3], sets[0], [1.5, 2.5]).tolist())
+        assert numeric.linterp_batch([0, 1], [[0, 1], [0, 2]], 0.5).tolist() == [[0.5], [1.0]]
+
+    def test_unsorted_abscissae(self):
+        with pytest.raises(ValueError, match="increasing"):
+            numeric.linterp([0, 2, 1], [0, 1, 2], 0.5)
+
+
+class TestPolyroots:
+    def test_ascending_coefficients(self):
+        assert numeric.polyroots([-6, 11, -6, 1]) == pytest.approx([1.0, 2.0, 3.0])
+
+    def test_order_by_magnitude_negative_first(self):
+        roots = numeric.polyroots([0, 4, 0, -5, 0, 1])  # x(x²-1)(x²-4)
+        assert roots == pytest.approx([0.0, -1.0, 1.0, -2.0, 2.0], abs=1e-12)
+
+    def test_complex(self):
+        roots = numeric.polyroots([1, 0, 1])
+        assert np.iscomplexobj(roots)
+        assert roots == pytest.approx([-1j, 1j])
+
+    def test_batch(self):
+        roots = numeric.polyroots_batch([[-1, 0, 1], [-4, 0, 1], [2, -3, 1]])
+        assert np.allclose(roots, [[-1, 1], [-2, 2], [1, 2]])
+
+
+class TestSortAndSolve:
+    def test_csort_one_based_stable(self):
+        m = np.array([[3, 1], [1, 2], [3, 0], [2, 3]])
+        assert numeric.csort(m, 1).tolist() == [[1, 2], [2, 3], [3, 1], [3, 0]]
+        with pytest.raises(IndexError):
+            numeric.csort(m, 0)
+
+    def test_solve_all_roots(self):
+        roots = numeric.solve(lambda x: np.cos(x), 0, 10)
+        assert roots == pytest.approx([np.pi / 2, 3 * np.pi / 2, 5 * np.pi / 2])
+
+    def test_solve_batch(self):
+        roots = numeric.solve_batch(lambda x, p: x**2 - p, 0, 10, [2, 9, 100, 400])
+        assert roots[:3] == pytest.approx([2**0.5, 3, 10])
+        assert np.isnan(roots[3])
+
+
+class TestEvaluatorBuiltins:
+    def test_interpolation(self):
+        ev = Evaluator()
+        vx, vy = mat([[0], [1], [2]]), mat([[0], [10], [40]])
+        assert ev.evaluate(call("linterp", vx, vy, 1.5)) == 25.0
+        assert ev.evaluate(call("linterp", vx, vy, mat([[0.5], [1.5]]))) == Matrix(2, 1, [5.0, 25.0])
+
+    def test_interpolation_with_units(self):
+        ev = Evaluator()
+        vx = mat([[0], [1]]) @ "m"
+        vy = mat([[0], [10]]) @ "kN"
+        value = ev.evaluate(call("linterp", vx, vy, num(50) @ "cm"))
+        assert value.value == pytest.approx(5000.0)
+
+    def test_polyroots_and_csort(self):
+        ev = Evaluator()
+        roots = ev.evaluate(call("polyroots", mat([[-2], [0], [1]])))
+        assert [round(r, 9) for r in roots.cells] == [-1.414213562, 1.414213562]
+        assert ev.evaluate(call("csort", mat([[3, 1], [1, 2]]), 1)).cells == [1.0, 2.0, 3.0, 1.0]
+        with pytest.raises(EvaluationError, match="complex"):
+            ev.evaluate(call("polyroots", mat([[1], [0], [1]])))
+
+    def test_solve(self):
+        ev = Evaluator()
+        assert ev.evaluate(call("solve", var("x") ** 2 - 2, "x", 0, 3)) == pytest.approx(2**0.5)
+        both = ev.evaluate(call("solve", (var("x") ** 2).eq(4), "x", -3, 3))
+        assert both.cells == pytest.approx([-2.0, 2.0])
+        assert "x" not in ev.variables
+        with pytest.raises(EvaluationError, match="no roots"):
+            ev.evaluate(call("solve", var("x") ** 2 + 1, "x", -3, 3))
+
+
+class TestDecimation:
+    def _series(self):
+        x = np.linspace(0, 10, 10_001)
+        y = np.sin(x)
+        y[3333] = 5.0  # a spike decimation must keep
+        return x, y
+
+    def test_lttb_keeps_ends_and_peaks(self):
+        x, y = self._series()
+        keep = numeric.lttb(x, y, 200)
+        assert keep.size == 200 and keep[0] == 0 and keep[-1] == x.size - 1
+        assert np.all(np.diff(keep) > 0)
+        assert 3333 in keep
+
+    def test_minmax_keeps_extremes(self):
+        x, y = self._series()
+        keep = numeric.minmax(x, y, 200)
+        assert keep.size <= 200 and 3333 in keep
+        assert y[keep].min() == y.min()
+
+    def test_short_series_unchanged(self):
+        assert numeric.lttb([0, 1, 2], [0, 1, 0], 10).tolist() == [0, 1, 2]
+        with pytest.raises(ValueError, match="method"):
+            numeric.decimate([0, 1], [0, 1], 10, method="every")
+
+    def test_plot_data_matrix(self):
+        expr = numeric.plot_data([0, 1, 2], [-1.5, float("nan"), 2e-7])
+        assert [e.value for e in expr._elements] == ["0", "1.5", "-", "2", "0.0000002", "2", "2", "mat"]
+        x, y = self._series()
+        value = Evaluator().evaluate(numeric.plot_data(x, y, max_points=100, digits=4))
+        assert (value.rows, value.cols) == (100, 2)
+        assert max(value.cells[1::2]) == 5.0
+
+
+class TestPlotSeries:
+    def test_several_curves_share_literals(self):
+        x = np.array([0.0, 1.0, 2.0])
+        expr = numeric.plot_data(x, x**2, -x)
+        values = [e.value for e in expr._elements]
+        assert values[-3:] == ["2", "1", "sys"]
+        assert values.count("mat") == 2
+        ones = [e for e in expr._elements if e.value == "1" and e.type == "operand"]
+        assert len({id(e) for e in ones[:3]}) == 1  # one literal per distinct value
+
+    def test_3d(self):
+        region = PlotRegion.from_series([0, 1], [0, 1], z=[2, 3])
+        assert region.plot_type == "3d"
+        assert [e.value for e in region.inputs[0]._elements] == ["0", "0", "2", "1", "1", "3", "2", "3", "mat"]
+        with pytest.raises(ValueError, match="2D"):
+            numeric.plot_data([0, 1], [0, 1], z=[0, 1], max_points=10)
+
+    def test_from_series_in_worksheet(self):
+        x = np.linspace(0, 1, 5000)
+        ws = Worksheet()
+        ws.add(PlotRegion.from_series(x, np.sin(x), np.cos(x), max_points=100, width=500))
+        xml = ws.to_xml_string()
+        assert xml.count('<e type="function" preserve="true" args="202">mat</e>') == 2
+        assert '<e type="function" preserve="true" args="4">sys</e>' in xml
+
+    def test_shared_block(self):
+        x = np.linspace(0, 1, 50)
+        ws = Worksheet()
+        ws.add(MathRegion.assignment("curves", numeric.plot_data(x, x**2)))
+        ws.add(PlotRegion(inputs=[numeric.plot_data(x, x**2)]))
+        assert ws.regions[0].expr._elements[1:-1] == ws.regions[1].inputs[0]._elements
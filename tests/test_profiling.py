@@ -0,0 +1,82 @@
+"""Tests for serialization profiling."""
+
+import json
+
+import pytest
+
+from smathpy import AreaRegion, MathRegion, TextRegion, Worksheet, assign, profiling, var
+from smathpy.profiling import PHASES
+
+
+def _build():
+    ws = Worksheet()
+    ws.add(TextRegion.title("Profile"))
+    ws.add(MathRegion(expr=assign("a", 2)))
+    area = AreaRegion()
+    area.add(MathRegion(expr=assign("b", var("a") * 3)))
+    ws.add(area)
+    return ws
+
+
+class TestProfile:
+    def test_save_phases_and_counts(self, tmp_path):
+        ws = _build()
+        path = tmp_path / "p.sm"
+        with ws.profile() as profiler:
+            ws.save(str(path))
+        profile = profiler.last
+        assert len(profiler.runs) == 1 and profile.operation == "save"
+        assert list(profile.phases) == list(PHASES)
+        assert profile.seconds >= sum(profile.phases.values())
+        assert profile.bytes == path.stat().st_size
+        assert profile.regions == 4
+        assert profile.region_types["MathRegion"].count == 2
+        assert profile.region_types["AreaRegion"].count == 1
+        assert profile.elements == path.read_text(encoding="utf-8").count("<e ")
+
+    def test_each_entry_point_is_one_run(self):
+        ws = _build()
+        seen = []
+        with ws.profile(callback=seen.append) as profiler:
+            ws.to_xml()
+            xml = ws.to_xml_string()
+        assert [p.operation for p in profiler.runs] == ["to_xml", "to_xml_string"]
+        assert seen == profiler.runs
+        assert profiler.runs[0].bytes == 0
+        assert profiler.runs[1].bytes == len(xml.encode("utf-8"))
+        assert "write" not in profiler.runs[1].phases
+
+    def test_disabled_outside_block(self):
+        ws = _build()
+        with ws.profile() as profiler:
+            pass
+        ws.to_xml_string()
+        assert profiler.runs == [] and ws._profile is None
+
+    def test_report_formats(self):
+        ws = _build()
+        with ws.profile() as profiler:
+            ws.to_xml_string()
+        data = json.loads(json.dumps(profiler.last.as_dict()))
+        assert data["region_types"]["TextRegion"]["count"] == 1
+        text = profiler.last.format()
+        assert "tostring" in text and "4 regions" in text
+
+
+class TestHook:
+    def test_process_wide_hook(self, tmp_path):
+        seen = []
+        previous = profiling.set_hook(seen.append)
+        try:
+            _build().save(str(tmp_path / "a.sm"))
+            _build().to_xml_string()
+        finally:
+            profiling.set_hook(previous)
+        assert [p.operation for p in seen] == ["save", "to_xml_string"]
+
+    def test_failed_serialization_not_recorded(self, tmp_path):
+        ws = _build()
+        with ws.profile() as profiler:
+            with pytest.raises(OSError):
+                ws.save(str(tmp_path))  # a directory
+        assert profiler.runs == [] and ws._profile is None
@@ -0,0 +1,95 @@
+"""Tests for offline plot previews."""
+
+import struct
+import zlib
+
+import pytest
+
+from smathpy import PictureRegion, PlotRegion, Worksheet, assign, var
+from smathpy.evaluator import EvaluationError, Evaluator
+from smathpy.expression import mat
+from smathpy.raster import (
+    BACKGROUND, PALETTE, Canvas, encode_png, plot_series, preview, preview_all, render_png,
+)
+
+
+def _decode(png):
+    """Width, height and RGB rows of an unfiltered 8-bit RGB PNG."""
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, idat = 8, b""
+    while pos < len(png):
+        length, kind = struct.unpack(">I4s", png[pos:pos + 8])
+        data = png[pos + 8:pos + 8 + length]
+        (crc,) = struct.unpack(">I", png[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(kind + data)
+        if kind == b"IHDR":
+            width, height = struct.unpack(">II", data[:8])
+        elif kind == b"IDAT":
+            idat += data
+        pos += 12 + length
+    raw = zlib.decompress(idat)
+    stride = 3 * width + 1
+    return width, height, [raw[y * stride + 1:(y + 1) * stride] for y in range(height)]
+
+
+def _pixel(rows, x, y):
+    return tuple(rows[y][3 * x:3 * x + 3])
+
+
+class TestCanvas:
+    def test_png_round_trip(self):
+        canvas = Canvas(5, 4)
+        canvas.line(0, 0, 4, 3, (255, 0, 0))
+        width, height, rows = _decode(canvas.png())
+        assert (width, height) == (5, 4)
+        assert _pixel(rows, 0, 0) == _pixel(rows, 4, 3) == (255, 0, 0)
+        assert _pixel(rows, 4, 0) == BACKGROUND
+
+    def test_size_mismatch(self):
+        with pytest.raises(ValueError, match="size"):
+            encode_png(2, 2, b"\x00" * 11)
+
+
+class TestRender:
+    def test_series_colors_and_extent(self):
+        png = render_png([([0, 1], [0, 1]), ([0, 1], [1, 0])], width=50, height=40, grid=False, axes=False)
+        _, _, rows = _decode(png)
+        assert _pixel(rows, 8, 31) == PALETTE[0]   # (0, 0) at the bottom-left margin
+        assert _pixel(rows, 41, 8) == PALETTE[0]   # (1, 1) at the top-right margin
+        assert _pixel(rows, 8, 8) == PALETTE[1]
+
+    def test_unknown_render(self):
+        with pytest.raises(ValueError, match="render"):
+            render_png([([0], [0])], render="surface")
+
+    def test_preview_picture(self):
+        pic = preview([0, 1, 2], [0, 1, 4], width=120, height=90, top=50)
+        assert isinstance(pic, PictureRegion)
+        assert (pic.width, pic.height, pic.top, pic.format) == (120, 90, 50, "png")
+
+
+class TestPlotRegions:
+    def test_literal_and_named_matrices(self):
+        ev = Evaluator()
+        ev.evaluate(assign("D", mat([[0, 0], [1, 2]])))
+        region = PlotRegion(inputs=[mat([[0, -1], [2, 3]]), var("D")])
+        assert plot_series(region, ev) == [([0.0, 2.0], [-1.0, 3.0]), ([0.0, 1.0], [0.0, 2.0])]
+
+    def test_unsupported_inputs(self):
+        with pytest.raises(EvaluationError, match="not defined"):
+            plot_series(PlotRegion(inputs=[var("plotter")]))
+        with pytest.raises(EvaluationError, match="3d"):
+            plot_series(PlotRegion(inputs=[mat([[0, 0, 0]])], plot_type="3d"))
+
+    def test_preview_all_keeps_placement(self):
+        np = pytest.importorskip("numpy")
+        x = np.linspace(0, 1, 200)
+        plots = [PlotRegion.from_series(x, x**k, np.sqrt(x), width=200, height=150, top=200 * k)
+                 for k in range(1, 6)]
+        serial = preview_all(plots, workers=1)
+        pooled = preview_all(plots, workers=3)
+        assert [p.data_base64 for p in serial] == [p.data_base64 for p in pooled]
+        assert [p.top for p in pooled] == [200, 400, 600, 800, 1000]
+        ws = Worksheet()
+        ws.add(pooled[0])
+        assert "<raw format=\"png\" encoding=\"base64\">iVBOR" in ws.to_xml_string()
@@ -0,0 +1,130 @@
+"""Tests for binary worksheet snapshots."""
+
+import pickle
+
+import pytest
+
+from smathpy import (
+    AreaRegion, MathRegion, PictureRegion, PlotRegion, Settings, TextRegion, Worksheet,
+    assign, call, num, var,
+)
+from smathpy.expression.elements import operand, operator
+from smathpy.units import power_unit
+
+
+def _build(layout="stack"):
+    ws = Worksheet(title="Snapshot", author="Tester",
+                   settings=Settings(doc_id="doc"), layout=layout)
+    ws.add(TextRegion.title("Beam"))
+    ws.add(TextRegion(texts={"eng": "Span", "spa": "Luz"}, bold=True))
+    ws.add(MathRegion.assignment("L", 3.5, unit_name="m"))
+    ws.add_spacing(30)
+    ws.add(MathRegion(
+        expr=assign("A", var("b") * var("h")),
+        contract_expr=power_unit("mm", 2),
+        result_action="numeric",
+        result_elements=[operand("12"), operator("-", 1)],
+        decimal_places=2,
+        description="Area",
+    ))
+    ws.add(MathRegion.assignment("big", 10**30))
+    ws.add(MathRegion.assignment("neg", -7))
+    ws.add(PlotRegion(inputs=[var("f")], scale_x=0.5, width=300, height=200))
+    ws.add(PictureRegion(data_base64="iVBORw0KGgo=", width=10, height=10))
+    chapter = AreaRegion()
+    section = chapter.add(AreaRegion(collapsed=True))
+    section.add(MathRegion.expression(call("sin", num(1))))
+    ws.add(chapter)
+    ws.add(MathRegion.evaluation("A", contract_unit="mm"))
+    return ws
+
+
+class TestRoundTrip:
+    @pytest.mark.parametrize("layout", ["stack", "auto", "page", "flow"])
+    def test_same_output(self, layout):
+        ws = _build(layout)
+        restored = Worksheet.load_binary(ws.dump_binary())
+        assert restored.to_xml_string() == ws.to_xml_string()
+
+    def test_file_is_memory_mapped(self, tmp_path):
+        ws = _build()
+        path = tmp_path / "model.smpb"
+        data = ws.dump_binary(path)
+        assert path.read_bytes() == data
+        assert Worksheet.load_binary(path).to_xml_string() == ws.to_xml_string()
+
+    def test_values(self):
+        restored = Worksheet.load_binary(_build().dump_binary())
+        assert restored.settings.doc_id == "doc"
+        assert restored.settings.metadata[0].author == "Tester"
+        plot = restored.regions[6]
+        assert isinstance(plot, PlotRegion) and plot.scale_x == 0.5
+        assert restored.regions[4].expr.elements[-1].value == ":"
+        assert str(10**30) in repr(restored.regions[4].expr)
+        assert restored.regions[1].texts == {"eng": "Span", "spa": "Luz"}
+
+    def test_lazy_pictures(self, tmp_path):
+        img = tmp_path / "logo.png"
+        img.write_bytes(b"\x89PNG\r\n\x1a\nlogo")
+        ws = Worksheet()
+        ws.add(PictureRegion.from_file(str(img), lazy=True))
+        ws.add(PictureRegion.from_bytes(bytes(range(256)), lazy=True))
+        restored = Worksheet.load_binary(ws.dump_binary())
+        assert restored.regions[0].source.path == str(img)
+        assert restored.regions[1].source.data == bytes(range(256))
+        assert restored.to_xml_string() == ws.to_xml_string()
+
+    def test_continue_building(self):
+        ws = _build()
+        restored = Worksheet.load_binary(ws.dump_binary())
+        a = ws.add(MathRegion.assignment("z", 1))
+        b = restored.add(MathRegion.assignment("z", 1))
+        assert a.top == b.top
+
+    def test_auto_layout_tracking(self):
+        ws = _build("auto")
+        restored = Worksheet.load_binary(ws.dump_binary())
+        restored.edit(2).expr = assign("L", var("x") / var("y") / var("z"))
+        restored.reflow()
+        ws.reflow()
+        assert restored.regions[-1].top > ws.regions[-1].top
+
+    def test_elements_interned(self):
+        ws = Worksheet()
+        for i in range(3):
+            ws.add(MathRegion.assignment("x", 1))
+        restored = Worksheet.load_binary(ws.dump_binary())
+        first, second = (r.expr.elements for r in restored.regions[:2])
+        assert all(a is b for a, b in zip(first, second))
+
+
+class TestFormat:
+    def test_smaller_than_pickle(self):
+        ws = Worksheet()
+        for i in range(200):
+            ws.add(MathRegion.assignment(f"x{i}", var("a") * i + 1))
+        assert len(ws.dump_binary()) * 3 < len(pickle.dumps(ws))
+
+    def test_bad_magic(self):
+        with pytest.raises(ValueError, match="not a smathpy snapshot"):
+            Worksheet.load_binary(b"PK\x03\x04" + bytes(20))
+
+    def test_unsupported_version(self):
+        data = bytearray(_build().dump_binary())
+        data[4] = 99
+        with pytest.raises(ValueError, match="version"):
+            Worksheet.load_binary(bytes(data))
+
+    def test_truncated(self):
+        data = _build().dump_binary()
+        with pytest.raises(ValueError, match="corrupt"):
+            Worksheet.load_binary(data[:-40])
+
+    def test_unknown_region_type(self):
+        class Custom(MathRegion):
+            pass
+
+        ws = Worksheet()
+        ws.add(Custom())
+        with pytest.raises(TypeError):
+            ws.dump_binary()